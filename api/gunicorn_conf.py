@@ -0,0 +1,52 @@
+"""Pre-fork multi-worker serving for the API.
+
+The master process loads the FAISS index and the query encoder once (PRELOAD_APP=true) and forks
+uvicorn workers that share them copy-on-write; indexes are also memory-mapped (FAISS_MMAP), so pages
+stay shared through the page cache even after a worker hot-swaps to a new index version. That holds
+only while the manifest lists no deltas: a version with deltas is read onto each worker's own heap, so
+run `python -m rag_system.index_updater --compact` to share the index again. Each worker then creates
+its own MongoDB and OpenAI clients.
+
+Conversation state is kept server-side per session_id, so more than one worker needs the Redis
+session store (SESSION_STORE_URL); without it the server runs a single worker and refuses to start
+with more.
+
+Usage (from the api directory):
+    SESSION_STORE_URL=redis://localhost:6379/0 WEB_CONCURRENCY=4 gunicorn -c gunicorn_conf.py main:app
+
+Each worker logs its memory once its components are loaded, /metrics reports it as
+rag_process_memory_bytes, and `python -m rag_system.process_memory <master pid>` prints the
+private memory each additional worker costs.
+"""
+import os
+import logging
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Sessions must be shared once there is more than one worker, or a turn routed to another worker loses the conversation
+shared_sessions = bool(os.getenv("SESSION_STORE_URL"))
+workers = int(os.getenv("WEB_CONCURRENCY", "2" if shared_sessions else "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+# Workers load nothing heavy when the master preloaded, so they should boot in seconds
+timeout = int(os.getenv("WORKER_TIMEOUT", "120" if preload_app else "600"))
+graceful_timeout = 30
+keepalive = 5
+
+def on_starting(server):
+    """Refuse to fork several workers that would each keep their own in-memory sessions"""
+    if workers > 1 and not shared_sessions:
+        server.log.error(
+            "WEB_CONCURRENCY=%s needs a shared session store: set SESSION_STORE_URL (Redis) or run one worker", workers
+        )
+        raise SystemExit(1)
+
+def when_ready(server):
+    """Runs in the master after the app is imported and before any worker is forked"""
+    if not preload_app:
+        return
+    import main
+    try:
+        main.preload_shared_components()
+    except Exception as e:
+        # Workers fall back to loading everything themselves
+        logging.getLogger("gunicorn.error").exception("Preloading shared components failed: %s", e)
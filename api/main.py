@@ -1,8 +1,19 @@
 import os
+import gc
 import sys
-from typing import List, Dict, Any
-from fastapi import FastAPI, Depends, HTTPException
+import json
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import List, Dict, Any, Optional
+import numpy as np
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -10,17 +21,62 @@ from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import RAG system components
-from rag_system.vector_store import FAISSVectorStore
-from rag_system.openai_client import OpenAIClient
-from rag_system.retriever import Retriever
+from rag_system.vector_store import FAISSVectorStore, read_manifest
+from rag_system.openai_client import AsyncOpenAIClient, OpenAIUnavailableError
+from rag_system.retriever import Retriever, load_embedding_model, get_mongo_collection
+from rag_system.reranker import load_reranker_model
 from rag_system.response_generator import ResponseGenerator
+from rag_system.metrics import REGISTRY, start_request_timings, record_timing, record_detail, current_details
+from rag_system.session_store import create_session_store, new_session, record_turn
+from rag_system.process_memory import memory_usage, format_megabytes
+from rag_system.prefetch import Prefetcher, PrefetchScheduler
 
 # Load environment variables
 load_dotenv()
-print(f"Current working directory: {os.getcwd()}")
-print(f"Environment variables loaded: VECTOR_DB_PATH={os.getenv('VECTOR_DB_PATH')}")
 
-app = FastAPI(title="Recidivism Research RAG API")
+# Leveled logging; per-request details are only emitted (and formatted) at LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+logger.debug("Current working directory: %s", os.getcwd())
+logger.debug("Environment variables loaded: VECTOR_DB_PATH=%s", os.getenv('VECTOR_DB_PATH'))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start loading RAG components at startup so the first user does not pay for it (STARTUP_MODE=eager)"""
+    if os.getenv("STARTUP_MODE", "eager").lower() == "eager":
+        # Loading runs in the background so /health answers while the components warm up
+        app.state.startup_task = asyncio.create_task(run_in_threadpool(load_rag_system_safely))
+        app.state.prefetch_task = asyncio.create_task(prefetch_after_startup(app.state.startup_task))
+    
+    reload_seconds = float(os.getenv("INDEX_RELOAD_SECONDS", "30"))
+    if reload_seconds > 0:
+        app.state.index_watcher = asyncio.create_task(watch_index_versions(reload_seconds))
+    yield
+    if reload_seconds > 0:
+        app.state.index_watcher.cancel()
+
+app = FastAPI(title="Recidivism Research RAG API", lifespan=lifespan)
+
+# Speculative prefetch runs only while no chat request is in flight in this worker
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+prefetch_scheduler = PrefetchScheduler(
+    max_pending=int(os.getenv("PREFETCH_MAX_PENDING", "32")),
+    idle_ms=float(os.getenv("PREFETCH_IDLE_MS", "20"))
+)
+
+class LiveRequestMiddleware:
+    """Counts chat requests in flight, until their last (possibly streamed) byte is sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/chat"):
+            return await self.app(scope, receive, send)
+        with prefetch_scheduler.live():
+            await self.app(scope, receive, send)
+
+app.add_middleware(LiveRequestMiddleware)
 
 # Configure CORS to allow requests from your Streamlit app
 app.add_middleware(
@@ -31,107 +87,498 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class SearchFilters(BaseModel):
+    """Restrict retrieval to papers matching every given field (see rag_system.doc_metadata)"""
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    study_types: List[str] = []  # e.g. "meta_analysis", "rct", "quasi_experimental"
+    jurisdictions: List[str] = []  # e.g. "united_states", "united_kingdom"
+
+def filter_dict(filters: Optional[SearchFilters]) -> Optional[Dict[str, Any]]:
+    if filters is None:
+        return None
+    return {key: value for key, value in filters.model_dump().items() if value not in (None, [])} or None
+
+def check_filters(rag_system, filters: Optional[Dict[str, Any]]):
+    """Reject filters on metadata no document has, which would otherwise silently match nothing"""
+    if not filters:
+        return
+    missing = rag_system["vector_store"].attributes.missing_fields(filters)
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Filtering by {', '.join(missing)} is unavailable: no indexed document has this metadata "
+                   "(annotate the index with `python -m rag_system.doc_metadata`)"
+        )
+
 class ChatRequest(BaseModel):
     query: str
     session_id: str = None
-    conversation_history: List[Dict[str, str]] = []
+    conversation_history: List[Dict[str, str]] = []  # Optional; the server keeps history per session_id
+    include_timings: bool = False
+    filters: Optional[SearchFilters] = None
+
+class BatchChatRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    filters: Optional[SearchFilters] = None
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]] = []
+    cache_hit: bool = False
+    prompt_tokens: int = 0  # Tokens sent to OpenAI for this answer (0 when served from cache)
+    timings: Optional[Dict[str, float]] = None  # Per-stage milliseconds, when include_timings is set
+    retrieval: Optional[Dict[str, Any]] = None  # Adaptive depth chosen for this query, or whether it was prefetched
     
 # Singleton pattern for RAG components to avoid reinitializing for each request
 rag_components = {}
+rag_components_lock = threading.Lock()
+rag_init_error = None
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+
+# Read-only components loaded once in the pre-fork master (api/gunicorn_conf.py) and inherited by workers
+shared_components = {}
+
+def preload_shared_components():
+    """Load the FAISS index and the encoder models before workers are forked, to be shared copy-on-write.
+
+    Only read-only, fork-safe objects are loaded here; MongoDB and OpenAI clients and the encoder's
+    batching thread are created in each worker. Nothing may be encoded in the master, since torch's
+    thread pool does not survive a fork; the ONNX encoder (ENCODER_BACKEND=onnx) only reads its config
+    here and creates its ONNX Runtime session in each worker on first use.
+    """
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="rag-preload") as pool:
+        vector_store_future = pool.submit(FAISSVectorStore)
+        embedding_model_future = pool.submit(load_embedding_model)
+        reranker_model_future = pool.submit(load_reranker_model) if RERANK_ENABLED else None
+        shared_components["vector_store"] = vector_store_future.result()
+        shared_components["embedding_model"] = embedding_model_future.result()
+        if reranker_model_future:
+            shared_components["reranker_model"] = reranker_model_future.result()
+    
+    # Keep the garbage collector from touching (and so un-sharing) pages that hold the preloaded objects
+    gc.freeze()
+    logger.info("Preloaded shared components in pid %s: %s", os.getpid(), format_megabytes(memory_usage()))
+
+def shared_or_load(name: str, loader):
+    return shared_components[name] if name in shared_components else loader()
+
+def connect_mongo_collection():
+    """Connect to MongoDB and verify the connection with a ping"""
+    collection = get_mongo_collection()
+    collection.database.client.admin.command("ping")
+    return collection
 
 def get_rag_system():
     """Initialize and return RAG system components (singleton pattern)"""
-    global rag_components
+    global rag_components, rag_init_error
     
-    if not rag_components:
+    if rag_components:
+        return rag_components
+    
+    with rag_components_lock:
+        if rag_components:
+            return rag_components
+        
         try:
-            print("Initializing RAG system components...")
-            # Initialize components
-            vector_store = FAISSVectorStore()
-            print(f"FAISS index loaded with {vector_store.index.ntotal} vectors")
-            
-            openai_client = OpenAIClient()
-            print("OpenAI client initialized")
-            
-            retriever = Retriever(vector_store)
-            print("Retriever initialized")
+            logger.info("Initializing RAG system components...")
+            # Load the independent components in parallel threads
+            with ThreadPoolExecutor(max_workers=5, thread_name_prefix="rag-init") as pool:
+                vector_store_future = pool.submit(shared_or_load, "vector_store", FAISSVectorStore)
+                embedding_model_future = pool.submit(shared_or_load, "embedding_model", load_embedding_model)
+                reranker_model_future = pool.submit(shared_or_load, "reranker_model", load_reranker_model) if RERANK_ENABLED else None
+                collection_future = pool.submit(connect_mongo_collection)
+                openai_client_future = pool.submit(AsyncOpenAIClient)
+                
+                vector_store = vector_store_future.result()
+                logger.debug("FAISS index loaded with %s vectors", vector_store.index.ntotal)
+                
+                openai_client = openai_client_future.result()
+                logger.debug("OpenAI client initialized")
+                
+                retriever = Retriever(
+                    vector_store,
+                    embedding_model=embedding_model_future.result(),
+                    collection=collection_future.result(),
+                    reranker_model=reranker_model_future.result() if reranker_model_future else None
+                )
+                logger.debug("Retriever initialized")
             
             response_generator = ResponseGenerator(openai_client)
-            print("Response generator initialized")
+            logger.debug("Response generator initialized")
+            
+            prefetcher = None
+            if PREFETCH_ENABLED:
+                prefetcher = Prefetcher(
+                    retriever, response_generator, prefetch_scheduler,
+                    max_entries=int(os.getenv("PREFETCH_CACHE_SIZE", "256")),
+                    ttl_seconds=float(os.getenv("PREFETCH_TTL_SECONDS", "600")),
+                    prefetch_answers=os.getenv("PREFETCH_ANSWERS", "false").lower() == "true"
+                )
             
             rag_components = {
                 "vector_store": vector_store,
                 "openai_client": openai_client,
                 "retriever": retriever,
-                "response_generator": response_generator
+                "response_generator": response_generator,
+                "prefetcher": prefetcher
             }
-            print("RAG system components initialized successfully")
+            rag_init_error = None
+            logger.info("RAG system components initialized successfully in pid %s: %s", os.getpid(), format_megabytes(memory_usage()))
             
         except Exception as e:
-            import traceback
-            print(f"Error initializing RAG system: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Error initializing RAG system: %s", e)
+            rag_init_error = str(e)
             raise HTTPException(status_code=500, detail=f"Failed to initialize RAG system: {str(e)}")
     
     return rag_components
 
+def reload_vector_store_if_updated() -> bool:
+    """Load a new index version published by rag_system.index_updater and swap it in.
+
+    The new store is built alongside the old one and swapped with a single attribute assignment,
+    so in-flight requests finish on the version they started with.
+    """
+    if not rag_components:
+        return False
+    
+    vector_store = rag_components["vector_store"]
+    version = read_manifest(vector_store.data_dir)["version"]
+    if version == vector_store.version:
+        return False
+    
+    logger.info("Index version %s published, reloading (serving version %s)", version, vector_store.version)
+    new_store = FAISSVectorStore()
+    rag_components["retriever"].vector_store = new_store
+    rag_components["vector_store"] = new_store
+    logger.info("Now serving index version %s with %s vectors", new_store.version, new_store.index.ntotal)
+    return True
+
+async def watch_index_versions(interval_seconds: float):
+    """Poll the index manifest and hot-swap the vector store when a new version appears"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await run_in_threadpool(reload_vector_store_if_updated)
+        except Exception as e:
+            logger.exception("Error reloading the vector store: %s", e)
+
+def load_rag_system_safely():
+    """Eager startup load; failures are reported by /health/ready and retried on the next request"""
+    try:
+        get_rag_system()
+    except HTTPException:
+        pass
+
+async def prefetch_after_startup(startup_task):
+    """Prefetch the sample questions as soon as the components are loaded, before anyone asks them"""
+    await startup_task
+    if rag_components.get("prefetcher"):
+        rag_components["prefetcher"].schedule_sample_questions()
+
+# Conversation state for clients that send only a session_id
+session_store = create_session_store()
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+# Share of the previous turn's query blended into retrieval; opt-in, since it also pulls unrelated
+# topic switches toward the old topic
+SESSION_QUERY_CARRYOVER = float(os.getenv("SESSION_QUERY_CARRYOVER", "0"))
+
+async def load_session(request: ChatRequest):
+    """Return (session state or None, conversation history); history sent by the client takes precedence"""
+    state = await run_in_threadpool(session_store.get, request.session_id) if request.session_id else None
+    history = request.conversation_history or (state or {}).get("history", [])
+    return state, history
+
+async def save_session(request: ChatRequest, answer: str, query_embedding):
+    """Record the turn and return the session state the next turn will see (None without a session_id).
+
+    The turn is appended to the stored state as it is now, not as load_session saw it, so concurrent
+    turns on one session both land in its history (in the order they finish).
+    """
+    if not request.session_id:
+        return None
+    return await run_in_threadpool(
+        session_store.update, request.session_id,
+        lambda state: record_turn(
+            state or new_session(), request.query, answer,
+            query_embedding=query_embedding, max_messages=SESSION_MAX_MESSAGES
+        )
+    )
+
+def retrieval_embedding(query_embedding: np.ndarray, state) -> np.ndarray:
+    """Blend in the previous turn's query so short follow-ups ("what about juveniles?") stay on topic"""
+    if not state or state.get("query_embedding") is None or SESSION_QUERY_CARRYOVER <= 0:
+        return query_embedding
+    previous = np.asarray(state["query_embedding"], dtype=np.float32).reshape(1, -1)
+    blended = (1 - SESSION_QUERY_CARRYOVER) * query_embedding + SESSION_QUERY_CARRYOVER * previous
+    return blended / np.linalg.norm(blended)
+
+async def retrieve_context(rag_system, request: ChatRequest, retrieval_vector: np.ndarray) -> List[Dict[str, Any]]:
+    """Prefetched context for the question if there is any, otherwise a live retrieval"""
+    filters = filter_dict(request.filters)
+    prefetcher = rag_system.get("prefetcher")
+    context_items = prefetcher.lookup(request.query, retrieval_vector, filters) if prefetcher else None
+    if context_items is None:
+        context_items = await rag_system["retriever"].aretrieve_context(
+            request.query, query_embedding=retrieval_vector, filters=filters
+        )
+    else:
+        record_detail("prefetched", True)
+    return context_items
+
+def schedule_prefetch(rag_system):
+    """Queue the sample questions again if a new index version made their prefetched context stale"""
+    prefetcher = rag_system.get("prefetcher")
+    if prefetcher is not None:
+        prefetcher.schedule_sample_questions()
+
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in my knowledge base to answer your question. This could be due to a data retrieval issue or the information may not be present in my research papers."
+
+def format_sources(context_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Format retrieved context items as source citations"""
+    return [
+        {
+            "document_id": str(item.get("document_id")),
+            "filename": item.get("filename", "Unknown document"),
+            "relevance_score": float(item.get("score", 0.0))
+        }
+        for item in context_items
+    ]
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
+    timings = start_request_timings()
+    start = time.perf_counter()
     try:
-        print(f"Received chat request: {request.query}")
+        logger.debug("Received chat request: %s", request.query)
         # Get RAG components
-        rag_system = get_rag_system()
+        rag_system = await run_in_threadpool(get_rag_system)
         retriever = rag_system["retriever"]
         response_generator = rag_system["response_generator"]
+        check_filters(rag_system, filter_dict(request.filters))
+        
+        session, conversation_history = await load_session(request)
         
         # Retrieve relevant context
-        print(f"Retrieving context for query: {request.query}")
-        context_items = retriever.retrieve_context(request.query)
-        print(f"Retrieved {len(context_items)} context items")
+        query_embedding = await retriever.aencode_query(request.query)
+        context_items = await retrieve_context(rag_system, request, retrieval_embedding(query_embedding, session))
+        logger.debug("Retrieved %s context items", len(context_items))
         
         # If no context items, return a specific message
         if not context_items or len(context_items) == 0:
-            print("No context items found - returning default message")
-            return ChatResponse(
-                answer="I couldn't find any relevant information in my knowledge base to answer your question. This could be due to a data retrieval issue or the information may not be present in my research papers.",
-                sources=[]
+            logger.debug("No context items found - returning default message")
+            response = {"answer": NO_CONTEXT_ANSWER, "cache_hit": False, "prompt_tokens": 0}
+        else:
+            # Generate a response using the retrieved context
+            response = await response_generator.agenerate_response(
+                query=request.query,
+                context_items=context_items,
+                conversation_history=conversation_history,
+                query_embedding=query_embedding
             )
+            REGISTRY.increment("rag_answer_cache_total", 'result="hit"' if response["cache_hit"] else 'result="miss"')
         
-        # Generate a response using the retrieved context
-        print("Generating response...")
-        response = response_generator.generate_response(
-            query=request.query,
-            context_items=context_items,
-            conversation_history=request.conversation_history
-        )
+        session = await save_session(request, response["answer"], query_embedding)
+        schedule_prefetch(rag_system)
         
         # Format sources for citation
-        sources = [
-            {
-                "document_id": str(item.get("document_id")),
-                "filename": item.get("filename", "Unknown document"),
-                "relevance_score": float(item.get("score", 0.0))
+        sources = format_sources(context_items)
+        
+        record_timing("total", time.perf_counter() - start)
+        REGISTRY.increment("rag_requests_total", 'endpoint="/chat",status="ok"')
+        logger.debug("Response generated with %s sources in %s", len(sources), timings)
+        return ChatResponse(
+            answer=response["answer"],
+            sources=sources,
+            cache_hit=response["cache_hit"],
+            prompt_tokens=response["prompt_tokens"],
+            timings=timings if request.include_timings else None,
+            retrieval=current_details()
+        )
+    
+    except HTTPException:
+        raise
+    except OpenAIUnavailableError as e:
+        REGISTRY.increment("rag_requests_total", 'endpoint="/chat",status="unavailable"')
+        logger.error("OpenAI unavailable for chat request: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    except Exception as e:
+        REGISTRY.increment("rag_requests_total", 'endpoint="/chat",status="error"')
+        logger.exception("Error processing chat request: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Stream the answer as server-sent events: `sources` first, then `token` events, then `done`"""
+    rag_system = await run_in_threadpool(get_rag_system)
+    retriever = rag_system["retriever"]
+    response_generator = rag_system["response_generator"]
+    check_filters(rag_system, filter_dict(request.filters))
+    
+    async def event_stream():
+        timings = start_request_timings()
+        start = time.perf_counter()
+        cached = None
+        usage = {"prompt_tokens": 0}
+        try:
+            logger.debug("Received streaming chat request: %s", request.query)
+            session, conversation_history = await load_session(request)
+            query_embedding = await retriever.aencode_query(request.query)
+            context_items = await retrieve_context(rag_system, request, retrieval_embedding(query_embedding, session))
+            
+            if not context_items:
+                answer = NO_CONTEXT_ANSWER
+                yield format_sse("sources", {"sources": []})
+                yield format_sse("token", {"text": answer})
+            else:
+                yield format_sse("sources", {"sources": format_sources(context_items)})
+                
+                cached = response_generator.get_cached_answer(query_embedding, context_items, conversation_history)
+                REGISTRY.increment("rag_answer_cache_total", 'result="hit"' if cached is not None else 'result="miss"')
+                if cached is not None:
+                    answer = cached
+                    yield format_sse("token", {"text": cached})
+                else:
+                    tokens = []
+                    async for token in response_generator.astream_response(
+                        query=request.query,
+                        context_items=context_items,
+                        conversation_history=conversation_history,
+                        query_embedding=query_embedding,
+                        usage=usage
+                    ):
+                        tokens.append(token)
+                        yield format_sse("token", {"text": token})
+                    answer = "".join(tokens)
+            
+            session = await save_session(request, answer, query_embedding)
+            schedule_prefetch(rag_system)
+            
+            record_timing("total", time.perf_counter() - start)
+            REGISTRY.increment("rag_requests_total", 'endpoint="/chat/stream",status="ok"')
+            done = {
+                "cache_hit": cached is not None,
+                "prompt_tokens": usage["prompt_tokens"],
+                "retrieval": current_details()
             }
-            for item in context_items
-        ]
+            if request.include_timings:
+                done["timings"] = timings
+            yield format_sse("done", done)
         
-        print(f"Response generated successfully with {len(sources)} sources")
-        return ChatResponse(answer=response, sources=sources)
+        except OpenAIUnavailableError as e:
+            REGISTRY.increment("rag_requests_total", 'endpoint="/chat/stream",status="unavailable"')
+            logger.error("OpenAI unavailable for streaming chat request: %s", e)
+            yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            REGISTRY.increment("rag_requests_total", 'endpoint="/chat/stream",status="error"')
+            logger.exception("Error processing streaming chat request: %s", e)
+            yield format_sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Bulk question answering
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+BATCH_OPENAI_CONCURRENCY = int(os.getenv("BATCH_OPENAI_CONCURRENCY", "8"))
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """Answer a list of independent questions, streaming one NDJSON line per answer as each one finishes.
+
+    Queries are encoded at batch priority behind live requests, then retrieved with one multi-row FAISS
+    search and one MongoDB query; completions then run with bounded concurrency (the OpenAI client
+    retries rate limits itself).
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    
+    rag_system = await run_in_threadpool(get_rag_system)
+    retriever = rag_system["retriever"]
+    response_generator = rag_system["response_generator"]
+    check_filters(rag_system, filter_dict(request.filters))
     
+    try:
+        query_embeddings = await retriever.aencode_queries(request.queries)
+        context_lists = await retriever.aretrieve_context_batch(
+            request.queries, top_k=request.top_k, query_embeddings=query_embeddings,
+            filters=filter_dict(request.filters)
+        )
     except Exception as e:
-        import traceback
-        print(f"Error processing chat request: {str(e)}")
-        traceback.print_exc()
+        REGISTRY.increment("rag_requests_total", 'endpoint="/chat/batch",status="error"')
+        logger.exception("Error retrieving context for batch: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    semaphore = asyncio.Semaphore(BATCH_OPENAI_CONCURRENCY)
+    
+    async def answer(i: int) -> Dict[str, Any]:
+        query, context_items = request.queries[i], context_lists[i]
+        result = {"index": i, "query": query, "sources": format_sources(context_items)}
+        try:
+            if not context_items:
+                return {**result, "answer": NO_CONTEXT_ANSWER, "cache_hit": False, "prompt_tokens": 0}
+            async with semaphore:
+                response = await response_generator.agenerate_response(
+                    query=query,
+                    context_items=context_items,
+                    query_embedding=query_embeddings[i:i+1]
+                )
+            REGISTRY.increment("rag_answer_cache_total", 'result="hit"' if response["cache_hit"] else 'result="miss"')
+            return {**result, **response}
+        except Exception as e:
+            logger.exception("Error answering batch query %s: %s", i, e)
+            return {**result, "error": str(e)}
+    
+    async def results():
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(request.queries))]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
+            REGISTRY.increment("rag_requests_total", 'endpoint="/chat/batch",status="ok"')
+        finally:
+            # Stop outstanding completions if the client goes away
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a session's server-side history and retrieval state"""
+    await run_in_threadpool(session_store.delete, session_id)
+    return {"status": "deleted"}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus-style per-stage latency histograms, request counters and this worker's memory"""
+    for kind, value in memory_usage().items():
+        REGISTRY.set_gauge("rag_process_memory_bytes", f'pid="{os.getpid()}",kind="{kind}"', value)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint to verify the API is running"""
-    return {"status": "healthy"}
+    """Liveness check: the API process is up, whether or not the RAG components are loaded"""
+    index_version = rag_components["vector_store"].version if rag_components else None
+    return {"status": "healthy", "ready": bool(rag_components), "index_version": index_version}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness check: 200 once the RAG components are loaded, 503 while loading or after a failed load"""
+    if rag_components:
+        return {"status": "ready"}
+    
+    status = "error" if rag_init_error else "loading"
+    return JSONResponse(status_code=503, content={"status": status, "detail": rag_init_error})
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,189 @@
+"""Local stand-ins for MongoDB, OpenAI and the query encoder used by the benchmark harness"""
+import os
+import time
+import random
+import pickle
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import List, Dict, Any
+import faiss
+import numpy as np
+from bson import ObjectId
+
+VOCABULARY = (
+    "recidivism reoffending parole probation incarceration rehabilitation employment education "
+    "juvenile cognitive behavioral therapy program evaluation cohort risk assessment community "
+    "supervision reentry offender sentence prison jail treatment substance housing mental health "
+    "intervention outcome randomized study sample analysis effect reduction rate statistically "
+    "significant follow-up years arrest conviction policy evidence based approach services"
+).split()
+
+class InMemoryCollection:
+    """Subset of the pymongo Collection API used by Retriever, DocumentCache and the ingest tools"""
+
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        admin = SimpleNamespace(command=lambda *args, **kwargs: {"ok": 1})
+        self.database = SimpleNamespace(client=SimpleNamespace(admin=admin))
+
+    @staticmethod
+    def _project(doc: Dict[str, Any], projection: Dict[str, Any] = None) -> Dict[str, Any]:
+        if not projection:
+            return dict(doc)
+        projected = {"_id": doc["_id"]}
+        for field, include in projection.items():
+            if include and field in doc:
+                projected[field] = doc[field]
+        return projected
+
+    def _match(self, query: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        if not query:
+            return list(self.docs.values())
+        condition = query.get("_id")
+        if isinstance(condition, dict) and "$in" in condition:
+            return [self.docs[doc_id] for doc_id in condition["$in"] if doc_id in self.docs]
+        if condition is not None:
+            return [self.docs[condition]] if condition in self.docs else []
+        raise NotImplementedError(f"Unsupported query: {query}")
+
+    def find(self, query: Dict[str, Any] = None, projection: Dict[str, Any] = None):
+        return [self._project(doc, projection) for doc in self._match(query)]
+
+    def find_one(self, query: Dict[str, Any] = None, projection: Dict[str, Any] = None):
+        docs = self.find(query, projection)
+        return docs[0] if docs else None
+
+    def count_documents(self, query: Dict[str, Any] = None) -> int:
+        return len(self._match(query))
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]):
+        docs = list(self.docs.values())
+        for stage in pipeline:
+            if "$sample" in stage:
+                docs = random.sample(docs, min(stage["$sample"]["size"], len(docs)))
+            elif "$project" in stage:
+                docs = [self._project(doc, stage["$project"]) for doc in docs]
+            else:
+                raise NotImplementedError(f"Unsupported pipeline stage: {stage}")
+        return docs
+
+class _AsyncCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        return self.docs if length is None else self.docs[:length]
+
+class AsyncInMemoryCollection:
+    """Async counterpart of InMemoryCollection mirroring pymongo's AsyncCollection"""
+
+    def __init__(self, collection: InMemoryCollection):
+        self.collection = collection
+
+    def find(self, query: Dict[str, Any] = None, projection: Dict[str, Any] = None):
+        return _AsyncCursor(self.collection.find(query, projection))
+
+    async def aggregate(self, pipeline: List[Dict[str, Any]]):
+        return _AsyncCursor(self.collection.aggregate(pipeline))
+
+class StubOpenAIClient:
+    """AsyncOpenAIClient stand-in that answers after a fixed simulated latency"""
+
+    def __init__(self, latency_ms: float = 800.0, answer_tokens: int = 200, first_token_ms: float = 300.0):
+        self.latency = latency_ms / 1000.0
+        self.first_token = min(first_token_ms / 1000.0, self.latency)
+        self.answer_tokens = answer_tokens
+
+    def _answer(self, prompt: str) -> List[str]:
+        return [f"token{i} " for i in range(self.answer_tokens)]
+
+    def generate_completion(self, prompt: str, **kwargs) -> str:
+        time.sleep(self.latency)
+        return "".join(self._answer(prompt))
+
+    async def agenerate_completion(self, prompt: str, **kwargs) -> str:
+        await asyncio.sleep(self.latency)
+        return "".join(self._answer(prompt))
+
+    async def astream_completion(self, prompt: str, **kwargs):
+        tokens = self._answer(prompt)
+        await asyncio.sleep(self.first_token)
+        per_token = (self.latency - self.first_token) / max(1, len(tokens))
+        for token in tokens:
+            yield token
+            await asyncio.sleep(per_token)
+
+class HashingEncoder:
+    """SentenceTransformer stand-in producing deterministic pseudo-random unit vectors"""
+
+    def __init__(self, dim: int = 768):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        vectors = np.stack([
+            np.random.default_rng(int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)).standard_normal(self.dim)
+            for text in texts
+        ]).astype(np.float32)
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+def synthetic_text(rng: np.random.Generator, n_words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY, size=n_words))
+
+def documents_from_doc_info(doc_info_path: str, words_per_doc: int = 6000, seed: int = 0) -> List[Dict[str, Any]]:
+    """Seed documents with the shipped IDs and filenames from doc_info.pkl and synthetic content"""
+    rng = np.random.default_rng(seed)
+    with open(doc_info_path, "rb") as f:
+        doc_info = pickle.load(f)
+    return [
+        {"_id": info["id"], "filename": info["filename"], "content": synthetic_text(rng, words_per_doc)}
+        for info in doc_info
+    ]
+
+def build_synthetic_corpus(data_dir: str, n_passages: int, passages_per_doc: int = 20,
+                           passage_chars: int = 1500, dim: int = 768, seed: int = 0) -> List[Dict[str, Any]]:
+    """Write a passage-level corpus with random unit vectors to data_dir and return its documents"""
+    from rag_system.vector_store import save_doc_ids_npy, PASSAGE_INDEX_FILENAME, PASSAGES_FILENAME
+
+    rng = np.random.default_rng(seed)
+    n_docs = max(1, -(-n_passages // passages_per_doc))
+    words_per_passage = max(1, passage_chars // 9)
+
+    docs, passages = [], []
+    for doc_idx in range(n_docs):
+        count = min(passages_per_doc, n_passages - doc_idx * passages_per_doc)
+        parts, offset = [], 0
+        for _ in range(count):
+            text = synthetic_text(rng, words_per_passage)
+            passages.append((doc_idx, offset, offset + len(text)))
+            parts.append(text)
+            offset += len(text) + 1
+        docs.append({"_id": ObjectId(), "filename": f"synthetic_paper_{doc_idx}.pdf", "content": " ".join(parts)})
+
+    passage_vectors = rng.standard_normal((len(passages), dim), dtype=np.float32)
+    passage_vectors /= np.linalg.norm(passage_vectors, axis=1, keepdims=True)
+    passages = np.asarray(passages, dtype=np.int64)
+
+    # Document vectors are the normalized mean of their passages
+    doc_vectors = np.zeros((n_docs, dim), dtype=np.float32)
+    np.add.at(doc_vectors, passages[:, 0], passage_vectors)
+    doc_vectors /= np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+
+    os.makedirs(data_dir, exist_ok=True)
+    doc_index = faiss.IndexFlatIP(dim)
+    doc_index.add(doc_vectors)
+    faiss.write_index(doc_index, os.path.join(data_dir, "vector_store.index"))
+    save_doc_ids_npy([doc["_id"] for doc in docs], os.path.join(data_dir, "doc_ids.npy"))
+
+    passage_index = faiss.IndexFlatIP(dim)
+    passage_index.add(passage_vectors)
+    faiss.write_index(passage_index, os.path.join(data_dir, PASSAGE_INDEX_FILENAME))
+    with open(os.path.join(data_dir, PASSAGES_FILENAME), "wb") as f:
+        np.save(f, passages)
+
+    return docs
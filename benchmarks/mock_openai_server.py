@@ -0,0 +1,93 @@
+"""Local stand-in for the OpenAI chat completions endpoint, for offline runs of the real OpenAI client.
+
+Serves POST /v1/chat/completions (plain and streamed) with a fixed simulated latency and can inject
+429 rate-limit responses, so pooling, retries, rate limiting and coalescing can be exercised without
+network access or an API key.
+
+Examples:
+    python benchmarks/mock_openai_server.py --port 8100 --latency-ms 500 --rate-limit-every 5
+
+    # then point the API (or any OpenAIClient) at it
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=mock uvicorn main:app --app-dir api
+"""
+import json
+import time
+import asyncio
+import argparse
+import itertools
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def create_app(latency_ms: float = 800.0, answer_tokens: int = 200, rate_limit_every: int = 0,
+               retry_after_seconds: float = 1.0) -> FastAPI:
+    """Mock server app; every `rate_limit_every`-th request gets a 429 (0 disables)"""
+    app = FastAPI(title="Mock OpenAI API")
+    counter = itertools.count(1)
+    stats = {"requests": 0, "rate_limited": 0}
+
+    def completion_id() -> str:
+        return f"chatcmpl-mock{stats['requests']}"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        n = next(counter)
+        stats["requests"] += 1
+        if rate_limit_every and n % rate_limit_every == 0:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(retry_after_seconds)},
+                content={"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}}
+            )
+
+        tokens = [f"token{i} " for i in range(min(answer_tokens, body.get("max_tokens") or answer_tokens))]
+        model = body.get("model", "gpt-4o")
+        created = int(time.time())
+        prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000.0)
+            return {
+                "id": completion_id(),
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+            }
+
+        async def events():
+            chunk = {"id": completion_id(), "object": "chat.completion.chunk", "created": created, "model": model}
+            per_token = latency_ms / 1000.0 / max(1, len(tokens))
+            for i, token in enumerate(tokens):
+                delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+                await asyncio.sleep(per_token)
+            yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Simulated completion latency")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="Tokens per answer")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with a 429 (0 disables)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.latency_ms, args.answer_tokens, args.rate_limit_every, args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
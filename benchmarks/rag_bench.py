@@ -0,0 +1,221 @@
+"""Offline benchmark for the Retriever -> ResponseGenerator pipeline and the /chat endpoint.
+
+MongoDB and OpenAI are replaced by in-process stand-ins (benchmarks/fakes.py), so the numbers reflect
+our own code: encoding, FAISS search, hydration, snippet/prompt building and request handling.
+
+Examples:
+    # Shipped 44-document index, real encoder, 1/8/32 concurrent users
+    python benchmarks/rag_bench.py --requests 200 --concurrency 1,8,32
+
+    # Synthetic 100k-passage corpus with the hashing encoder and the in-process ASGI load test
+    python benchmarks/rag_bench.py --passages 100000 --fake-encoder --api --json results.json
+
+    # Context items and prompt tokens with adaptive retrieval depth (compare against a run without it)
+    python benchmarks/rag_bench.py --fake-encoder --adaptive-depth
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+from typing import List, Dict, Any
+
+# Add parent directory to path to import rag_system and the API
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "api"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from fakes import (
+    InMemoryCollection, AsyncInMemoryCollection, StubOpenAIClient, HashingEncoder,
+    documents_from_doc_info, build_synthetic_corpus
+)
+
+SAMPLE_QUESTIONS = [
+    "What factors contribute to recidivism rates?",
+    "How effective are rehabilitation programs in reducing reoffending?",
+    "What does research say about the impact of education on recidivism?",
+    "How do employment opportunities affect reoffending rates?",
+    "What are evidence-based approaches to reducing juvenile recidivism?",
+]
+
+def make_queries(n: int, repeat: bool) -> List[str]:
+    """Sample questions, made unique per request unless repeat is set (so caches only help when asked to)"""
+    return [
+        SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)] + ("" if repeat else f" (variant {i})")
+        for i in range(n)
+    ]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def summarize(name: str, latencies: List[float], wall_seconds: float, concurrency: int,
+              context_sizes: List[int] = None, prompt_tokens: List[int] = None) -> Dict[str, Any]:
+    latencies_ms = np.asarray(latencies) * 1000.0
+    result = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    if context_sizes:
+        result["mean_context_items"] = round(float(np.mean(context_sizes)), 2)
+    if prompt_tokens:
+        result["mean_prompt_tokens"] = round(float(np.mean(prompt_tokens)), 1)
+    return result
+
+def bench_sequential(retriever, response_generator, queries: List[str]) -> Dict[str, Any]:
+    """Synchronous retrieve_context + generate_response, one request at a time"""
+    latencies, context_sizes, prompt_tokens = [], [], []
+    wall_start = time.perf_counter()
+    for query in queries:
+        start = time.perf_counter()
+        context_items = retriever.retrieve_context(query)
+        response = response_generator.generate_response(query, context_items, query_embedding=retriever.encode_query(query))
+        latencies.append(time.perf_counter() - start)
+        context_sizes.append(len(context_items))
+        prompt_tokens.append(response["prompt_tokens"])
+    return summarize("pipeline_sync", latencies, time.perf_counter() - wall_start, 1, context_sizes, prompt_tokens)
+
+async def bench_concurrent(retriever, response_generator, queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """Async aretrieve_context + agenerate_response with `concurrency` simulated users"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, context_sizes, prompt_tokens = [], [], []
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            query_embedding = await retriever.aencode_query(query)
+            context_items = await retriever.aretrieve_context(query, query_embedding=query_embedding)
+            response = await response_generator.agenerate_response(query, context_items, query_embedding=query_embedding)
+            latencies.append(time.perf_counter() - start)
+            context_sizes.append(len(context_items))
+            prompt_tokens.append(response["prompt_tokens"])
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return summarize("pipeline_async", latencies, time.perf_counter() - wall_start, concurrency, context_sizes, prompt_tokens)
+
+async def bench_api(components: Dict[str, Any], queries: List[str], concurrency: int, endpoint: str = "/chat") -> Dict[str, Any]:
+    """Load-test the FastAPI app in process through httpx's ASGI transport"""
+    import httpx
+    import main as api_main
+
+    api_main.rag_components = components
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    transport = httpx.ASGITransport(app=api_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def one(query):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(endpoint, json={"query": query})
+                if response.status_code != 200:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one(query) for query in queries))
+
+    result = summarize(f"api{endpoint.replace('/', '_')}", latencies, time.perf_counter() - wall_start, concurrency)
+    result["errors"] = errors
+    return result
+
+def build_components(args, data_dir: str) -> Dict[str, Any]:
+    from rag_system.vector_store import FAISSVectorStore
+    from rag_system.retriever import Retriever, load_embedding_model
+    from rag_system.response_generator import ResponseGenerator
+
+    if args.passages > 0:
+        print(f"Building synthetic corpus with {args.passages} passages in {data_dir}")
+        docs = build_synthetic_corpus(data_dir, args.passages, passages_per_doc=args.passages_per_doc)
+    else:
+        docs = documents_from_doc_info(os.path.join(data_dir, "doc_info.pkl"))
+
+    os.environ["VECTOR_DB_PATH"] = os.path.join(data_dir, "vector_store.index")
+    collection = InMemoryCollection(docs)
+    vector_store = FAISSVectorStore()
+    embedding_model = HashingEncoder() if args.fake_encoder else load_embedding_model()
+    retriever = Retriever(
+        vector_store,
+        embedding_model=embedding_model,
+        collection=collection,
+        async_collection=AsyncInMemoryCollection(collection)
+    )
+    openai_client = StubOpenAIClient(latency_ms=args.openai_latency_ms)
+    response_generator = ResponseGenerator(openai_client)
+
+    return {
+        "vector_store": vector_store,
+        "openai_client": openai_client,
+        "retriever": retriever,
+        "response_generator": response_generator
+    }
+
+def print_table(results: List[Dict[str, Any]]):
+    columns = ["scenario", "concurrency", "requests", "p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_rss_mb",
+               "mean_context_items", "mean_prompt_tokens"]
+    widths = [max(len(col), *(len(str(r.get(col, ""))) for r in results)) for col in columns]
+    print("  ".join(col.ljust(width) for col, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result.get(col, "")).ljust(width) for col, width in zip(columns, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline with local stand-ins for MongoDB and OpenAI")
+    parser.add_argument("--passages", type=int, default=0, help="Synthetic passage count (0 = use the shipped data/ index)")
+    parser.add_argument("--passages-per-doc", type=int, default=20, help="Passages per synthetic document")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrent user counts")
+    parser.add_argument("--openai-latency-ms", type=float, default=800.0, help="Simulated OpenAI completion latency")
+    parser.add_argument("--fake-encoder", action="store_true", help="Use a hashing encoder instead of the mpnet model")
+    parser.add_argument("--repeat-queries", action="store_true", help="Reuse the sample questions so caches can hit")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache enabled")
+    parser.add_argument("--api", action="store_true", help="Also load-test /chat through the in-process ASGI app")
+    parser.add_argument("--adaptive-depth", action="store_true", help="Retrieve with RETRIEVAL_DEPTH=adaptive")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URI", "mongodb://benchmark.invalid")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["STARTUP_MODE"] = "lazy"
+    os.environ["DOC_CACHE_REVALIDATE_SECONDS"] = "0"
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    if args.adaptive_depth:
+        os.environ["RETRIEVAL_DEPTH"] = "adaptive"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = tmp_dir if args.passages > 0 else os.path.join(ROOT, "data")
+        components = build_components(args, data_dir)
+        print(f"Components loaded, peak RSS {peak_rss_mb():.1f} MB")
+
+        queries = make_queries(args.requests, args.repeat_queries)
+        results = [bench_sequential(components["retriever"], components["response_generator"], queries)]
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c]:
+            results.append(asyncio.run(bench_concurrent(
+                components["retriever"], components["response_generator"], queries, concurrency
+            )))
+            if args.api:
+                results.append(asyncio.run(bench_api(components, queries, concurrency)))
+
+    for result in results:
+        result["passages"] = args.passages or None
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
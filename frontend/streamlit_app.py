@@ -1,5 +1,6 @@
 import os
 import sys
+import json
 import uuid
 import requests
 import streamlit as st
@@ -14,6 +15,22 @@ load_dotenv()
 # Configure the API endpoint - default to localhost if not specified
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a server-sent events response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            # A blank line terminates the current event
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
 # Page configuration
 st.set_page_config(
     page_title="Recidivism Research Assistant",
@@ -81,46 +98,56 @@ if prompt := st.chat_input("Ask a question about recidivism research..."):
         message_placeholder = st.empty()
         message_placeholder.markdown("Researching your question...")
         
-        # Prepare conversation history for the API request
-        conversation_history = [
-            {"role": msg["role"], "content": msg["content"]} 
-            for msg in st.session_state.messages[:-1]  # Exclude the current user message
-        ]
-        
-        # Make API request
+        # Make a streaming API request and render tokens as they arrive
         try:
-            response = requests.post(
-                f"{API_URL}/chat",
+            with requests.post(
+                f"{API_URL}/chat/stream",
+                # The API keeps the conversation history for this session_id
                 json={
                     "query": prompt,
-                    "session_id": st.session_state.session_id,
-                    "conversation_history": conversation_history
+                    "session_id": st.session_state.session_id
                 },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                answer = result["answer"]
-                sources = result.get("sources", [])
-                
-                # Display answer
-                message_placeholder.markdown(answer)
-                
-                # Display sources if available
-                if sources:
-                    source_text = "<div class='source-citation'><strong>Sources:</strong><br>"
-                    for i, source in enumerate(sources):
-                        source_text += f"- {source.get('filename', 'Unknown document')}<br>"
-                    source_text += "</div>"
-                    st.markdown(source_text, unsafe_allow_html=True)
+                stream=True,
+                timeout=(10, 60)  # Connect timeout, then max wait between streamed chunks
+            ) as response:
                 
-                # Add assistant response to chat history
-                st.session_state.messages.append({"role": "assistant", "content": answer})
-            else:
-                error_msg = f"Error: {response.status_code} - {response.text}"
-                message_placeholder.error(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                if response.status_code == 200:
+                    answer = ""
+                    sources = []
+                    error_msg = None
+                    
+                    for event, data in iter_sse_events(response):
+                        if event == "sources":
+                            sources = data.get("sources", [])
+                        elif event == "token":
+                            answer += data.get("text", "")
+                            message_placeholder.markdown(answer + "▌")
+                        elif event == "error":
+                            error_msg = f"Error: {data.get('detail', 'Unknown error')}"
+                        elif event == "done":
+                            break
+                    
+                    if error_msg and not answer:
+                        message_placeholder.error(error_msg)
+                        st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                    else:
+                        # Display the final answer without the cursor
+                        message_placeholder.markdown(answer)
+                        
+                        # Display sources if available
+                        if sources:
+                            source_text = "<div class='source-citation'><strong>Sources:</strong><br>"
+                            for i, source in enumerate(sources):
+                                source_text += f"- {source.get('filename', 'Unknown document')}<br>"
+                            source_text += "</div>"
+                            st.markdown(source_text, unsafe_allow_html=True)
+                        
+                        # Add assistant response to chat history
+                        st.session_state.messages.append({"role": "assistant", "content": answer})
+                else:
+                    error_msg = f"Error: {response.status_code} - {response.text}"
+                    message_placeholder.error(error_msg)
+                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
                 
         except Exception as e:
             error_msg = f"Error connecting to the API: {str(e)}"
@@ -1,7 +1,14 @@
 # This file is intentionally left mostly empty to mark this directory as a Python package
 from .vector_store import FAISSVectorStore
-from .openai_client import OpenAIClient
+from .openai_client import OpenAIClient, AsyncOpenAIClient
 from .retriever import Retriever
 from .response_generator import ResponseGenerator
+from .document_cache import DocumentCache
+from .embedding_cache import EmbeddingCache, BatchingEncoder
+from .answer_cache import SemanticAnswerCache
+from .snippet_scorer import SnippetScorer
+from .reranker import CrossEncoderReranker
+from .passage_store import PassageStore
+from .prefetch import Prefetcher
 
-__all__ = ["FAISSVectorStore", "OpenAIClient", "Retriever", "ResponseGenerator"]
\ No newline at end of file
+__all__ = ["FAISSVectorStore", "OpenAIClient", "AsyncOpenAIClient", "Retriever", "ResponseGenerator", "DocumentCache", "EmbeddingCache", "BatchingEncoder", "SemanticAnswerCache", "SnippetScorer", "CrossEncoderReranker", "PassageStore", "Prefetcher"]
\ No newline at end of file
@@ -0,0 +1,96 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+class SemanticAnswerCache:
+    """Answer cache that hits on near-duplicate questions answered from the same retrieved documents.
+
+    Entries are grouped by the set of retrieved document IDs (and any prior user turns), and a lookup
+    hits when the cosine similarity between query embeddings reaches `similarity_threshold`.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._groups = {}  # group key -> {entry_id: (embedding, answer, expires_at)}
+        self._lru = OrderedDict()  # entry_id -> group key
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def group_key(context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None) -> Tuple:
+        """Key answers on the retrieved documents and the user turns that preceded the question"""
+        doc_ids = frozenset(str(item.get("document_id")) for item in context_items)
+        prior_questions = tuple(
+            " ".join(msg.get("content", "").lower().split())
+            for msg in (conversation_history or [])
+            if msg.get("role") == "user"
+        )
+        return doc_ids, prior_questions
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _remove(self, entry_id: int):
+        key = self._lru.pop(entry_id, None)
+        if key is None:
+            return
+        group = self._groups.get(key)
+        if group is not None:
+            group.pop(entry_id, None)
+            if not group:
+                del self._groups[key]
+
+    def get(self, query_embedding: np.ndarray, key: Tuple) -> Optional[str]:
+        """Return a cached answer for a similar query with the same key, or None"""
+        query_embedding = self._normalize(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            group = self._groups.get(key)
+            if group:
+                expired = [entry_id for entry_id, (_, _, expires_at) in group.items() if expires_at <= now]
+                for entry_id in expired:
+                    self._remove(entry_id)
+
+            if group:
+                entry_ids = list(group.keys())
+                embeddings = np.stack([group[entry_id][0] for entry_id in entry_ids])
+                similarities = embeddings @ query_embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self._lru.move_to_end(entry_ids[best])
+                    self.hits += 1
+                    return group[entry_ids[best]][1]
+
+            self.misses += 1
+            return None
+
+    def put(self, query_embedding: np.ndarray, key: Tuple, answer: str):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            expires_at = time.monotonic() + self.ttl_seconds
+            self._groups.setdefault(key, {})[entry_id] = (self._normalize(query_embedding), answer, expires_at)
+            self._lru[entry_id] = key
+
+            while len(self._lru) > self.max_entries:
+                self._remove(next(iter(self._lru)))
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._lru), "hits": self.hits, "misses": self.misses}
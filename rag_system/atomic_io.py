@@ -0,0 +1,24 @@
+"""Atomic file replacement for the index build scripts.
+
+Kept free of heavy imports so that tools which only rewrite index files (index_builder, doc_metadata,
+index_updater --compact) do not pull in the embedding model stack.
+"""
+import os
+import numpy as np
+
+def write_atomic(path: str, write):
+    """Call write(tmp_path), then rename the result over `path` so readers never see a partial file.
+
+    The temporary name includes the process ID, so workers writing the same file never share one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def save_npy(array: np.ndarray):
+    """A write function for write_atomic that saves `array` in .npy format"""
+    def write(path):
+        # Write through a file handle so np.save does not append another .npy suffix
+        with open(path, "wb") as f:
+            np.save(f, array)
+    return write
@@ -0,0 +1,203 @@
+"""Per-document metadata (publication year, study type, jurisdiction) for filtered retrieval.
+
+The attributes live in doc_info.pkl next to the index. rag_system.ingest writes them, and this command
+fills them in again from MongoDB without re-embedding anything:
+explicit `year`, `study_type` and `jurisdiction` fields on a document win, otherwise they are
+extracted from the filename and the opening of the paper. At query time FAISSVectorStore turns
+them into columnar arrays aligned with doc_ids.
+
+Usage:
+    python -m rag_system.doc_metadata
+"""
+import os
+import re
+import pickle
+import logging
+import argparse
+from collections import Counter
+from datetime import date
+from typing import List, Dict, Any, Optional
+import numpy as np
+from .atomic_io import write_atomic
+
+logger = logging.getLogger(__name__)
+
+METADATA_FIELDS = ("year", "study_type", "jurisdiction")
+# Filter key -> metadata field it reads
+FILTER_FIELDS = {"year_min": "year", "year_max": "year", "study_types": "study_type", "jurisdictions": "jurisdiction"}
+METADATA_PROJECTION = {"filename": 1, "content": 1, "year": 1, "study_type": 1, "jurisdiction": 1}
+UNKNOWN = "unknown"
+
+# Characters from the start of a paper searched for metadata (title page, abstract, methods)
+HEAD_CHARS = 6000
+
+YEAR_PATTERN = re.compile(r"\b(19[5-9]\d|20[0-4]\d)\b")
+
+# Checked in order; the first design mentioned wins
+STUDY_TYPE_PATTERNS = [
+    ("meta_analysis", re.compile(r"meta-?analy[st]i[cs]|systematic review", re.I)),
+    ("rct", re.compile(r"randomi[sz]ed (?:controlled |control )?(?:trial|experiment)|random assignment|randomly assigned", re.I)),
+    ("quasi_experimental", re.compile(r"quasi-?experiment|propensity score|matched comparison|regression discontinuity|difference-in-differences", re.I)),
+    ("qualitative", re.compile(r"qualitative|semi-structured interviews|focus groups?", re.I)),
+    ("observational", re.compile(r"longitudinal|cohort|survival analysis|logistic regression|follow-up period", re.I)),
+]
+
+US_STATES = (
+    "alabama|alaska|arizona|arkansas|california|colorado|connecticut|delaware|florida|georgia|hawaii|idaho|"
+    "illinois|indiana|iowa|kansas|kentucky|louisiana|maine|maryland|massachusetts|michigan|minnesota|"
+    "mississippi|missouri|montana|nebraska|nevada|new hampshire|new jersey|new mexico|new york|"
+    "north carolina|north dakota|ohio|oklahoma|oregon|pennsylvania|rhode island|south carolina|"
+    "south dakota|tennessee|texas|utah|vermont|virginia|washington|west virginia|wisconsin|wyoming"
+)
+
+# The jurisdiction mentioned most often in the head of the paper wins
+JURISDICTION_PATTERNS = [
+    ("united_states", re.compile(rf"united states|\bU\.S\.|\bUSA\b|federal bureau of prisons|\b(?:{US_STATES})\b", re.I)),
+    ("united_kingdom", re.compile(r"united kingdom|\bUK\b|england|wales|scotland|britain|british", re.I)),
+    ("canada", re.compile(r"canada|canadian|ontario|quebec|british columbia", re.I)),
+    ("australia", re.compile(r"australia|new south wales|queensland|victoria\b", re.I)),
+    ("new_zealand", re.compile(r"new zealand", re.I)),
+    ("nordic", re.compile(r"norway|norwegian|sweden|swedish|finland|finnish|denmark|danish|iceland", re.I)),
+    ("netherlands", re.compile(r"netherlands|dutch", re.I)),
+    ("germany", re.compile(r"germany|german", re.I)),
+    ("ireland", re.compile(r"ireland|irish", re.I)),
+]
+
+def normalize_value(value: Any) -> str:
+    """Lowercase snake_case category value, as stored and as accepted in filters"""
+    return re.sub(r"[^a-z0-9]+", "_", str(value).strip().lower()).strip("_") or UNKNOWN
+
+def extract_year(filename: str, head: str) -> Optional[int]:
+    """Latest plausible year in the filename, else in the head of the paper (older years are citations)"""
+    current_year = date.today().year
+    for text in (filename, head):
+        years = [int(y) for y in YEAR_PATTERN.findall(text) if int(y) <= current_year]
+        if years:
+            return max(years)
+    return None
+
+def extract_study_type(head: str) -> str:
+    for study_type, pattern in STUDY_TYPE_PATTERNS:
+        if pattern.search(head):
+            return study_type
+    return UNKNOWN
+
+def extract_jurisdiction(head: str) -> str:
+    counts = Counter({name: len(pattern.findall(head)) for name, pattern in JURISDICTION_PATTERNS})
+    name, count = counts.most_common(1)[0]
+    return name if count else UNKNOWN
+
+def extract_metadata(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Year, study type and jurisdiction of a MongoDB document; explicit fields take precedence"""
+    filename = doc.get("filename", "")
+    head = doc.get("content", "")[:HEAD_CHARS]
+    year = doc.get("year") or extract_year(filename, head)
+    return {
+        "year": int(year) if year else None,
+        "study_type": normalize_value(doc["study_type"]) if doc.get("study_type") else extract_study_type(head),
+        "jurisdiction": normalize_value(doc["jurisdiction"]) if doc.get("jurisdiction") else extract_jurisdiction(head),
+    }
+
+class DocumentAttributes:
+    """Columnar metadata aligned with the store's doc_ids: an int16 year column (0 = unknown)
+    and categorical columns coded in the narrowest unsigned dtype that holds every value (uint8 up
+    to 256 values), so a filter becomes a few vectorized comparisons"""
+
+    def __init__(self, years: np.ndarray, categories: Dict[str, np.ndarray], values: Dict[str, List[str]]):
+        self.years = years
+        self.categories = categories  # field -> (n,) codes into values[field]
+        self.values = values
+
+    def __len__(self):
+        return len(self.years)
+
+    @classmethod
+    def from_doc_info(cls, doc_ids, doc_info: List[Dict[str, Any]]):
+        info_by_id = {str(info["id"]): info for info in doc_info or []}
+        rows = [info_by_id.get(str(doc_id), {}) for doc_id in doc_ids]
+
+        years = np.array([row.get("year") or 0 for row in rows], dtype=np.int16)
+        categories, values = {}, {}
+        for field in ("study_type", "jurisdiction"):
+            column = [normalize_value(row.get(field) or UNKNOWN) for row in rows]
+            values[field] = [UNKNOWN] + sorted(set(column) - {UNKNOWN})
+            codes = {value: code for code, value in enumerate(values[field])}
+            categories[field] = np.array([codes[value] for value in column], dtype=np.min_scalar_type(len(codes) - 1))
+        return cls(years, categories, values)
+
+    def missing_fields(self, filters: Dict[str, Any]) -> List[str]:
+        """Metadata fields used by `filters` that are unknown for every document, so the filter could only
+        ever match nothing (doc_info.pkl was not annotated with rag_system.doc_metadata)"""
+        missing = []
+        for key, field in FILTER_FIELDS.items():
+            if filters.get(key) in (None, []) or field in missing:
+                continue
+            column = self.years if field == "year" else self.categories[field]
+            if not column.any():
+                missing.append(field)
+        return missing
+
+    def mask(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Boolean mask of documents matching every given filter, or None when no filter is set.
+
+        filters: year_min / year_max (inclusive; documents of unknown year are excluded) and
+        study_types / jurisdictions (lists of allowed values).
+        """
+        mask = None
+
+        def restrict(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        if filters.get("year_min") is not None:
+            restrict(self.years >= int(filters["year_min"]))
+        if filters.get("year_max") is not None:
+            restrict((self.years <= int(filters["year_max"])) & (self.years > 0))
+        for field, key in (("study_type", "study_types"), ("jurisdiction", "jurisdictions")):
+            allowed = {normalize_value(value) for value in filters.get(key) or []}
+            if allowed:
+                codes = [code for code, value in enumerate(self.values[field]) if value in allowed]
+                restrict(np.isin(self.categories[field], codes))
+        return mask
+
+def annotate_doc_info(doc_ids, collection, docs_per_fetch: int = 32) -> List[Dict[str, Any]]:
+    """doc_info entries with metadata for every document, in doc_ids order"""
+    doc_info = []
+    doc_ids = list(doc_ids)
+    for offset in range(0, len(doc_ids), docs_per_fetch):
+        batch_ids = doc_ids[offset:offset + docs_per_fetch]
+        docs = {doc["_id"]: doc for doc in collection.find({"_id": {"$in": batch_ids}}, METADATA_PROJECTION)}
+        for doc_id in batch_ids:
+            doc = docs.get(doc_id, {})
+            doc_info.append({"id": doc_id, "filename": doc.get("filename", "Unknown document"), **extract_metadata(doc)})
+    return doc_info
+
+def write_doc_info(data_dir: str, doc_info: List[Dict[str, Any]]):
+    """Atomically replace doc_info.pkl in data_dir and log how the metadata is distributed"""
+    def write(path):
+        with open(path, "wb") as f:
+            pickle.dump(doc_info, f)
+    write_atomic(os.path.join(data_dir, "doc_info.pkl"), write)
+
+    for field in METADATA_FIELDS:
+        counts = Counter(info[field] for info in doc_info)
+        logger.info("%s: %s", field, ", ".join(f"{value}={count}" for value, count in counts.most_common(10)))
+    logger.info("Wrote metadata for %s documents", len(doc_info))
+
+def main():
+    from .vector_store import FAISSVectorStore, read_manifest
+    from .retriever import get_mongo_collection
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Add year, study type and jurisdiction to doc_info.pkl for filtered search")
+    parser.parse_args()
+
+    vector_store = FAISSVectorStore(index_type="flat")
+    data_dir = vector_store.base_dir
+    if read_manifest(vector_store.data_dir)["deltas"]:
+        raise SystemExit("Index has unapplied deltas; run `python -m rag_system.index_updater --compact` first")
+
+    write_doc_info(data_dir, annotate_doc_info(vector_store.doc_ids, get_mongo_collection()))
+
+if __name__ == "__main__":
+    main()
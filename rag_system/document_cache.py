@@ -0,0 +1,204 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_PROJECTION = {"filename": 1, "content": 1}
+
+class DocumentCache:
+    """Byte-bounded LRU cache of MongoDB documents keyed by `_id`.
+
+    Revalidation always drops deleted documents. Edits are only noticed through `version_field`, a
+    field the writer changes with the content (e.g. `updated_at`); the paper collection has none by
+    default, so an edited paper is served from the cache until it is evicted or invalidated.
+    """
+
+    def __init__(self, collection, max_bytes: int = 64 * 1024 * 1024, version_field: Optional[str] = None):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self.version_field = version_field
+
+        self._entries = OrderedDict()  # _id -> (doc, version, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._revalidate_thread = None
+        self._stop = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _projection(self):
+        projection = dict(DOCUMENT_PROJECTION)
+        if self.version_field:
+            projection[self.version_field] = 1
+        return projection
+
+    def _version(self, doc: Dict[str, Any]) -> Optional[str]:
+        """Return the stored version of a document, or None when it has no version field"""
+        if self.version_field and doc.get(self.version_field) is not None:
+            return str(doc[self.version_field])
+        return None
+
+    @staticmethod
+    def _doc_size(doc: Dict[str, Any]) -> int:
+        return len((doc.get("content") or "").encode("utf-8")) + len((doc.get("filename") or "").encode("utf-8"))
+
+    def _put(self, doc: Dict[str, Any]):
+        """Insert or replace a document and evict least recently used entries (lock must be held)"""
+        doc_id = doc["_id"]
+        size = self._doc_size(doc)
+        if size > self.max_bytes:
+            return
+
+        old = self._entries.pop(doc_id, None)
+        if old is not None:
+            self._size -= old[2]
+
+        self._entries[doc_id] = (doc, self._version(doc), size)
+        self._size += size
+
+        while self._size > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+    def _fetch(self, doc_ids: List[Any]) -> List[Dict[str, Any]]:
+        return list(self.collection.find({"_id": {"$in": doc_ids}}, self._projection()))
+
+    def _lookup(self, doc_ids: Iterable[Any]):
+        """Split doc_ids into cached documents and the IDs that still need fetching"""
+        found = {}
+        missing = []
+        with self._lock:
+            for doc_id in dict.fromkeys(doc_ids):
+                entry = self._entries.get(doc_id)
+                if entry is None:
+                    missing.append(doc_id)
+                else:
+                    self._entries.move_to_end(doc_id)
+                    found[doc_id] = entry[0]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def _store(self, docs: List[Dict[str, Any]], found: Dict[Any, Dict[str, Any]]):
+        with self._lock:
+            for doc in docs:
+                self._put(doc)
+                found[doc["_id"]] = doc
+
+    def get_many(self, doc_ids: Iterable[Any]) -> Dict[Any, Dict[str, Any]]:
+        """Return documents for doc_ids, fetching all misses with a single `$in` query"""
+        found, missing = self._lookup(doc_ids)
+
+        if missing:
+            try:
+                docs = self._fetch(missing)
+            except Exception as e:
+                # Keep answering from whatever is cached when MongoDB is unavailable
+                logger.warning("Error fetching %s documents from MongoDB: %s", len(missing), e)
+                docs = []
+            self._store(docs, found)
+
+        return found
+
+    async def aget_many(self, doc_ids: Iterable[Any], async_collection) -> Dict[Any, Dict[str, Any]]:
+        """Async variant of get_many that fetches misses through an async MongoDB collection"""
+        found, missing = self._lookup(doc_ids)
+
+        if missing:
+            try:
+                cursor = async_collection.find({"_id": {"$in": missing}}, self._projection())
+                docs = await cursor.to_list(length=None)
+            except Exception as e:
+                logger.warning("Error fetching %s documents from MongoDB: %s", len(missing), e)
+                docs = []
+            self._store(docs, found)
+
+        return found
+
+    def warm(self, doc_ids: Iterable[Any], batch_size: int = 100):
+        """Preload documents into the cache in batches"""
+        doc_ids = list(doc_ids)
+        loaded = 0
+        for start in range(0, len(doc_ids), batch_size):
+            docs = self._fetch(doc_ids[start:start + batch_size])
+            with self._lock:
+                for doc in docs:
+                    self._put(doc)
+            loaded += len(docs)
+        logger.info("Document cache warmed with %s documents (%s bytes)", loaded, self._size)
+
+    def invalidate(self, doc_id: Any = None):
+        """Drop one document, or the whole cache when doc_id is None"""
+        with self._lock:
+            if doc_id is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            entry = self._entries.pop(doc_id, None)
+            if entry is not None:
+                self._size -= entry[2]
+
+    def revalidate(self):
+        """Drop cached documents deleted from MongoDB and refresh ones whose version field changed.
+
+        The check reads only `_id` and the version field, and only changed documents are fetched again.
+        Without a version field (DOC_CACHE_VERSION_FIELD unset), or for documents lacking it, only
+        deletions are detected.
+        """
+        with self._lock:
+            cached = {doc_id: entry[1] for doc_id, entry in self._entries.items()}
+        if not cached:
+            return
+
+        projection = {"_id": 1}
+        if self.version_field:
+            projection[self.version_field] = 1
+        current = {
+            doc["_id"]: self._version(doc)
+            for doc in self.collection.find({"_id": {"$in": list(cached)}}, projection)
+        }
+        deleted = [doc_id for doc_id in cached if doc_id not in current]
+        stale = [doc_id for doc_id, version in cached.items() if doc_id in current and current[doc_id] != version]
+        docs = self._fetch(stale) if stale else []
+
+        with self._lock:
+            for doc_id in deleted:
+                entry = self._entries.pop(doc_id, None)
+                if entry is not None:
+                    self._size -= entry[2]
+            for doc in docs:
+                if doc["_id"] in self._entries:
+                    self._put(doc)
+        if deleted or stale:
+            logger.info("Document cache revalidated: %s documents deleted, %s changed", len(deleted), len(stale))
+
+    def start_revalidation(self, interval_seconds: float):
+        """Revalidate the cache periodically on a daemon thread"""
+        if self._revalidate_thread is not None or interval_seconds <= 0:
+            return
+
+        def run():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.revalidate()
+                except Exception as e:
+                    logger.warning("Error revalidating document cache: %s", e)
+
+        self._revalidate_thread = threading.Thread(target=run, name="document-cache-revalidate", daemon=True)
+        self._revalidate_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
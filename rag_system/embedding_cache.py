@@ -0,0 +1,150 @@
+import os
+import atexit
+import logging
+import time
+import queue
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Optional
+import numpy as np
+from .atomic_io import write_atomic
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry"""
+    return " ".join(query.lower().split())
+
+class EmbeddingCache:
+    """LRU cache of query embeddings keyed on normalized query text, optionally persisted to disk"""
+
+    def __init__(self, max_entries: int = 1024, path: str = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()  # normalized query -> (dim,) float32 vector
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        if self.path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, query: str, vector: np.ndarray):
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32).reshape(-1)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self):
+        """Load persisted embeddings from self.path if the file exists"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                keys, vectors = data["keys"], data["vectors"]
+            with self._lock:
+                for key, vector in zip(keys[-self.max_entries:], vectors[-self.max_entries:]):
+                    self._entries[str(key)] = vector
+            logger.info("Loaded %s cached query embeddings from %s", len(self._entries), self.path)
+        except Exception as e:
+            logger.warning("Error loading embedding cache from %s: %s", self.path, e)
+
+    def save(self):
+        """Persist the cache to self.path, least recently used entries first"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._entries:
+                return
+            keys = np.array(list(self._entries.keys()))
+            vectors = np.stack(list(self._entries.values()))
+
+        def write(path):
+            with open(path, "wb") as f:
+                np.savez(f, keys=keys, vectors=vectors)
+        # Every worker saves at exit, so each needs its own temporary file
+        write_atomic(self.path, write)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class BatchingEncoder:
+    """Collects concurrent encode requests for a few milliseconds and runs them as one forward pass.
+
+    Requests are taken in priority order, so /chat/batch queries (BATCH_PRIORITY) and speculative
+    encodes (SPECULATIVE_PRIORITY) only fill batches no live request is waiting for, and all of them
+    share the one model thread.
+    """
+
+    LIVE_PRIORITY = 0
+    BATCH_PRIORITY = 1
+    SPECULATIVE_PRIORITY = 2
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.PriorityQueue()  # (priority, sequence, text, future)
+        self._sequence = itertools.count()
+        self._worker = threading.Thread(target=self._run, name="batching-encoder", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str, priority: int = LIVE_PRIORITY) -> Future:
+        """Queue text for encoding; the future resolves to its L2-normalized (dim,) float32 vector"""
+        future = Future()
+        self._queue.put((priority, next(self._sequence), text, future))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def encode_many(self, texts: List[str]) -> np.ndarray:
+        """Encode a list of texts directly as one batch on the calling thread, bypassing the queue"""
+        embeddings = self.model.encode(texts, batch_size=max(1, len(texts))).astype(np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for _, _, text, _ in batch]
+            try:
+                embeddings = self.encode_many(texts)
+            except Exception as e:
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+            for (*_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
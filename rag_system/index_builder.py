@@ -0,0 +1,247 @@
+"""Offline ANN index builder: build IVF/HNSW/PQ variants of a flat index and tune their search parameters.
+
+The variant is written next to the flat index (e.g. data/passages.hnsw.index) together with a
+*.tuning.json holding the smallest nprobe/efSearch that reaches the recall target against exact search.
+FAISSVectorStore loads the variant selected by INDEX_TYPE and applies the saved tuning. The tuning
+also records the build settings, so `rag_system.index_updater --compact` can rebuild every variant
+after it rewrites the flat index.
+
+The compressed types trade recall for memory: sq8 stores 1 byte per dimension (4x smaller than
+float32) and pq stores pq_m bytes per vector (default dim/8, 32x smaller); their tuning records the
+recall and bytes per vector they reach.
+
+Usage:
+    python -m rag_system.index_builder --type hnsw --level passages --recall-target 0.95
+    python -m rag_system.index_builder --type ivf_flat --level documents --queries-file queries.npy
+    python -m rag_system.index_builder --type pq --pq-m 96 --level passages
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from typing import List, Dict, Any, Tuple
+import faiss
+import numpy as np
+from .vector_store import (
+    FAISSVectorStore, PASSAGE_INDEX_FILENAME, INDEX_TYPES,
+    index_variant_path, tuning_path, apply_search_params
+)
+from .atomic_io import write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Search parameter swept for each index type, and the candidate values in increasing cost
+SWEEP_PARAMS = {
+    "ivf_flat": ("nprobe", [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]),
+    "ivf_pq": ("nprobe", [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]),
+    "ivf_sq8": ("nprobe", [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]),
+    "hnsw": ("efSearch", [16, 24, 32, 48, 64, 96, 128, 192, 256, 384, 512]),
+}
+
+def default_nlist(n: int) -> int:
+    """Roughly 4*sqrt(n) inverted lists, keeping at least 39 training points per centroid"""
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+def load_vectors(index_path: str) -> np.ndarray:
+    """Read the stored vectors back out of a flat index"""
+    index = faiss.read_index(index_path)
+    return index.reconstruct_n(0, index.ntotal).astype(np.float32)
+
+def pq_nbits(n: int) -> int:
+    """8-bit codes need 256 training points per sub-quantizer; use fewer bits on tiny corpora"""
+    return 8 if n >= 256 * 4 else max(1, int(np.log2(max(2, n // 4))))
+
+def build_index(vectors: np.ndarray, index_type: str, nlist: int = None, hnsw_m: int = 32,
+                ef_construction: int = 200, pq_m: int = None):
+    """Build an inner-product index of `index_type` over vectors"""
+    n, dim = vectors.shape
+    # IVF-PQ encodes residuals, which need far fewer sub-quantizers than raw vectors
+    pq_m = pq_m or (16 if index_type == "ivf_pq" else dim // 8)
+    if index_type in ("ivf_pq", "pq") and dim % pq_m:
+        raise ValueError(f"pq_m={pq_m} must divide the vector dimension {dim}")
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    elif index_type == "pq":
+        index = faiss.IndexPQ(dim, pq_m, pq_nbits(n), faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    elif index_type in ("ivf_flat", "ivf_pq", "ivf_sq8"):
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        elif index_type == "ivf_sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit,
+                                                  faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits(n), faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    index.add(vectors)
+    return index
+
+def sample_queries(vectors: np.ndarray, n_queries: int = 200, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """Perturbed copies of random stored vectors, for when no real query log is available"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + noise * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray) -> float:
+    """Mean fraction of the exact top-k IDs found in the approximate top-k"""
+    hits = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(approx, exact))
+    return hits / float(max(1, exact.size))
+
+def tune_index(index, index_type: str, vectors: np.ndarray, queries: np.ndarray,
+               k: int = 10, recall_target: float = 0.95) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Sweep the search parameter and return (chosen params, sweep results)"""
+    k = min(k, len(vectors))
+    exact_index = faiss.IndexFlatIP(vectors.shape[1])
+    exact_index.add(vectors)
+    _, exact = exact_index.search(queries, k)
+
+    if index_type not in SWEEP_PARAMS:
+        # Nothing to tune, but report what the compression costs in recall
+        start = time.perf_counter()
+        _, approx = index.search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+        recall = recall_at_k(approx, exact)
+        logger.info("recall@%s=%.4f latency=%.3f ms/query", k, recall, latency_ms)
+        return {}, [{"recall": round(recall, 4), "latency_ms": round(latency_ms, 4)}]
+
+    param, values = SWEEP_PARAMS[index_type]
+    if param == "nprobe":
+        values = [v for v in values if v < index.nlist] + [index.nlist]
+
+    sweep = []
+    for value in values:
+        apply_search_params(index, {param: value})
+        start = time.perf_counter()
+        _, approx = index.search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+        recall = recall_at_k(approx, exact)
+        sweep.append({param: value, "recall": round(recall, 4), "latency_ms": round(latency_ms, 4)})
+        logger.info("%s=%s recall@%s=%.4f latency=%.3f ms/query", param, value, k, recall, latency_ms)
+
+    chosen = next((row for row in sweep if row["recall"] >= recall_target), None)
+    if chosen is None:
+        chosen = max(sweep, key=lambda row: row["recall"])
+        logger.warning("Recall target %.3f not reached, using %s=%s (recall %.4f)",
+                       recall_target, param, chosen[param], chosen["recall"])
+    return {param: chosen[param]}, sweep
+
+def build_variant(flat_path: str, index_type: str, queries: np.ndarray = None, queries_file: str = None,
+                  n_queries: int = 200, k: int = 10, recall_target: float = 0.95, nlist: int = None,
+                  hnsw_m: int = 32, ef_construction: int = 200, pq_m: int = None) -> Dict[str, Any]:
+    """Build, tune and write the `index_type` variant of a flat index; returns its tuning record"""
+    vectors = load_vectors(flat_path)
+    if queries is None and queries_file:
+        queries = np.load(queries_file).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    elif queries is None:
+        queries = sample_queries(vectors, n_queries)
+
+    start = time.perf_counter()
+    index = build_index(vectors, index_type, nlist=nlist, hnsw_m=hnsw_m,
+                        ef_construction=ef_construction, pq_m=pq_m)
+    build_seconds = time.perf_counter() - start
+    logger.info("Built %s index over %s vectors in %.1fs", index_type, index.ntotal, build_seconds)
+
+    search_params, sweep = tune_index(index, index_type, vectors, queries, k=k, recall_target=recall_target)
+    apply_search_params(index, search_params)
+
+    out_path = index_variant_path(flat_path, index_type)
+    write_atomic(out_path, lambda path: faiss.write_index(index, path))
+    tuning = {
+        "index_type": index_type,
+        "ntotal": index.ntotal,
+        "k": k,
+        "recall_target": recall_target,
+        "search_params": search_params,
+        "build_params": {"nlist": nlist, "hnsw_m": hnsw_m, "ef_construction": ef_construction, "pq_m": pq_m},
+        "queries_file": queries_file,
+        "n_queries": n_queries,
+        "build_seconds": round(build_seconds, 2),
+        "bytes_per_vector": round(os.path.getsize(out_path) / max(1, index.ntotal), 1),
+        "sweep": sweep,
+    }
+    def write_tuning(path):
+        with open(path, "w") as f:
+            json.dump(tuning, f, indent=2)
+    write_atomic(tuning_path(out_path), write_tuning)
+    logger.info("Wrote %s with search parameters %s", out_path, search_params)
+    return tuning
+
+def rebuild_variants(flat_path: str, source_path: str = None) -> List[str]:
+    """Build the variants that exist next to `source_path` (default: flat_path itself) for the flat
+    index at flat_path, with the settings they were built with.
+
+    A variant rebuilt in place that fails is deleted, since its rows no longer match the flat index.
+    Returns the rebuilt index types.
+    """
+    rebuilt = []
+    for index_type in INDEX_TYPES:
+        source = index_variant_path(source_path or flat_path, index_type)
+        path = index_variant_path(flat_path, index_type)
+        if index_type == "flat" or not os.path.exists(source):
+            continue
+        settings = {}
+        if os.path.exists(tuning_path(source)):
+            with open(tuning_path(source)) as f:
+                settings = json.load(f)
+        queries_file = settings.get("queries_file")
+        try:
+            build_variant(
+                flat_path, index_type,
+                queries_file=queries_file if queries_file and os.path.exists(queries_file) else None,
+                n_queries=settings.get("n_queries", 200), k=settings.get("k", 10),
+                recall_target=settings.get("recall_target", 0.95), **settings.get("build_params", {})
+            )
+            rebuilt.append(index_type)
+        except Exception as e:
+            logger.exception("Rebuilding %s failed, deleting it: %s", path, e)
+            for stale_path in (path, tuning_path(path)):
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+    return rebuilt
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build and tune an approximate FAISS index from the flat index")
+    parser.add_argument("--type", choices=[t for t in INDEX_TYPES if t != "flat"], required=True, help="Index type to build")
+    parser.add_argument("--level", choices=["documents", "passages"], default="passages", help="Which flat index to convert")
+    parser.add_argument("--nlist", type=int, help="Inverted lists for IVF indexes (default ~4*sqrt(n))")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW build-time search depth")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers (bytes per vector): default 16 for ivf_pq, dim/8 for pq")
+    parser.add_argument("--k", type=int, default=10, help="Top-k used to measure recall")
+    parser.add_argument("--recall-target", type=float, default=0.95, help="Minimum recall@k against exact search")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled tuning queries when no query file is given")
+    parser.add_argument("--queries-file", help=".npy file of (n, dim) query embeddings to tune against")
+    args = parser.parse_args()
+
+    vector_store = FAISSVectorStore()
+    if args.level == "documents":
+        flat_path = vector_store.index_path
+    else:
+        flat_path = os.path.join(vector_store.base_dir, PASSAGE_INDEX_FILENAME)
+    if not os.path.exists(flat_path):
+        raise FileNotFoundError(f"Flat index not found at {flat_path}; run rag_system.ingest first")
+
+    build_variant(
+        flat_path, args.type, queries_file=args.queries_file, n_queries=args.queries, k=args.k,
+        recall_target=args.recall_target, nlist=args.nlist, hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction, pq_m=args.pq_m
+    )
+
+if __name__ == "__main__":
+    main()
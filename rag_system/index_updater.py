@@ -0,0 +1,213 @@
+"""Incremental index updates: embed documents added to MongoDB and drop deleted ones without a full rebuild.
+
+Each run writes a delta file under data/deltas/ and bumps the version in data/index_manifest.json.
+FAISSVectorStore applies the deltas on load, and running API workers hot-swap to the new version.
+`--compact` folds the deltas into new base index files under data/base-NNNNNN/ and rebuilds any IVF/HNSW/PQ variants.
+
+Usage:
+    python -m rag_system.index_updater
+    python -m rag_system.index_updater --compact
+"""
+import os
+import pickle
+import shutil
+import logging
+import argparse
+from types import SimpleNamespace
+from typing import List, Dict, Any
+import faiss
+import numpy as np
+from bson import ObjectId
+from .vector_store import (
+    FAISSVectorStore, PASSAGE_INDEX_FILENAME, PASSAGES_FILENAME, DOC_IDS_NPY_FILENAME, DELTA_DIRNAME,
+    read_manifest, write_manifest, save_doc_ids_npy
+)
+from .retriever import EMBEDDING_MODEL_NAME, get_mongo_collection
+from .doc_metadata import METADATA_PROJECTION, extract_metadata
+from .atomic_io import write_atomic, save_npy
+from .lexical_index import build_lexical_index, lexical_index_dir, unit_texts
+from .passage_store import PassageStore, build_passage_store, passage_store_dir, document_filenames
+from .index_builder import rebuild_variants
+
+logger = logging.getLogger(__name__)
+
+# Directories under the data directory that compactions write new base index files to
+BASE_DIRNAME_PREFIX = "base-"
+
+def _raw_ids(doc_ids: List[Any]) -> np.ndarray:
+    return np.frombuffer(b"".join(ObjectId(str(doc_id)).binary for doc_id in doc_ids), dtype=np.uint8).reshape(-1, 12)
+
+def find_changes(vector_store: FAISSVectorStore, collection):
+    """Return (IDs in MongoDB but not indexed, indexed IDs no longer in MongoDB)"""
+    indexed = {
+        doc_id for idx, doc_id in enumerate(vector_store.doc_ids)
+        if idx not in vector_store.removed_docs
+    }
+    stored = {doc["_id"] for doc in collection.find({}, {"_id": 1})}
+    return list(stored - indexed), list(indexed - stored)
+
+def document_vectors(passages: np.ndarray, passage_vectors: np.ndarray, n_docs: int, first_doc_idx: int) -> np.ndarray:
+    """Document vectors as the normalized mean of each document's passage vectors"""
+    doc_vectors = np.zeros((n_docs, passage_vectors.shape[1]), dtype=np.float32)
+    np.add.at(doc_vectors, passages[:, 0] - first_doc_idx, passage_vectors)
+    return doc_vectors / np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+
+def build_delta(vector_store: FAISSVectorStore, collection, model,
+                added: List[Any], removed: List[Any], passage_chars: int = 1500,
+                overlap_chars: int = 300, batch_size: int = 64) -> Dict[str, np.ndarray]:
+    """Embed the added documents with the SentenceTransformer `model` and return the arrays of a delta file"""
+    # Imported here so that --compact, which embeds nothing, never loads PyTorch
+    from .ingest import embed_passages
+
+    docs = {doc["_id"]: doc for doc in collection.find({"_id": {"$in": added}}, METADATA_PROJECTION)} if added else {}
+    added = [doc_id for doc_id in added if docs.get(doc_id, {}).get("content")]
+    first_doc_idx = len(vector_store.doc_ids)
+
+    passages, passage_vectors = embed_passages(
+        [docs[doc_id]["content"] for doc_id in added], model,
+        passage_chars=passage_chars, overlap_chars=overlap_chars,
+        batch_size=batch_size, first_doc_idx=first_doc_idx
+    )
+    metadata = [extract_metadata(docs[doc_id]) for doc_id in added]
+    return {
+        "doc_ids": _raw_ids(added),
+        "filenames": np.array([docs[doc_id].get("filename", "Unknown document") for doc_id in added], dtype=str),
+        "doc_vectors": document_vectors(passages, passage_vectors, len(added), first_doc_idx),
+        "passages": passages,
+        "passage_vectors": passage_vectors,
+        "removed_doc_ids": _raw_ids(removed),
+        "year": np.array([m["year"] or 0 for m in metadata], dtype=np.int16),
+        "study_type": np.array([m["study_type"] for m in metadata], dtype=str),
+        "jurisdiction": np.array([m["jurisdiction"] for m in metadata], dtype=str),
+    }
+
+def write_delta(data_dir: str, delta: Dict[str, np.ndarray]) -> int:
+    """Write the delta file, then publish it by bumping the manifest version; returns the new version"""
+    manifest = read_manifest(data_dir)
+    version = manifest["version"] + 1
+    delta_file = os.path.join(DELTA_DIRNAME, f"delta-{version:06d}.npz")
+    os.makedirs(os.path.join(data_dir, DELTA_DIRNAME), exist_ok=True)
+
+    def write(path):
+        with open(path, "wb") as f:
+            np.savez(f, **delta)
+    write_atomic(os.path.join(data_dir, delta_file), write)
+    write_manifest(data_dir, {**manifest, "version": version, "deltas": manifest["deltas"] + [delta_file]})
+    return version
+
+def compact(data_dir: str, collection):
+    """Rewrite the base index files with all deltas applied and publish them as a new version.
+
+    The compacted files, with rebuilt lexical indexes, passage stores and IVF/HNSW/PQ variants, are
+    written to a new base-NNNNNN directory, and one manifest write switches to it and drops the deltas:
+    a store loading at any moment sees either the old base with its deltas or the new base alone.
+    The replaced base and deltas stay for stores still loading them and go at the next compaction.
+    """
+    vector_store = FAISSVectorStore(index_type="flat")
+    version = vector_store.version + 1
+    base_name = f"{BASE_DIRNAME_PREFIX}{version:06d}"
+    base_dir = os.path.join(data_dir, base_name)
+    os.makedirs(base_dir, exist_ok=True)
+
+    keep = np.ones(len(vector_store.doc_ids), dtype=bool)
+    keep[list(vector_store.removed_docs)] = False
+    new_positions = np.cumsum(keep) - 1
+
+    doc_ids = [doc_id for doc_id, kept in zip(vector_store.doc_ids, keep) if kept]
+    doc_index = faiss.IndexFlatIP(vector_store.index.d)
+    doc_index.add(vector_store.index.reconstruct_n(0, vector_store.index.ntotal)[keep])
+
+    index_path = os.path.join(base_dir, os.path.basename(vector_store.index_path))
+    faiss.write_index(doc_index, index_path)
+    save_doc_ids_npy(doc_ids, os.path.join(base_dir, DOC_IDS_NPY_FILENAME))
+    rebuilt = rebuild_variants(index_path, vector_store.index_path)
+
+    if vector_store.passage_index is not None:
+        passages = np.asarray(vector_store.passages)
+        kept_rows = keep[passages[:, 0]]
+        kept_rows[list(vector_store.removed_passages)] = False
+        passages = passages[kept_rows].copy()
+        passages[:, 0] = new_positions[passages[:, 0]]
+        passage_index = faiss.IndexFlatIP(vector_store.passage_index.d)
+        passage_index.add(vector_store.passage_index.reconstruct_n(0, vector_store.passage_index.ntotal)[kept_rows])
+        passage_index_path = os.path.join(base_dir, PASSAGE_INDEX_FILENAME)
+        faiss.write_index(passage_index, passage_index_path)
+        save_npy(passages)(os.path.join(base_dir, PASSAGES_FILENAME))
+        rebuilt += rebuild_variants(passage_index_path, os.path.join(vector_store.base_dir, PASSAGE_INDEX_FILENAME))
+
+    if vector_store.doc_info is not None:
+        kept_ids = set(doc_ids)
+        doc_info = [info for info in vector_store.doc_info if ObjectId(str(info["id"])) in kept_ids]
+        with open(os.path.join(base_dir, "doc_info.pkl"), "wb") as f:
+            pickle.dump(doc_info, f)
+
+    for level in ("documents", "passages"):
+        has_lexical_index = os.path.exists(lexical_index_dir(vector_store.base_dir, level))
+        store = PassageStore.load(vector_store.base_dir, level)
+        if not (has_lexical_index or store is not None):
+            continue
+        if level == "passages" and vector_store.passage_index is None:
+            continue
+        texts = unit_texts(
+            SimpleNamespace(doc_ids=doc_ids, passages=passages if level == "passages" else None),
+            collection, level
+        )
+        if has_lexical_index:
+            build_lexical_index(texts, lexical_index_dir(base_dir, level), level)
+        if store is not None:
+            build_passage_store(
+                texts, document_filenames(doc_ids, collection), passage_store_dir(base_dir, level), level,
+                compression=store.compression, block_records=store.block_records
+            )
+
+    manifest = read_manifest(data_dir)
+    if manifest["version"] != vector_store.version:
+        shutil.rmtree(base_dir)
+        raise RuntimeError(f"Index version {manifest['version']} was published while compacting version "
+                           f"{vector_store.version}; run the compaction again")
+    write_manifest(data_dir, {"version": version, "base": base_name, "deltas": []})
+
+    # Only what neither the new nor the replaced manifest refers to
+    delta_dir = os.path.join(data_dir, DELTA_DIRNAME)
+    in_use = {os.path.basename(delta_file) for delta_file in manifest["deltas"]}
+    for name in os.listdir(delta_dir) if os.path.isdir(delta_dir) else []:
+        if name not in in_use:
+            os.remove(os.path.join(delta_dir, name))
+    for name in os.listdir(data_dir):
+        if name.startswith(BASE_DIRNAME_PREFIX) and name not in (base_name, manifest.get("base")):
+            shutil.rmtree(os.path.join(data_dir, name))
+    logger.info("Compacted %s documents into %s (version %s), rebuilt variants: %s",
+                len(doc_ids), base_dir, version, ", ".join(rebuilt) or "none")
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Incrementally update the FAISS indexes from MongoDB")
+    parser.add_argument("--passage-chars", type=int, default=1500, help="Maximum characters per passage")
+    parser.add_argument("--overlap-chars", type=int, default=300, help="Characters shared by consecutive passages")
+    parser.add_argument("--batch-size", type=int, default=64, help="SentenceTransformer encode batch size")
+    parser.add_argument("--compact", action="store_true", help="Fold existing deltas into the base index files")
+    args = parser.parse_args()
+
+    vector_store = FAISSVectorStore(index_type="flat")
+    data_dir = vector_store.data_dir
+    collection = get_mongo_collection()
+    if args.compact:
+        compact(data_dir, collection)
+        return
+
+    added, removed = find_changes(vector_store, collection)
+    if not added and not removed:
+        logger.info("Index is up to date (version %s)", vector_store.version)
+        return
+
+    logger.info("Indexing %s new documents, removing %s", len(added), len(removed))
+    from sentence_transformers import SentenceTransformer
+    delta = build_delta(
+        vector_store, collection, SentenceTransformer(EMBEDDING_MODEL_NAME), added, removed,
+        passage_chars=args.passage_chars, overlap_chars=args.overlap_chars, batch_size=args.batch_size
+    )
+    version = write_delta(data_dir, delta)
+    logger.info("Published index version %s", version)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Offline ingestion: split papers into overlapping passages and build a passage-level FAISS index.
+
+Also rebuilds the passage BM25 index and annotates doc_info.pkl with the metadata filtered search uses.
+
+Usage:
+    python -m rag_system.ingest --passage-chars 1500 --overlap-chars 300 --batch-size 64
+"""
+import os
+import logging
+import argparse
+from typing import List, Tuple
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from .vector_store import FAISSVectorStore, PASSAGE_INDEX_FILENAME, PASSAGES_FILENAME
+from .retriever import EMBEDDING_MODEL_NAME, get_mongo_collection
+from .document_cache import DOCUMENT_PROJECTION
+from .doc_metadata import annotate_doc_info, write_doc_info
+from .lexical_index import build_lexical_index, lexical_index_dir, unit_texts
+from .atomic_io import write_atomic, save_npy
+
+logger = logging.getLogger(__name__)
+
+def split_into_passages(text: str, passage_chars: int = 1500, overlap_chars: int = 300) -> List[Tuple[int, int]]:
+    """Split text into overlapping (start, end) character spans that break on whitespace"""
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(length, start + passage_chars)
+        if end < length:
+            # Prefer to end the passage on a word boundary in its second half
+            cut = text.rfind(" ", start + passage_chars // 2, end)
+            if cut > start:
+                end = cut
+
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end >= length:
+            break
+
+        # Step back by the overlap and realign to the start of a word
+        next_start = max(end - overlap_chars, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+
+    return spans
+
+def embed_passages(contents: List[str], model: SentenceTransformer, passage_chars: int = 1500,
+                   overlap_chars: int = 300, batch_size: int = 64, first_doc_idx: int = 0):
+    """Split and embed documents; returns ((n, 3) int64 (doc_idx, start, end) rows, (n, dim) normalized embeddings)"""
+    texts, passages = [], []
+    for doc_idx, content in enumerate(contents, start=first_doc_idx):
+        for start, end in split_into_passages(content, passage_chars, overlap_chars):
+            texts.append(content[start:end])
+            passages.append((doc_idx, start, end))
+
+    if texts:
+        embeddings = model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+    else:
+        embeddings = np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return np.asarray(passages, dtype=np.int64).reshape(-1, 3), embeddings
+
+def build_passage_index(vector_store: FAISSVectorStore, collection, model: SentenceTransformer,
+                        passage_chars: int = 1500, overlap_chars: int = 300,
+                        batch_size: int = 64, docs_per_fetch: int = 32):
+    """Embed every passage of the documents in vector_store.doc_ids and return (index, passages)"""
+    dim = model.get_sentence_embedding_dimension()
+    index = faiss.IndexFlatIP(dim)
+    passages = []
+
+    doc_ids = list(vector_store.doc_ids)
+    for offset in range(0, len(doc_ids), docs_per_fetch):
+        batch_ids = doc_ids[offset:offset + docs_per_fetch]
+        docs = {doc["_id"]: doc for doc in collection.find({"_id": {"$in": batch_ids}}, DOCUMENT_PROJECTION)}
+
+        batch_passages, embeddings = embed_passages(
+            [docs.get(doc_id, {}).get("content", "") for doc_id in batch_ids], model,
+            passage_chars=passage_chars, overlap_chars=overlap_chars,
+            batch_size=batch_size, first_doc_idx=offset
+        )
+        passages.append(batch_passages)
+        index.add(embeddings)
+        logger.info("Embedded documents %s-%s of %s (%s passages)", offset + 1, offset + len(batch_ids), len(doc_ids), index.ntotal)
+
+    return index, np.concatenate(passages) if passages else np.zeros((0, 3), dtype=np.int64)
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the passage-level FAISS index from MongoDB")
+    parser.add_argument("--passage-chars", type=int, default=1500, help="Maximum characters per passage")
+    parser.add_argument("--overlap-chars", type=int, default=300, help="Characters shared by consecutive passages")
+    parser.add_argument("--batch-size", type=int, default=64, help="SentenceTransformer encode batch size")
+    args = parser.parse_args()
+
+    vector_store = FAISSVectorStore()
+    data_dir = vector_store.base_dir
+    collection = get_mongo_collection()
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    index, passages = build_passage_index(
+        vector_store, collection, model,
+        passage_chars=args.passage_chars,
+        overlap_chars=args.overlap_chars,
+        batch_size=args.batch_size
+    )
+
+    write_atomic(os.path.join(data_dir, PASSAGE_INDEX_FILENAME), lambda path: faiss.write_index(index, path))
+    write_atomic(os.path.join(data_dir, PASSAGES_FILENAME), save_npy(passages))
+    logger.info("Wrote %s passages to %s", index.ntotal, data_dir)
+
+    # Keep the BM25 index in step with the new passage rows
+    vector_store.passages = passages
+    build_lexical_index(unit_texts(vector_store, collection, "passages"), lexical_index_dir(data_dir, "passages"), "passages")
+
+    # Without year, study type and jurisdiction every filtered request is rejected
+    write_doc_info(data_dir, annotate_doc_info(vector_store.doc_ids, collection))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""In-process BM25 inverted index, stored as flat numpy arrays and memory-mapped at load.
+
+Layout of data/lexical_{passages,documents}/:
+    vocab.npy     sorted fixed-width term strings (binary-searched at query time)
+    offsets.npy   (V + 1,) int64; postings of term i are rows offsets[i]:offsets[i + 1]
+    postings.npy  (P,) int32 unit rows (passage rows or document positions), ascending per term
+    tfs.npy       (P,) uint16 term frequencies
+    lengths.npy   (N,) int32 unit lengths in tokens
+    meta.json     unit, unit count and average length
+
+Usage:
+    python -m rag_system.lexical_index --level passages
+"""
+import os
+import json
+import logging
+import argparse
+from collections import Counter
+from typing import List, Dict, Tuple
+import numpy as np
+from .snippet_scorer import TOKEN_PATTERN
+from .document_cache import DOCUMENT_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+MAX_TERM_CHARS = 32
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can do does for from has have how if in into is it its of on or "
+    "that the their there these they this to was were what when where which who why will with".split()
+)
+
+def lexical_index_dir(data_dir: str, level: str) -> str:
+    return os.path.join(data_dir, f"lexical_{level}")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords, truncated to the stored term width"""
+    return [
+        token[:MAX_TERM_CHARS]
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+class LexicalIndex:
+    """BM25 search over memory-mapped postings arrays"""
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.vocab = np.load(os.path.join(path, "vocab.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "lengths.npy"), mmap_mode="r")
+
+        # Per-unit BM25 length normalization, computed once
+        self.length_norm = (k1 * (1 - b + b * self.lengths / max(self.meta["avg_length"], 1e-9))).astype(np.float32)
+
+    @property
+    def unit(self) -> str:
+        return self.meta["unit"]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def _term_id(self, term: str) -> int:
+        i = int(np.searchsorted(self.vocab, term))
+        if i < len(self.vocab) and self.vocab[i] == term:
+            return i
+        return -1
+
+    def search(self, query: str, top_k: int = 10, allowed: np.ndarray = None) -> List[Tuple[int, float]]:
+        """Return up to top_k (unit row, BM25 score) pairs, best first, optionally only rows where `allowed` is set"""
+        n = len(self.lengths)
+        scores = None
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self._term_id(term)
+            if term_id < 0:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            rows = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            idf = np.log1p((n - len(rows) + 0.5) / (len(rows) + 0.5))
+            if scores is None:
+                scores = np.zeros(n, dtype=np.float32)
+            # Postings hold each unit at most once per term, so fancy-index accumulation is safe
+            scores[rows] += query_tf * idf * tf * (self.k1 + 1) / (tf + self.length_norm[rows])
+
+        if scores is None:
+            return []
+        if allowed is not None:
+            # Rows appended by index deltas are not in this index, so the mask may be longer
+            scores[~allowed[:n]] = 0.0
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k <= 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    @classmethod
+    def load(cls, data_dir: str, level: str):
+        """Load the index for `level` from data_dir, or return None if it has not been built"""
+        path = lexical_index_dir(data_dir, level)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path)
+
+def build_lexical_index(texts: List[str], path: str, level: str):
+    """Tokenize the units and write the postings arrays to path"""
+    term_units: Dict[str, List[Tuple[int, int]]] = {}
+    lengths = np.zeros(len(texts), dtype=np.int32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[row] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_units.setdefault(term, []).append((row, tf))
+
+    vocab = sorted(term_units)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    postings, tfs = [], []
+    for i, term in enumerate(vocab):
+        units = term_units[term]
+        offsets[i + 1] = offsets[i] + len(units)
+        postings.extend(row for row, _ in units)
+        tfs.extend(min(tf, np.iinfo(np.uint16).max) for _, tf in units)
+
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        "vocab": np.array(vocab, dtype=f"<U{MAX_TERM_CHARS}"),
+        "offsets": offsets,
+        "postings": np.asarray(postings, dtype=np.int32),
+        "tfs": np.asarray(tfs, dtype=np.uint16),
+        "lengths": lengths,
+    }
+    for name, array in arrays.items():
+        tmp_path = os.path.join(path, f"{name}.npy.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+    # meta.json is written last, so a reader never sees a half-written index as complete
+    meta = {"unit": level, "count": len(texts), "avg_length": float(lengths.mean()) if len(texts) else 0.0}
+    with open(os.path.join(path, "meta.json.tmp"), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+    logger.info("Wrote lexical index with %s terms over %s %s to %s", len(vocab), len(texts), level, path)
+
+def unit_texts(vector_store, collection, level: str, docs_per_fetch: int = 32) -> List[str]:
+    """Text of every retrieval unit, in index row order"""
+    doc_ids = list(vector_store.doc_ids)
+    contents = {}
+    for offset in range(0, len(doc_ids), docs_per_fetch):
+        batch_ids = doc_ids[offset:offset + docs_per_fetch]
+        for doc in collection.find({"_id": {"$in": batch_ids}}, DOCUMENT_PROJECTION):
+            contents[doc["_id"]] = doc.get("content", "")
+
+    if level == "documents":
+        return [contents.get(doc_id, "") for doc_id in doc_ids]
+    return [
+        contents.get(doc_ids[doc_idx], "")[start:end]
+        for doc_idx, start, end in np.asarray(vector_store.passages)
+    ]
+
+def main():
+    from .vector_store import FAISSVectorStore
+    from .retriever import get_mongo_collection
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the BM25 inverted index used for hybrid retrieval")
+    parser.add_argument("--level", choices=["documents", "passages"], default="passages", help="Retrieval unit to index")
+    args = parser.parse_args()
+
+    os.environ["RETRIEVAL_UNIT"] = "passage" if args.level == "passages" else "document"
+    vector_store = FAISSVectorStore(index_type="flat")
+    if args.level == "passages" and vector_store.passages is None:
+        raise FileNotFoundError("Passage index not found; run rag_system.ingest first")
+
+    texts = unit_texts(vector_store, get_mongo_collection(), args.level)
+    build_lexical_index(texts, lexical_index_dir(vector_store.base_dir, args.level), args.level)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow OpenAI calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Per-request stage timings in milliseconds, shared by everything running in the request's context
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+# Per-request facts other than durations (such as the adaptive retrieval depth), reported with the response
+_request_details = contextvars.ContextVar("request_details", default=None)
+
+# Set while speculative prefetch work runs, so its stages do not skew the live request histograms
+_speculative = contextvars.ContextVar("speculative", default=False)
+
+class Histogram:
+    """Thread-safe cumulative histogram in the Prometheus exposition format"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def render(self, name: str, labels: str) -> str:
+        with self._lock:
+            lines = []
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+            lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+            lines.append(f"{name}_count{{{labels}}} {self.count}")
+            return "\n".join(lines)
+
+class MetricsRegistry:
+    """Stage latency histograms, request counters and gauges exposed at /metrics"""
+
+    def __init__(self):
+        self.stage_histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}
+        self.gauges: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.stage_histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stage_histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def increment(self, name: str, labels: str = "", amount: int = 1):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def set_gauge(self, name: str, labels: str, value: float):
+        with self._lock:
+            self.gauges[(name, labels)] = value
+
+    def render(self) -> str:
+        lines = [
+            "# HELP rag_stage_duration_seconds Time spent in each stage of the RAG pipeline",
+            "# TYPE rag_stage_duration_seconds histogram"
+        ]
+        for stage, histogram in sorted(self.stage_histograms.items()):
+            lines.append(histogram.render("rag_stage_duration_seconds", f'stage="{stage}"'))
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        for metric_type, values in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for (name, _), _ in values}):
+                lines.append(f"# TYPE {name} {metric_type}")
+                for (metric_name, labels), value in values:
+                    if metric_name == name:
+                        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+def start_request_timings() -> Dict[str, float]:
+    """Begin collecting stage timings for the current request and return the (live) timings dict"""
+    timings = {}
+    _request_timings.set(timings)
+    _request_details.set({})
+    return timings
+
+def record_timing(stage: str, seconds: float):
+    """Record a stage duration in the global histograms and the current request's timings"""
+    if _speculative.get():
+        stage = f"prefetch_{stage}"
+    REGISTRY.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000.0, 3)
+
+@contextmanager
+def speculative():
+    """Mark the enclosed work as speculative: its stages are recorded as prefetch_<stage> and never
+    reach the timings of a request it was scheduled from"""
+    speculative_token = _speculative.set(True)
+    timings_token = _request_timings.set(None)
+    details_token = _request_details.set(None)
+    try:
+        yield
+    finally:
+        _request_details.reset(details_token)
+        _request_timings.reset(timings_token)
+        _speculative.reset(speculative_token)
+
+def is_speculative() -> bool:
+    return _speculative.get()
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(stage, time.perf_counter() - start)
+
+def run_in_executor(executor, func, *args):
+    """loop.run_in_executor that carries the caller's context, so stage timings reach the request"""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, context.run, func, *args)
+
+def current_timings() -> Optional[Dict[str, float]]:
+    return _request_timings.get()
+
+def record_detail(name: str, value: Any):
+    """Attach a fact about the current request, e.g. how many candidates retrieval hydrated"""
+    details = _request_details.get()
+    if details is not None:
+        details[name] = value
+
+def current_details() -> Optional[Dict[str, Any]]:
+    """Facts recorded for the current request, or None when there are none"""
+    return _request_details.get() or None
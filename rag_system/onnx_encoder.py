@@ -0,0 +1,276 @@
+"""Int8-quantized ONNX Runtime export of the query encoder, for CPU serving without PyTorch.
+
+`export` converts the SentenceTransformer to ONNX and dynamically quantizes its weights to int8;
+`parity` encodes a query log with both encoders, compares their FAISS top-k results and latency, and
+exits non-zero when the overlap is below --min-overlap. Serve the export with ENCODER_BACKEND=onnx
+(ONNX_ENCODER_PATH, ONNX_THREADS). Exporting needs torch, sentence-transformers and onnxruntime;
+serving needs only onnxruntime and tokenizers.
+
+Usage:
+    python -m rag_system.onnx_encoder export --output data/onnx_encoder
+    python -m rag_system.onnx_encoder parity --queries-file queries.txt --k 10 --json parity.json
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from typing import List, Dict, Any
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_ENCODER_PATH = "./data/onnx_encoder"
+ONNX_MODEL_FILENAME = "model.int8.onnx"
+ENCODER_CONFIG_FILENAME = "encoder_config.json"
+
+class OnnxQueryEncoder:
+    """Drop-in for SentenceTransformer.encode backed by an ONNX Runtime session.
+
+    The session and tokenizer are created on first use in each process: the encoder may be preloaded
+    in the gunicorn master, and ONNX Runtime's thread pools do not survive a fork.
+    """
+
+    def __init__(self, path: str, threads: int = 0):
+        self.path = path
+        self.threads = threads
+        with open(os.path.join(path, ENCODER_CONFIG_FILENAME)) as f:
+            self.config = json.load(f)
+
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    def _load(self):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads  # 0 lets ONNX Runtime use every core
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(
+            os.path.join(self.path, ONNX_MODEL_FILENAME), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in session.get_inputs()}
+        self._session = session
+        self._session_pid = os.getpid()
+
+    @property
+    def session(self):
+        """The ONNX Runtime session of this process, created on first use"""
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    self._load()
+        return self._session
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        session = self.session
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(attention_mask)
+        hidden = session.run(None, feeds)[0]
+
+        if self.config["pooling"] == "cls":
+            embeddings = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            embeddings = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings.astype(np.float32)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Encode a string or list of strings; keyword arguments of SentenceTransformer.encode are accepted"""
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+        if not texts:
+            return np.zeros((0, self.config["dimension"]), dtype=np.float32)
+        embeddings = np.concatenate([
+            self._encode_batch(texts[offset:offset + batch_size])
+            for offset in range(0, len(texts), batch_size)
+        ])
+        if kwargs.get("normalize_embeddings"):
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+def export_onnx(model_name: str, output_dir: str, opset: int = 17, keep_fp32: bool = False):
+    """Export the SentenceTransformer's transformer to ONNX, quantize it to int8 and save the tokenizer"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Pooling, Normalize
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    transformer.config.return_dict = False
+    tokenizer = model.tokenizer
+
+    pooling = next(module for module in model if isinstance(module, Pooling))
+    pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in ("cls", "mean"):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling_mode}")
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    sample = tokenizer(["what reduces recidivism"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+        )
+    quantize_dynamic(fp32_path, os.path.join(output_dir, ONNX_MODEL_FILENAME), weight_type=QuantType.QInt8)
+    if not keep_fp32:
+        os.remove(fp32_path)
+
+    tokenizer.save_pretrained(output_dir)
+    config = {
+        "model_name": model_name,
+        "pooling": pooling_mode,
+        "normalize": any(isinstance(module, Normalize) for module in model),
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "pad_token_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+    }
+    with open(os.path.join(output_dir, ENCODER_CONFIG_FILENAME), "w") as f:
+        json.dump(config, f, indent=2)
+    logger.info("Exported %s to %s (%.1f MB int8)", model_name, output_dir,
+                os.path.getsize(os.path.join(output_dir, ONNX_MODEL_FILENAME)) / 2**20)
+
+def read_queries(path: str) -> List[str]:
+    """Queries from a log file: one per line, or JSON lines with a "query" field"""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("{"):
+                line = json.loads(line).get("query", "")
+            if line:
+                queries.append(line)
+    return queries
+
+def normalized(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def time_encoder(model, queries: List[str], batch_size: int = 32) -> Dict[str, float]:
+    """Median single-query latency and batched throughput"""
+    model.encode(queries[:2])  # warm-up
+    latencies = []
+    for query in queries[:100]:
+        start = time.perf_counter()
+        model.encode([query])
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    model.encode(queries, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "single_query_p50_ms": float(np.median(latencies) * 1000.0),
+        "batch_queries_per_second": len(queries) / batch_seconds,
+    }
+
+def parity_report(reference, candidate, queries: List[str], index, k: int = 10) -> Dict[str, Any]:
+    """Compare two encoders on the same queries: FAISS top-k overlap, embedding cosine and speed"""
+    reference_embeddings = normalized(reference.encode(queries))
+    candidate_embeddings = normalized(candidate.encode(queries))
+    k = min(k, index.ntotal)
+    _, reference_ids = index.search(reference_embeddings, k)
+    _, candidate_ids = index.search(candidate_embeddings, k)
+
+    overlaps = np.array([
+        len(set(r[r >= 0]) & set(c[c >= 0])) / float(max(1, np.count_nonzero(r >= 0)))
+        for r, c in zip(reference_ids, candidate_ids)
+    ])
+    cosines = (reference_embeddings * candidate_embeddings).sum(axis=1)
+    reference_timing = time_encoder(reference, queries)
+    candidate_timing = time_encoder(candidate, queries)
+    return {
+        "queries": len(queries),
+        "k": k,
+        "mean_overlap": float(overlaps.mean()),
+        "min_overlap": float(overlaps.min()),
+        "top1_agreement": float(np.mean(reference_ids[:, 0] == candidate_ids[:, 0])),
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "torch": reference_timing,
+        "onnx": candidate_timing,
+        "single_query_speedup": reference_timing["single_query_p50_ms"] / candidate_timing["single_query_p50_ms"],
+        "batch_speedup": candidate_timing["batch_queries_per_second"] / reference_timing["batch_queries_per_second"],
+    }
+
+def main():
+    from .retriever import EMBEDDING_MODEL_NAME
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export the query encoder to int8 ONNX and check it against PyTorch")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Export and quantize the encoder")
+    export.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    export.add_argument("--output", default=os.getenv("ONNX_ENCODER_PATH", DEFAULT_ONNX_ENCODER_PATH))
+    export.add_argument("--opset", type=int, default=17)
+    export.add_argument("--keep-fp32", action="store_true", help="Keep the unquantized model.onnx")
+
+    parity = subparsers.add_parser("parity", help="Compare FAISS top-k and latency against the PyTorch encoder")
+    parity.add_argument("--queries-file", required=True, help="Query log: one query per line, or JSON lines with \"query\"")
+    parity.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parity.add_argument("--path", default=os.getenv("ONNX_ENCODER_PATH", DEFAULT_ONNX_ENCODER_PATH))
+    parity.add_argument("--threads", type=int, default=int(os.getenv("ONNX_THREADS", "0")))
+    parity.add_argument("--level", choices=["documents", "passages"], default="passages", help="Index to search")
+    parity.add_argument("--k", type=int, default=10)
+    parity.add_argument("--min-overlap", type=float, default=0.9, help="Fail below this mean top-k overlap")
+    parity.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.output, opset=args.opset, keep_fp32=args.keep_fp32)
+        return
+
+    from sentence_transformers import SentenceTransformer
+    from .vector_store import FAISSVectorStore
+
+    os.environ["RETRIEVAL_UNIT"] = "passage" if args.level == "passages" else "document"
+    vector_store = FAISSVectorStore(index_type="flat")
+    index = vector_store.passage_index if args.level == "passages" and vector_store.passage_index is not None else vector_store.index
+
+    report = parity_report(
+        SentenceTransformer(args.model, device="cpu"),
+        OnnxQueryEncoder(args.path, threads=args.threads),
+        read_queries(args.queries_file),
+        index,
+        k=args.k
+    )
+    report["threads"] = args.threads
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["mean_overlap"] < args.min_overlap:
+        raise SystemExit(f"Mean top-{report['k']} overlap {report['mean_overlap']:.3f} is below {args.min_overlap}")
+
+if __name__ == "__main__":
+    main()
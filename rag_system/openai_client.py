@@ -1,29 +1,218 @@
 import os
-from openai import OpenAI
-from typing import List, Dict, Any
+import time
+import random
+import asyncio
+import logging
+import threading
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
+from typing import List, Dict, Any, AsyncIterator
 from dotenv import load_dotenv
+from .metrics import REGISTRY
+from .prompt_budget import TokenCounter
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a research assistant specializing in criminology and recidivism studies. Your answers should be factual, nuanced, and based exclusively on the provided research context. Always cite your sources. When the research is inconclusive, acknowledge this clearly."
+
+# Transient failures worth retrying: 429s, 5xx, timeouts and dropped connections
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError)
+
+def build_messages(prompt: str) -> List[Dict[str, str]]:
+    """Build the chat messages sent to OpenAI for a prompt"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+class OpenAIUnavailableError(Exception):
+    """OpenAI kept failing (rate limits or outages) after all retries"""
+
+    def __init__(self, message: str, retry_after: float = 10.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def retry_delay(error: Exception, attempt: int, base_seconds: float = 0.5, max_seconds: float = 30.0) -> float:
+    """Seconds to wait before the next attempt: the server's Retry-After if it sent one, else full-jitter backoff"""
+    response = getattr(error, "response", None)
+    try:
+        return min(max_seconds, float(response.headers.get("retry-after")))
+    except (AttributeError, TypeError, ValueError):
+        return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+class TokenBucket:
+    """Allows `per_minute` units per minute with up to a minute of burst; 0 disables the limit"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units now and return how long the caller must wait before spending them"""
+        if self.per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.available = min(self.per_minute, self.available + (now - self.updated) * self.per_minute / 60.0)
+            self.updated = now
+            # Reservations may overdraw the bucket; later callers then wait for it to refill, in order
+            self.available -= min(amount, self.per_minute)
+            return max(0.0, -self.available * 60.0 / self.per_minute)
+
+class RateLimiter:
+    """Client-side requests-per-minute and tokens-per-minute budgets"""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
 class OpenAIClient:
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key is required but not provided")
-        
-        self.client = OpenAI(api_key=self.api_key)
-        
+
+        # Retries are handled here (rate-limit aware), so the SDK's own retries are turned off
+        self.base_url = os.getenv("OPENAI_BASE_URL") or None
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+        )
+        self.client = OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=openai.DefaultHttpxClient(limits=self.limits, timeout=self.timeout)
+        )
+
+        # Cap concurrent requests and pace them against the account's RPM/TPM limits
+        self.max_in_flight = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "16"))
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.rate_limiter = RateLimiter(
+            rpm=int(os.getenv("OPENAI_RPM_LIMIT", "0")),
+            tpm=int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+        )
+        self.token_counter = TokenCounter()
+
+    def _request(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        return {"model": model, "messages": build_messages(prompt), "temperature": temperature, "max_tokens": max_tokens}
+
+    def _estimated_tokens(self, request: Dict[str, Any]) -> int:
+        """Tokens a request counts against TPM: the prompt plus the completion allowance"""
+        return sum(self.token_counter.count(m["content"]) for m in request["messages"]) + request["max_tokens"]
+
+    def _on_retry(self, error: Exception, attempt: int) -> float:
+        if attempt >= self.max_retries:
+            REGISTRY.increment("rag_openai_failures_total", f'error="{type(error).__name__}"')
+            raise OpenAIUnavailableError(f"OpenAI request failed after {attempt + 1} attempts: {error}", retry_after=retry_delay(error, attempt)) from error
+        delay = retry_delay(error, attempt)
+        REGISTRY.increment("rag_openai_retries_total", f'error="{type(error).__name__}"')
+        logger.warning("OpenAI request failed (%s), retrying in %.2fs", type(error).__name__, delay)
+        return delay
+
     def generate_completion(self, prompt: str, model: str = "gpt-4o", temperature: float = 0.2, max_tokens: int = 1500):
         """Generate a completion using OpenAI"""
-        response = self.client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a research assistant specializing in criminology and recidivism studies. Your answers should be factual, nuanced, and based exclusively on the provided research context. Always cite your sources. When the research is inconclusive, acknowledge this clearly."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens
+        request = self._request(prompt, model, temperature, max_tokens)
+        tokens = self._estimated_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.rate_limiter.reserve(tokens))
+            try:
+                with self._slots:
+                    response = self.client.chat.completions.create(**request)
+                return response.choices[0].message.content
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self._on_retry(e, attempt))
+
+class AsyncOpenAIClient(OpenAIClient):
+    """OpenAIClient variant that also exposes non-blocking completions for the API event loop.
+
+    Identical prompts already in flight share one request (single-flight coalescing).
+    """
+    def __init__(self, api_key: str = None):
+        super().__init__(api_key)
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=self.limits, timeout=self.timeout)
         )
-        
-        return response.choices[0].message.content
\ No newline at end of file
+        self._async_slots = None
+        self._in_flight = {}  # request key -> task
+
+    @property
+    def async_slots(self) -> asyncio.Semaphore:
+        # Created on first use so it belongs to the serving event loop
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_in_flight)
+        return self._async_slots
+
+    async def _acreate(self, request: Dict[str, Any], stream: bool = False):
+        """chat.completions.create with rate limiting and retries.
+
+        An in-flight slot is held only for the HTTP call itself, never through the rate-limit wait or a
+        backoff sleep, so one throttled request does not take concurrency from the others. A stream is
+        returned still holding its slot; the caller releases it once the stream is read.
+        """
+        tokens = self._estimated_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.rate_limiter.reserve(tokens))
+            await self.async_slots.acquire()
+            try:
+                response = await self.async_client.chat.completions.create(**request, stream=stream)
+            except RETRYABLE_ERRORS as e:
+                self.async_slots.release()
+                await asyncio.sleep(self._on_retry(e, attempt))
+                continue
+            except BaseException:
+                self.async_slots.release()
+                raise
+            if not stream:
+                self.async_slots.release()
+            return response
+
+    async def _acomplete(self, request: Dict[str, Any]) -> str:
+        response = await self._acreate(request)
+        return response.choices[0].message.content
+
+    async def agenerate_completion(self, prompt: str, model: str = "gpt-4o", temperature: float = 0.2, max_tokens: int = 1500):
+        """Generate a completion using OpenAI without blocking the event loop"""
+        request = self._request(prompt, model, temperature, max_tokens)
+        key = (model, temperature, max_tokens, prompt)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._acomplete(request))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            REGISTRY.increment("rag_openai_coalesced_total")
+        # Shielded so one caller going away does not cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def astream_completion(self, prompt: str, model: str = "gpt-4o", temperature: float = 0.2, max_tokens: int = 1500) -> AsyncIterator[str]:
+        """Yield completion text deltas as OpenAI streams them.
+
+        The in-flight slot is held until the stream is fully read or abandoned, so streamed answers count
+        against OPENAI_MAX_IN_FLIGHT like any other request.
+        """
+        request = self._request(prompt, model, temperature, max_tokens)
+        stream = await self._acreate(request, stream=True)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            self.async_slots.release()
+            await stream.close()
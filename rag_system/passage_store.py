@@ -0,0 +1,222 @@
+"""On-disk store of retrieval-unit text, memory-mapped so context hydration needs no MongoDB round trip.
+
+Layout of data/passage_store_{passages,documents}/:
+    texts.bin     records of a little-endian uint32 byte length followed by the UTF-8 text, in index
+                  row order; with zstd compression, independently compressed blocks of
+                  `block_records` consecutive records
+    offsets.npy   int64 byte offsets into texts.bin: of each record plus the end (N + 1,), or of
+                  each compressed block plus the end (B + 1,)
+    meta.json     unit, record count, compression, block size and the filename of every document
+
+Rows added by index deltas after the store was built are not in it and are still read from MongoDB;
+`python -m rag_system.index_updater --compact` rebuilds the store along with the base index.
+zstd compression needs the optional `zstandard` package.
+
+Usage:
+    python -m rag_system.passage_store --level passages
+    python -m rag_system.passage_store --level documents --compress zstd --block-records 4
+"""
+import os
+import json
+import mmap
+import struct
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LENGTH_PREFIX = struct.Struct("<I")
+COMPRESSIONS = ("none", "zstd")
+
+def passage_store_dir(data_dir: str, level: str) -> str:
+    return os.path.join(data_dir, f"passage_store_{level}")
+
+def _encode_records(texts: List[str]) -> List[bytes]:
+    records = []
+    for text in texts:
+        data = text.encode("utf-8")
+        records.append(LENGTH_PREFIX.pack(len(data)) + data)
+    return records
+
+class PassageStore:
+    """Random access to unit text by index row over a memory-mapped file.
+
+    Reads are served from the page cache, so the text is shared by every worker process and costs
+    no heap. Decompressed zstd blocks are kept in a small LRU since neighbouring passages are often
+    retrieved together.
+    """
+
+    def __init__(self, path: str, max_cached_blocks: int = 256):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.filenames = self.meta["filenames"]
+        self.compression = self.meta["compression"]
+        self.block_records = self.meta["block_records"]
+
+        texts_path = os.path.join(path, "texts.bin")
+        if os.path.getsize(texts_path):
+            with open(texts_path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""  # an empty file cannot be mapped
+
+        if self.compression == "zstd":
+            import zstandard
+            self._zstd = zstandard
+        self.max_cached_blocks = max_cached_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def unit(self) -> str:
+        return self.meta["unit"]
+
+    def __len__(self):
+        return self.meta["count"]
+
+    @property
+    def n_documents(self) -> int:
+        return len(self.filenames)
+
+    def filename(self, doc_idx: int) -> str:
+        return self.filenames[doc_idx]
+
+    def _block(self, block_idx: int) -> bytes:
+        with self._lock:
+            block = self._blocks.get(block_idx)
+            if block is not None:
+                self._blocks.move_to_end(block_idx)
+                return block
+
+        start, end = int(self.offsets[block_idx]), int(self.offsets[block_idx + 1])
+        # Decompressor objects are not thread-safe, so each read uses its own
+        block = self._zstd.ZstdDecompressor().decompress(self._data[start:end])
+        with self._lock:
+            self._blocks[block_idx] = block
+            while len(self._blocks) > self.max_cached_blocks:
+                self._blocks.popitem(last=False)
+        return block
+
+    def text(self, row: int) -> str:
+        """Text of one index row"""
+        if not 0 <= row < len(self):
+            raise IndexError(f"Row {row} out of range for a passage store of {len(self)} records")
+
+        if self.compression == "none":
+            data, position = self._data, int(self.offsets[row])
+        else:
+            data, position = self._block(row // self.block_records), 0
+            for _ in range(row % self.block_records):
+                position += LENGTH_PREFIX.size + LENGTH_PREFIX.unpack_from(data, position)[0]
+
+        (length,) = LENGTH_PREFIX.unpack_from(data, position)
+        position += LENGTH_PREFIX.size
+        return bytes(data[position:position + length]).decode("utf-8")
+
+    def texts(self, rows) -> List[str]:
+        return [self.text(int(row)) for row in rows]
+
+    def nbytes(self) -> int:
+        """Size of the text file on disk"""
+        return len(self._data)
+
+    @classmethod
+    def load(cls, data_dir: str, level: str) -> Optional["PassageStore"]:
+        """Load the store for `level` from data_dir, or return None if it has not been built"""
+        path = passage_store_dir(data_dir, level)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path)
+
+def build_passage_store(texts: List[str], filenames: List[str], path: str, level: str,
+                        compression: str = "none", block_records: int = 16, zstd_level: int = 3):
+    """Write the unit texts (in index row order) and document filenames to path"""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+    if compression == "none":
+        block_records = 1
+    chunks = []
+    for offset in range(0, len(texts), block_records):
+        chunk = b"".join(_encode_records(texts[offset:offset + block_records]))
+        if compression == "zstd":
+            import zstandard
+            chunk = zstandard.ZstdCompressor(level=zstd_level).compress(chunk)
+        chunks.append(chunk)
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+
+    os.makedirs(path, exist_ok=True)
+    tmp_path = os.path.join(path, "texts.bin.tmp")
+    with open(tmp_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, os.path.join(path, "texts.bin"))
+    tmp_path = os.path.join(path, "offsets.npy.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, offsets)
+    os.replace(tmp_path, os.path.join(path, "offsets.npy"))
+
+    # meta.json is written last, so a reader never sees a half-written store as complete
+    meta = {
+        "unit": level,
+        "count": len(texts),
+        "compression": compression,
+        "block_records": block_records,
+        "filenames": list(filenames),
+    }
+    with open(os.path.join(path, "meta.json.tmp"), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+
+    raw_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    logger.info("Wrote passage store of %s %s to %s (%.1f MB of text in %.1f MB, %s)", len(texts), level, path,
+                raw_bytes / 2**20, offsets[-1] / 2**20, compression)
+
+def document_filenames(doc_ids, collection, docs_per_fetch: int = 256) -> List[str]:
+    """Filename of every document, in doc_ids order"""
+    doc_ids = list(doc_ids)
+    filenames = {}
+    for offset in range(0, len(doc_ids), docs_per_fetch):
+        batch_ids = doc_ids[offset:offset + docs_per_fetch]
+        for doc in collection.find({"_id": {"$in": batch_ids}}, {"filename": 1}):
+            filenames[doc["_id"]] = doc.get("filename", "Unknown document")
+    return [filenames.get(doc_id, "Unknown document") for doc_id in doc_ids]
+
+def main():
+    from .vector_store import FAISSVectorStore, read_manifest
+    from .retriever import get_mongo_collection
+    from .lexical_index import unit_texts
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the memory-mapped passage store used to hydrate context without MongoDB")
+    parser.add_argument("--level", choices=["documents", "passages"], default="passages", help="Retrieval unit to store")
+    parser.add_argument("--compress", choices=COMPRESSIONS, default="none", help="Compress blocks of records with zstd")
+    parser.add_argument("--block-records", type=int, default=16, help="Records per compressed block")
+    parser.add_argument("--zstd-level", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["RETRIEVAL_UNIT"] = "passage" if args.level == "passages" else "document"
+    vector_store = FAISSVectorStore(index_type="flat")
+    data_dir = vector_store.base_dir
+    if read_manifest(vector_store.data_dir)["deltas"]:
+        raise SystemExit("Index has unapplied deltas; run `python -m rag_system.index_updater --compact` first")
+    if args.level == "passages" and vector_store.passages is None:
+        raise FileNotFoundError("Passage index not found; run rag_system.ingest first")
+
+    collection = get_mongo_collection()
+    build_passage_store(
+        unit_texts(vector_store, collection, args.level),
+        document_filenames(vector_store.doc_ids, collection),
+        passage_store_dir(data_dir, args.level), args.level,
+        compression=args.compress, block_records=args.block_records, zstd_level=args.zstd_level
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Speculative prefetch of the sample questions listed in the frontend sidebar.
+
+While a user reads an answer the worker is usually idle. The Prefetcher uses that time to encode and
+retrieve context for the sample questions, which users copy verbatim, and keeps the results in a
+bounded LRU. With PREFETCH_ANSWERS=true it also generates their answers into the semantic answer
+cache; that spends OpenAI tokens on questions that may never be asked, so it is off by default.
+
+Everything is per worker process and redone once per index version.
+"""
+import time
+import heapq
+import asyncio
+import hashlib
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable
+import numpy as np
+from .embedding_cache import normalize_query
+from .metrics import REGISTRY, speculative
+
+logger = logging.getLogger(__name__)
+
+# Listed in the frontend sidebar; questions copied from it hit the prefetched results
+SAMPLE_QUESTIONS = [
+    "What factors contribute to recidivism rates?",
+    "How effective are rehabilitation programs in reducing reoffending?",
+    "What does research say about the impact of education on recidivism?",
+    "How do employment opportunities affect reoffending rates?",
+    "What are evidence-based approaches to reducing juvenile recidivism?",
+]
+
+# Lower runs first
+SAMPLE_QUESTION_PRIORITY = 1
+
+def vector_digest(vector: np.ndarray) -> str:
+    """Stable key for a retrieval vector; rounding absorbs float noise between identical computations"""
+    rounded = np.round(np.asarray(vector, dtype=np.float32).reshape(-1), 4)
+    return hashlib.blake2b(rounded.tobytes(), digest_size=16).hexdigest()
+
+class PrefetchScheduler:
+    """Runs speculative jobs one at a time, highest priority first, only while no live request is in flight.
+
+    Live handlers wrap their work in `live()`. A job starts once the worker has been idle for
+    `idle_ms` and checks back with `wait_idle()` between its steps, so a request that arrives mid-job
+    waits for at most one step. At most `max_pending` jobs are queued; when full, the lowest-priority
+    newest job is dropped.
+    """
+
+    def __init__(self, max_pending: int = 32, idle_ms: float = 20.0):
+        self.max_pending = max_pending
+        self.idle_seconds = idle_ms / 1000.0
+        self._pending = []  # heap of (priority, sequence, key, job)
+        self._keys = set()
+        self._sequence = itertools.count()
+        self._live = 0
+        self._loop = None
+        self._idle = None
+        self._wakeup = None
+        self._task = None
+
+    def _bind_loop(self):
+        """Create the events and the runner on the running loop (again if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._idle = asyncio.Event()
+            self._wakeup = asyncio.Event()
+            self._task = None
+            if not self._live:
+                self._idle.set()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    @contextmanager
+    def live(self):
+        """Mark a live request as in flight for the duration of the block"""
+        self._bind_loop()
+        self._live += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._live -= 1
+            if not self._live:
+                self._idle.set()
+
+    async def wait_idle(self):
+        """Return once no live request has been in flight for idle_ms"""
+        while True:
+            await self._idle.wait()
+            await asyncio.sleep(self.idle_seconds)
+            if not self._live:
+                return
+
+    def submit(self, key: Any, priority: int, job: Callable) -> bool:
+        """Queue `job` (an async callable) unless a job with the same key is already pending"""
+        self._bind_loop()
+        if key in self._keys:
+            return False
+        if len(self._pending) >= self.max_pending:
+            worst = max(self._pending, key=lambda entry: entry[:2])
+            if worst[0] <= priority:
+                REGISTRY.increment("rag_prefetch_jobs_total", 'result="dropped"')
+                return False
+            self._pending.remove(worst)
+            heapq.heapify(self._pending)
+            self._keys.discard(worst[2])
+            REGISTRY.increment("rag_prefetch_jobs_total", 'result="dropped"')
+
+        heapq.heappush(self._pending, (priority, next(self._sequence), key, job))
+        self._keys.add(key)
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self.wait_idle()
+            _, _, key, job = heapq.heappop(self._pending)
+            self._keys.discard(key)
+            try:
+                with speculative():
+                    await job()
+                REGISTRY.increment("rag_prefetch_jobs_total", 'result="done"')
+            except Exception as e:
+                logger.warning("Prefetch of %s failed: %s", key, e)
+                REGISTRY.increment("rag_prefetch_jobs_total", 'result="error"')
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self._pending), "live_requests": self._live}
+
+class Prefetcher:
+    """Prefetched context for the sample questions, looked up by live requests before retrieving.
+
+    Entries are keyed by the normalized question and the retrieval vector it was searched with, so a
+    question whose retrieval is shifted by the session's previous query (SESSION_QUERY_CARRYOVER)
+    misses; they expire with the index version or after `ttl_seconds`.
+    """
+
+    def __init__(self, retriever, response_generator=None, scheduler: PrefetchScheduler = None,
+                 max_entries: int = 256, ttl_seconds: float = 600.0, top_k: int = 5,
+                 prefetch_answers: bool = False):
+        self.retriever = retriever
+        self.response_generator = response_generator
+        self.scheduler = scheduler or PrefetchScheduler()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.top_k = top_k
+        self.prefetch_answers = prefetch_answers and response_generator is not None
+
+        # One thread, separate from the retrieval pool, so speculative work never queues ahead of live work
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._entries = OrderedDict()  # (normalized query, vector digest) -> entry
+        self._lock = threading.Lock()
+        self._sample_version = None
+
+    def _get(self, key) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] < time.monotonic() or entry["version"] != self.retriever.vector_store.version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, version, context_items: List[Dict[str, Any]]):
+        with self._lock:
+            self._entries[key] = {
+                "version": version,
+                "context_items": context_items,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, query: str, retrieval_vector: np.ndarray, filters: Dict[str, Any] = None) -> Optional[List[Dict[str, Any]]]:
+        """Prefetched context items for this question and retrieval vector, or None"""
+        if filters:
+            return None
+        entry = self._get((normalize_query(query), vector_digest(retrieval_vector)))
+        REGISTRY.increment("rag_prefetch_total", 'result="hit"' if entry else 'result="miss"')
+        return list(entry["context_items"]) if entry else None
+
+    def schedule_sample_questions(self):
+        """Prefetch the sample questions once per index version (first-turn context, no history)"""
+        version = self.retriever.vector_store.version
+        if self._sample_version == version:
+            return
+        self._sample_version = version
+        for question in SAMPLE_QUESTIONS:
+            self._schedule(question, SAMPLE_QUESTION_PRIORITY)
+
+    def _schedule(self, query: str, priority: int):
+        self.scheduler.submit(normalize_query(query), priority, lambda: self._prefetch(query))
+
+    async def _prefetch(self, query: str):
+        version = self.retriever.vector_store.version
+        # Queued behind live encodes on the shared batching encoder; the embedding cache then lets the
+        # live request skip encoding as well
+        query_embedding = await self.retriever.aencode_query(query)
+        key = (normalize_query(query), vector_digest(query_embedding))
+        if self._get(key) is not None:
+            return
+
+        await self.scheduler.wait_idle()
+        context_items = await self.retriever.aretrieve_context(
+            query, top_k=self.top_k, query_embedding=query_embedding, executor=self.executor
+        )
+        if not context_items:
+            return
+        self._put(key, version, context_items)
+
+        if self.prefetch_answers:
+            await self.scheduler.wait_idle()
+            await self.response_generator.agenerate_response(
+                query=query,
+                context_items=context_items,
+                conversation_history=[],
+                query_embedding=query_embedding
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+        return {"entries": entries, **self.scheduler.stats()}
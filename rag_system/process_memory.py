@@ -0,0 +1,73 @@
+"""Per-process memory accounting for sizing multi-worker deployments.
+
+RSS counts pages shared with the parent and sibling workers in full, so it overstates what each worker
+costs. The private (unique) set is what one more worker adds; PSS splits shared pages evenly.
+
+Usage:
+    python -m rag_system.process_memory <gunicorn master pid>
+"""
+import os
+import sys
+import resource
+import argparse
+from typing import Dict, List
+
+def memory_usage(pid="self") -> Dict[str, int]:
+    """Memory of a process in bytes: rss, pss, private (unique to it) and shared.
+
+    Reads /proc/<pid>/smaps_rollup on Linux; elsewhere only the peak RSS of this process is known.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        if pid != "self":
+            raise
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024
+        return {"rss": peak, "pss": peak, "private": peak, "shared": 0}
+
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+def child_pids(pid: int) -> List[int]:
+    """Direct children of a process (the workers of a pre-fork server)"""
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return sorted(children)
+
+def format_megabytes(usage: Dict[str, int]) -> str:
+    return ", ".join(f"{key} {value / 2**20:.1f} MB" for key, value in usage.items())
+
+def main():
+    parser = argparse.ArgumentParser(description="Report memory of a pre-fork server and the cost of each worker")
+    parser.add_argument("pid", type=int, help="PID of the server's master process")
+    args = parser.parse_args()
+
+    master = memory_usage(args.pid)
+    print(f"master {args.pid}: {format_megabytes(master)}")
+    workers = child_pids(args.pid)
+    usages = [memory_usage(pid) for pid in workers]
+    for pid, usage in zip(workers, usages):
+        print(f"worker {pid}: {format_megabytes(usage)}")
+    if usages:
+        per_worker = sum(usage["private"] for usage in usages) / len(usages)
+        total = master["pss"] + sum(usage["pss"] for usage in usages)
+        print(f"{len(usages)} workers, total PSS {total / 2**20:.1f} MB, "
+              f"each additional worker ~{per_worker / 2**20:.1f} MB private")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import logging
+from typing import List, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TokenCounter:
+    """Counts and truncates text in model tokens (tiktoken), or in ~4-character units if it is unavailable"""
+
+    def __init__(self, model: str = "gpt-4o"):
+        self.encoding = None
+        try:
+            import tiktoken
+            self.encoding = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            logger.warning("tiktoken unavailable for %s, estimating tokens from characters: %s", model, e)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the first max_tokens tokens of text"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is None:
+            return text[:max_tokens * 4]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+def _uncovered(start: int, end: int, covered: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Parts of [start, end) outside the sorted, non-overlapping `covered` spans"""
+    pieces = []
+    for span_start, span_end in covered:
+        if span_end <= start:
+            continue
+        if span_start >= end:
+            break
+        if span_start > start:
+            pieces.append((start, span_start))
+        start = max(start, span_end)
+    if start < end:
+        pieces.append((start, end))
+    return pieces
+
+def _merge_span(covered: List[Tuple[int, int]], start: int, end: int) -> List[Tuple[int, int]]:
+    """Add [start, end) to sorted, non-overlapping spans, merging any it touches"""
+    merged = []
+    for span_start, span_end in sorted(covered + [(start, end)]):
+        if merged and span_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], span_end))
+        else:
+            merged.append((span_start, span_end))
+    return merged
+
+def dedupe_context(context_items: List[Dict[str, Any]]) -> List[Tuple[int, Dict[str, Any], str]]:
+    """Drop repeated or overlapping snippets; returns (original index, item, text) in rank order.
+
+    Items with character spans (start/end) from the same document keep only the parts not already
+    covered by higher-ranked snippets, joined with " [...] " when an earlier snippet falls inside them;
+    other items are dropped if their text was already used.
+    """
+    covered = {}  # document ID -> sorted, merged [(start, end)] already in the prompt
+    seen_texts = []
+    kept = []
+    for idx, item in enumerate(context_items):
+        text = item.get("content", "")
+        doc_key = str(item.get("document_id"))
+        if "start" in item and "end" in item:
+            pieces = _uncovered(item["start"], item["end"], covered.get(doc_key, []))
+            if not pieces:
+                continue
+            text = " [...] ".join(text[start - item["start"]:end - item["start"]] for start, end in pieces)
+            covered[doc_key] = _merge_span(covered.get(doc_key, []), item["start"], item["end"])
+        elif any(text in seen for seen in seen_texts):
+            continue
+
+        if text.strip():
+            seen_texts.append(text)
+            kept.append((idx, item, text))
+    return kept
+
+class PromptBudget:
+    """Fits retrieved context and conversation history into a fixed prompt-token budget.
+
+    History keeps the newest turns first, each capped at `history_message_tokens`, and the
+    remaining budget goes to context in rank order, truncating the last snippet that fits partially.
+    """
+
+    def __init__(self, counter: TokenCounter, max_prompt_tokens: int = 6000, history_tokens: int = 1000,
+                 history_message_tokens: int = 300, min_snippet_tokens: int = 100):
+        self.counter = counter
+        self.max_prompt_tokens = max_prompt_tokens
+        self.history_tokens = history_tokens
+        self.history_message_tokens = history_message_tokens
+        self.min_snippet_tokens = min_snippet_tokens
+
+    def fit_history(self, conversation_history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], int]:
+        """Return the newest history turns that fit the history budget (oldest first) and how many were dropped"""
+        kept = []
+        remaining = self.history_tokens
+        messages = conversation_history or []
+        for msg in reversed(messages):
+            content = self.counter.truncate(msg.get("content", ""), self.history_message_tokens)
+            if content != msg.get("content", ""):
+                content += " [...]"
+            tokens = self.counter.count(content) + 4  # role label and separators
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            kept.append({"role": msg.get("role", "user"), "content": content})
+        kept.reverse()
+        return kept, len(messages) - len(kept)
+
+    def fit_context(self, context_items: List[Dict[str, Any]], available_tokens: int) -> List[Tuple[int, Dict[str, Any], str]]:
+        """Deduplicated context in rank order, cut to available_tokens"""
+        fitted = []
+        for idx, item, text in dedupe_context(context_items):
+            header_tokens = 16  # "[Document n: name]" line
+            tokens = self.counter.count(text) + header_tokens
+            if tokens <= available_tokens:
+                fitted.append((idx, item, text))
+                available_tokens -= tokens
+                continue
+            if available_tokens - header_tokens >= self.min_snippet_tokens:
+                fitted.append((idx, item, self.counter.truncate(text, available_tokens - header_tokens) + " [...]"))
+            break
+        return fitted
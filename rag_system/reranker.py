@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from .embedding_cache import normalize_query
+from .metrics import REGISTRY, timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+def load_reranker_model():
+    """Load the small CPU cross-encoder used to rerank retrieved passages"""
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(
+        os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL),
+        max_length=int(os.getenv("RERANK_MAX_LENGTH", "512")),
+        device="cpu"
+    )
+
+class CrossEncoderReranker:
+    """Reorders context items by cross-encoder relevance to the query, within a latency budget.
+
+    Pairs are scored in batches, in dense order, and their scores cached. Each batch is sized from the
+    measured cost per pair so that it finishes within `budget_ms`; once the budget is spent, the scored
+    prefix is reranked and the rest keep their dense order behind it, so the budget only ever costs quality.
+    """
+
+    def __init__(self, model, batch_size: int = 16, budget_ms: float = 150.0, max_chars: int = 2000,
+                 max_cache_entries: int = 4096):
+        self.model = model
+        self.batch_size = batch_size
+        self.budget = budget_ms / 1000.0
+        self.max_chars = max_chars
+        self.max_cache_entries = max_cache_entries
+        self._scores = OrderedDict()  # (normalized query, document ID, content hash) -> score
+        self._lock = threading.Lock()
+        self.seconds_per_pair = self._calibrate()
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        return self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+
+    def _calibrate(self) -> float:
+        """Seconds per pair of a full batch of maximum-length pairs, after a warm-up call"""
+        pairs = [("what reduces recidivism", "x " * (self.max_chars // 2))] * self.batch_size
+        try:
+            self._predict(pairs[:1])
+            started = time.perf_counter()
+            self._predict(pairs)
+            return (time.perf_counter() - started) / len(pairs)
+        except Exception as e:
+            logger.warning("Could not time the reranker, assuming 5 ms per pair: %s", e)
+            return 0.005
+
+    @staticmethod
+    def _key(query: str, item: Dict[str, Any]) -> Tuple:
+        return normalize_query(query), str(item.get("document_id")), hash(item.get("content", ""))
+
+    def _cached(self, keys: List[Tuple]) -> List[Any]:
+        with self._lock:
+            scores = [self._scores.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self._scores.move_to_end(key)
+            return scores
+
+    def _store(self, keys: List[Tuple], scores: np.ndarray):
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = float(score)
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_cache_entries:
+                self._scores.popitem(last=False)
+
+    def score(self, query: str, items: List[Dict[str, Any]]) -> Tuple[List[Any], bool]:
+        """Cross-encoder score of every item (None where unscored) and whether all were scored within budget"""
+        deadline = time.perf_counter() + self.budget
+        keys = [self._key(query, item) for item in items]
+        scores = self._cached(keys)
+        pending = [i for i, score in enumerate(scores) if score is None]
+
+        while pending:
+            # Only start as many pairs as should finish in time; a running batch cannot be interrupted
+            fits = int((deadline - time.perf_counter()) / max(self.seconds_per_pair, 1e-6))
+            if fits < 1:
+                return scores, False
+            batch, pending = pending[:min(self.batch_size, fits)], pending[min(self.batch_size, fits):]
+            started = time.perf_counter()
+            batch_scores = self._predict([(query, items[i].get("content", "")[:self.max_chars]) for i in batch])
+            # Follow the measured cost, which varies with passage length and machine load
+            self.seconds_per_pair = 0.8 * self.seconds_per_pair + 0.2 * (time.perf_counter() - started) / len(batch)
+            self._store([keys[i] for i in batch], batch_scores)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+        return scores, True
+
+    @timed("rerank")
+    def rerank(self, query: str, items: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """Return the top_k items by cross-encoder score; over budget, only the scored prefix is reordered"""
+        try:
+            scores, complete = self.score(query, items)
+        except Exception as e:
+            logger.exception("Reranking failed, keeping dense order: %s", e)
+            REGISTRY.increment("rag_rerank_total", 'result="error"')
+            return items[:top_k]
+
+        # Items are scored in dense order, so the scored ones lead; a cached score further down is left alone
+        scored = next((i for i, score in enumerate(scores) if score is None), len(scores))
+        if complete:
+            REGISTRY.increment("rag_rerank_total", 'result="ok"')
+        else:
+            logger.debug("Rerank budget of %.0f ms exceeded after %s of %s items", self.budget * 1000.0, scored, len(items))
+            REGISTRY.increment("rag_rerank_total", 'result="partial"' if scored else 'result="over_budget"')
+
+        order = sorted(range(scored), key=lambda i: scores[i], reverse=True) + list(range(scored, len(items)))
+        return [{**items[i], "rerank_score": scores[i]} if i < scored else items[i] for i in order[:top_k]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cached_scores": len(self._scores)}
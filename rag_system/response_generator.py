@@ -1,29 +1,12 @@
-from typing import List, Dict, Any
+import os
+import time
+from typing import List, Dict, Any, AsyncIterator, Tuple
+from .answer_cache import SemanticAnswerCache
+from .metrics import REGISTRY, timed, record_timing
+from .openai_client import SYSTEM_PROMPT
+from .prompt_budget import TokenCounter, PromptBudget
 
-class ResponseGenerator:
-    def __init__(self, openai_client):
-        self.openai_client = openai_client
-        
-    def build_prompt(self, query: str, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None):
-        """Build a prompt for the OpenAI model"""
-        # Format the context
-        context_text = ""
-        for idx, item in enumerate(context_items):
-            # Format filename to be more readable
-            readable_name = item['filename'].replace('_', ' ').replace('.pdf', '')
-            context_text += f"[Document {idx+1}: {readable_name}]\n{item['content']}\n\n"
-            
-        # Format conversation history if provided
-        history_text = ""
-        if conversation_history and len(conversation_history) > 0:
-            history_text = "Previous conversation:\n"
-            for msg in conversation_history:
-                role = "User" if msg["role"] == "user" else "Assistant"
-                history_text += f"{role}: {msg['content']}\n"
-            history_text += "\n"
-            
-        # Build the prompt
-        prompt = f"""You are a research specialist in criminology and recidivism studies analyzing academic literature.
+PROMPT_TEMPLATE = """You are a research specialist in criminology and recidivism studies analyzing academic literature.
 Answer the following question based ONLY on the provided research contexts.
 If the answer cannot be determined from the provided context, say "I don't have enough information to answer this question based on the provided research papers."
 
@@ -48,14 +31,126 @@ Think step by step before providing your final answer:
 4. Ensure all claims are properly cited
 
 ANSWER:"""
-        return prompt
+
+class ResponseGenerator:
+    def __init__(self, openai_client, answer_cache: SemanticAnswerCache = None):
+        self.openai_client = openai_client
+        
+        # Semantic answer cache for repeated and near-duplicate questions
+        if answer_cache is None and os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true":
+            answer_cache = SemanticAnswerCache(
+                similarity_threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+                ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+                max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+            )
+        self.answer_cache = answer_cache
+        
+        # Token budget for the prompt sent to OpenAI (context, history and the question)
+        self.token_counter = TokenCounter(os.getenv("OPENAI_MODEL", "gpt-4o"))
+        self.prompt_budget = PromptBudget(
+            self.token_counter,
+            max_prompt_tokens=int(os.getenv("PROMPT_MAX_TOKENS", "6000")),
+            history_tokens=int(os.getenv("PROMPT_HISTORY_TOKENS", "1000")),
+            history_message_tokens=int(os.getenv("PROMPT_HISTORY_MESSAGE_TOKENS", "300"))
+        )
+        self._fixed_tokens = self.token_counter.count(SYSTEM_PROMPT + PROMPT_TEMPLATE)
+        
+    def build_prompt(self, query: str, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None):
+        """Build a prompt for the OpenAI model"""
+        return self.assemble_prompt(query, context_items, conversation_history)[0]
+    
+    @timed("prompt_build")
+    def assemble_prompt(self, query: str, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None) -> Tuple[str, int]:
+        """Build the prompt within the token budget; returns (prompt, prompt tokens including the system prompt)"""
+        # Format conversation history if provided, newest turns first within the history budget
+        history_text = ""
+        history, dropped = self.prompt_budget.fit_history(conversation_history)
+        if history:
+            history_text = "Previous conversation:\n"
+            if dropped:
+                history_text += f"({dropped} earlier messages omitted)\n"
+            for msg in history:
+                role = "User" if msg["role"] == "user" else "Assistant"
+                history_text += f"{role}: {msg['content']}\n"
+            history_text += "\n"
+        
+        # Context gets whatever budget the fixed text, history and question leave
+        available = (
+            self.prompt_budget.max_prompt_tokens - self._fixed_tokens
+            - self.token_counter.count(history_text) - self.token_counter.count(query)
+        )
+        
+        # Format the context; documents keep their retrieval rank so citations match the returned sources
+        context_text = ""
+        for idx, item, content in self.prompt_budget.fit_context(context_items, available):
+            # Format filename to be more readable
+            readable_name = item['filename'].replace('_', ' ').replace('.pdf', '')
+            context_text += f"[Document {idx+1}: {readable_name}]\n{content}\n\n"
+        
+        prompt = PROMPT_TEMPLATE.format(history_text=history_text, context_text=context_text, query=query)
+        prompt_tokens = self.token_counter.count(SYSTEM_PROMPT) + self.token_counter.count(prompt)
+        REGISTRY.increment("rag_prompt_tokens_total", amount=prompt_tokens)
+        return prompt, prompt_tokens
+        
+    def get_cached_answer(self, query_embedding, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None):
+        """Return a cached answer for a near-duplicate question over the same documents, or None"""
+        if self.answer_cache is None or query_embedding is None:
+            return None
+        key = self.answer_cache.group_key(context_items, conversation_history)
+        return self.answer_cache.get(query_embedding, key)
+        
+    def cache_answer(self, query_embedding, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]], answer: str):
+        if self.answer_cache is None or query_embedding is None or not answer:
+            return
+        key = self.answer_cache.group_key(context_items, conversation_history)
+        self.answer_cache.put(query_embedding, key, answer)
+        
+    def generate_response(self, query: str, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None, query_embedding=None) -> Dict[str, Any]:
+        """Generate a response using OpenAI with retrieved context; returns the answer and whether it was cached"""
+        cached = self.get_cached_answer(query_embedding, context_items, conversation_history)
+        if cached is not None:
+            return {"answer": cached, "cache_hit": True, "prompt_tokens": 0}
         
-    def generate_response(self, query: str, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None):
-        """Generate a response using OpenAI with retrieved context"""
         # Build the prompt
-        prompt = self.build_prompt(query, context_items, conversation_history)
+        prompt, prompt_tokens = self.assemble_prompt(query, context_items, conversation_history)
         
         # Generate the response
-        response = self.openai_client.generate_completion(prompt)
+        with timed("openai"):
+            response = self.openai_client.generate_completion(prompt)
+        self.cache_answer(query_embedding, context_items, conversation_history, response)
+        
+        return {"answer": response, "cache_hit": False, "prompt_tokens": prompt_tokens}
+        
+    async def agenerate_response(self, query: str, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None, query_embedding=None) -> Dict[str, Any]:
+        """Generate a response without blocking the event loop (requires an AsyncOpenAIClient)"""
+        cached = self.get_cached_answer(query_embedding, context_items, conversation_history)
+        if cached is not None:
+            return {"answer": cached, "cache_hit": True, "prompt_tokens": 0}
+        
+        prompt, prompt_tokens = self.assemble_prompt(query, context_items, conversation_history)
+        
+        with timed("openai"):
+            response = await self.openai_client.agenerate_completion(prompt)
+        self.cache_answer(query_embedding, context_items, conversation_history, response)
+        
+        return {"answer": response, "cache_hit": False, "prompt_tokens": prompt_tokens}
+        
+    async def astream_response(self, query: str, context_items: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None, query_embedding=None, usage: Dict[str, int] = None) -> AsyncIterator[str]:
+        """Stream the response text as it is generated (requires an AsyncOpenAIClient); the full answer is cached at the end.
+
+        If a `usage` dict is passed, its "prompt_tokens" is set once the prompt is built.
+        """
+        prompt, prompt_tokens = self.assemble_prompt(query, context_items, conversation_history)
+        if usage is not None:
+            usage["prompt_tokens"] = prompt_tokens
+        
+        tokens = []
+        start = time.perf_counter()
+        async for token in self.openai_client.astream_completion(prompt):
+            if not tokens:
+                record_timing("openai_first_token", time.perf_counter() - start)
+            tokens.append(token)
+            yield token
+        record_timing("openai", time.perf_counter() - start)
         
-        return response
\ No newline at end of file
+        self.cache_answer(query_embedding, context_items, conversation_history, "".join(tokens))
\ No newline at end of file
@@ -1,151 +1,575 @@
 import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 import numpy as np
-from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
+from pymongo import MongoClient, AsyncMongoClient
 from dotenv import load_dotenv
+from .document_cache import DocumentCache, DOCUMENT_PROJECTION
+from .embedding_cache import EmbeddingCache, BatchingEncoder
+from .snippet_scorer import SnippetScorer
+from .reranker import CrossEncoderReranker, load_reranker_model
+from .onnx_encoder import OnnxQueryEncoder, DEFAULT_ONNX_ENCODER_PATH
+from .prompt_budget import TokenCounter
+from .metrics import REGISTRY, timed, record_timing, record_detail, is_speculative, run_in_executor
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "multi-qa-mpnet-base-dot-v1"
+
+# Retrieval depth per unit: up to top_k passages, but twice as many whole documents, since a document
+# contributes one snippet and may come back without content; adaptive depth cuts within the same maximum
+DOCUMENT_DEPTH_FACTOR = 2
+
+def get_mongo_collection(mongo_uri: str = None):
+    """Connect to MongoDB and return the research paper collection"""
+    mongo_uri = mongo_uri or os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MongoDB URI is required but not provided")
+
+    client = MongoClient(mongo_uri)
+    return client["Recidivism"]["Recidivism LLM"]
+
+def get_async_mongo_collection(mongo_uri: str = None):
+    """Connect to MongoDB with the asyncio driver and return the research paper collection"""
+    mongo_uri = mongo_uri or os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MongoDB URI is required but not provided")
+
+    client = AsyncMongoClient(mongo_uri)
+    return client["Recidivism"]["Recidivism LLM"]
+
+def load_embedding_model():
+    """Load the query encoder: the SentenceTransformer, or its int8 ONNX export with ENCODER_BACKEND=onnx"""
+    if os.getenv("ENCODER_BACKEND", "torch").lower() == "onnx":
+        return OnnxQueryEncoder(
+            os.getenv("ONNX_ENCODER_PATH", DEFAULT_ONNX_ENCODER_PATH),
+            threads=int(os.getenv("ONNX_THREADS", "0"))
+        )
+    # Imported here so the ONNX backend never loads PyTorch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
 class Retriever:
-    def __init__(self, vector_store):
+    def __init__(self, vector_store, embedding_model=None, collection=None, async_collection=None, reranker_model=None):
+        """Components that are slow to create can be built in parallel by the caller and passed in"""
         self.vector_store = vector_store
-        self.embedding_model = SentenceTransformer("multi-qa-mpnet-base-dot-v1")
+        self.embedding_model = embedding_model or load_embedding_model()
         
+        # Query embedding cache and micro-batching encoder shared by concurrent requests
+        self.embedding_cache = EmbeddingCache(
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+            path=os.getenv("EMBEDDING_CACHE_PATH") or None
+        )
+        self.encoder = BatchingEncoder(
+            self.embedding_model,
+            max_batch_size=int(os.getenv("ENCODER_MAX_BATCH", "32")),
+            max_wait_ms=float(os.getenv("ENCODER_BATCH_WAIT_MS", "5"))
+        )
+
         # MongoDB connection
         self.mongo_uri = os.getenv("MONGO_URI")
-        if not self.mongo_uri:
-            raise ValueError("MongoDB URI is required but not provided")
-            
-        self.client = MongoClient(self.mongo_uri)
-        self.db = self.client["Recidivism"]
-        self.collection = self.db["Recidivism LLM"]
-        print(f"MongoDB connection established to {self.mongo_uri}")
-        print(f"Collection document count: {self.collection.count_documents({})}")
-        
-    def retrieve_context(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Retrieve relevant context from the vector store"""
-        print(f"Retrieving context for query: {query}")
-        
+        self.collection = collection if collection is not None else get_mongo_collection(self.mongo_uri)
+        self.client = self.collection.database.client
+        self.db = self.collection.database
+        logger.info("MongoDB connection established")
+
+        # The async client binds to the running event loop, so unless one is passed in it is created on first use
+        self._async_collection = async_collection
+
+        # Bounded pool for CPU-bound encode/search/snippet work on the async path
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RETRIEVAL_WORKERS", "2")),
+            thread_name_prefix="retrieval"
+        )
+
+        # Local document cache in front of MongoDB
+        self.document_cache = DocumentCache(
+            self.collection,
+            max_bytes=int(os.getenv("DOC_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            # Set to a field the writer updates with the content (e.g. updated_at) to detect edits
+            version_field=os.getenv("DOC_CACHE_VERSION_FIELD") or None
+        )
+        if os.getenv("DOC_CACHE_WARM", "false").lower() == "true":
+            self.document_cache.warm(self.vector_store.doc_ids)
+        self.document_cache.start_revalidation(float(os.getenv("DOC_CACHE_REVALIDATE_SECONDS", "300")))
+
+        # Limit how many passages of the same paper can fill the context
+        self.max_passages_per_doc = int(os.getenv("MAX_PASSAGES_PER_DOC", "2"))
+
+        # Hybrid retrieval: dense and BM25 rankings are merged with reciprocal rank fusion
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+
+        # Document-level retrieval: best BM25 windows of each hit, stitched into one snippet
+        self.snippet_scorer = SnippetScorer(
+            window_chars=int(os.getenv("SNIPPET_WINDOW_CHARS", "1000")),
+            stride_chars=int(os.getenv("SNIPPET_STRIDE_CHARS", "200")),
+            max_cached_docs=int(os.getenv("SNIPPET_CACHE_DOCS", "256"))
+        )
+        self.snippets_per_doc = int(os.getenv("SNIPPETS_PER_DOC", "2"))
+
+        # Optional cross-encoder rerank of a deeper candidate list, cut to RERANK_TOP_K
+        self.reranker = None
+        if reranker_model is not None or os.getenv("RERANK_ENABLED", "false").lower() == "true":
+            self.reranker = CrossEncoderReranker(
+                reranker_model or load_reranker_model(),
+                batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+                budget_ms=float(os.getenv("RERANK_BUDGET_MS", "150")),
+                max_chars=int(os.getenv("RERANK_MAX_CHARS", "2000")),
+                max_cache_entries=int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+            )
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "20"))
+        self.rerank_top_k = int(os.getenv("RERANK_TOP_K", "5"))
+
+        # Adaptive depth: drop candidates scoring below where the dense scores fall off, then hydrate the
+        # rest in rank order, a few at a time, until the context holds ADAPTIVE_CONTEXT_TOKENS
+        self.adaptive_depth = os.getenv("RETRIEVAL_DEPTH", "fixed").lower() == "adaptive"
+        self.adaptive_min_depth = int(os.getenv("ADAPTIVE_MIN_DEPTH", "2"))
+        self.adaptive_relative_threshold = float(os.getenv("ADAPTIVE_RELATIVE_THRESHOLD", "0.85"))
+        self.adaptive_score_gap = float(os.getenv("ADAPTIVE_SCORE_GAP", "0.08"))
+        self.adaptive_context_tokens = int(os.getenv("ADAPTIVE_CONTEXT_TOKENS", "3000"))
+        self.adaptive_hydration_batch = int(os.getenv("ADAPTIVE_HYDRATION_BATCH", "2"))
+        self.token_counter = TokenCounter(os.getenv("OPENAI_MODEL", "gpt-4o")) if self.adaptive_depth else None
+
+    @property
+    def async_collection(self):
+        if self._async_collection is None:
+            self._async_collection = get_async_mongo_collection(self.mongo_uri)
+        return self._async_collection
+
+    def retrieve_context(self, query: str, top_k: int = 5, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Retrieve relevant context from the vector store, restricted to documents matching `filters` if given"""
+        logger.debug("Retrieving context for query: %s", query)
+
         try:
-            # Encode the query
-            query_embedding = self.embedding_model.encode([query]).astype(np.float32)
-            print(f"Generated query embedding with shape: {query_embedding.shape}")
-            
-            # Normalize the query vector
-            query_embedding = query_embedding / np.linalg.norm(query_embedding)
-            
-            # Search FAISS index
-            distances, indices = self.vector_store.search(query_embedding, top_k*2)
-            print(f"FAISS search returned {len(indices[0])} results")
-
-            context_items = []
-            
-            # Debugging - print first few doc IDs
-            print("Sample doc IDs from vector store:")
-            for i in range(min(5, len(self.vector_store.doc_ids))):
-                print(f"  {i}: {self.vector_store.doc_ids[i]} (type: {type(self.vector_store.doc_ids[i])})")
-            
-            # Instead of trying to look up by document ID, just retrieve some documents
-            print("Retrieving sample documents from MongoDB:")
-            sample_docs = list(self.collection.find({}).limit(3))
-            for doc in sample_docs:
-                print(f"  Sample doc ID: {doc['_id']} (type: {type(doc['_id'])})")
-                print(f"  Filename: {doc.get('filename', 'Unknown')}")
-            
-            print("Attempting to match vector store indices to MongoDB documents...")
-            
-            for i in range(min(len(indices[0]), top_k*2)):
-                idx = indices[0][i]
-                
-                # Safety check
-                if idx >= len(self.vector_store.doc_ids) or idx < 0:
-                    print(f"Index {idx} out of bounds for doc_ids array of length {len(self.vector_store.doc_ids)}")
-                    continue
-                
-                doc_id = self.vector_store.doc_ids[idx]
-                print(f"Looking up document with ID: {doc_id} (type: {type(doc_id)})")
-                
-                # Try different approaches to find the document
-                approaches = [
-                    {"_id": doc_id},  # Direct match
-                    {"_id": str(doc_id)},  # String conversion
-                    {"_id": {"$in": [doc_id, str(doc_id)]}}  # Try both
-                ]
-                
-                doc = None
-                for approach_num, query_filter in enumerate(approaches):
-                    doc = self.collection.find_one(query_filter)
-                    if doc:
-                        print(f"Found document using approach {approach_num+1}: {doc.get('filename', 'Unknown')}")
-                        break
-                
-                if not doc:
-                    print(f"Document with ID {doc_id} not found in MongoDB using any approach")
-                    continue
-                
-                # Process the document if found
-                filename = doc.get("filename", "Unknown document")
-                content = doc.get("content", "")
-                
-                if content:
-                    # Extract a relevant snippet
-                    text_snippet = content[:2000]  # Default to first 2000 chars
-                    keywords = [k for k in query.lower().split() if len(k) > 3]
-                    
-                    if keywords:
-                        print(f"Using keywords for snippet extraction: {keywords}")
-                        best_score = 0
-                        best_snippet = text_snippet
-                        
-                        for keyword in keywords:
-                            keyword_pos = content.lower().find(keyword.lower())
-                            if keyword_pos > 0:
-                                start = max(0, keyword_pos - 500)
-                                end = min(len(content), keyword_pos + 1500)
-                                snippet = content[start:end]
-                                
-                                # Count keyword occurrences
-                                score = sum(1 for k in keywords if k.lower() in snippet.lower())
-                                if score > best_score:
-                                    best_score = score
-                                    best_snippet = snippet
-                        
-                        if best_score > 0:
-                            print(f"Found better snippet with score {best_score}")
-                            text_snippet = best_snippet
-                    
-                    context_items.append({
-                        "document_id": doc_id,
-                        "filename": filename,
-                        "content": text_snippet,
-                        "score": float(distances[0][i])
-                    })
-                    print(f"Added document '{filename}' to context items")
-                else:
-                    print(f"Document has no content")
-            
-            # If no documents found, try a fallback approach
-            if not context_items:
-                print("No matching documents found, trying fallback approach")
-                random_docs = list(self.collection.aggregate([{"$sample": {"size": 3}}]))
-                
-                for doc in random_docs:
-                    if doc and "content" in doc:
-                        context_items.append({
-                            "document_id": doc["_id"],
-                            "filename": doc.get("filename", "Unknown document"),
-                            "content": doc["content"][:2000],
-                            "score": 0.5  # Arbitrary score
-                        })
-                        print(f"Added random document '{doc.get('filename', 'Unknown')}' to context items")
-            
-            print(f"Returning {len(context_items)} context items")
+            candidates = self._search_candidates(self.encode_query(query), top_k, query, filters)
+
+            if self.adaptive_depth:
+                context_items = self._rerank(query, self._hydrate_in_rank_order(query, candidates), top_k)
+            else:
+                # Hydrate the candidates the passage store did not cover with a single batched MongoDB query
+                with timed("mongo_hydration"):
+                    docs_by_id = self._fetch_documents(self._unhydrated_ids(candidates))
+                context_items = self._context_items(query, candidates, docs_by_id, top_k)
+
+            # If no documents found, try a fallback approach (random papers would ignore the filters)
+            if not context_items and not filters:
+                logger.info("No matching documents found, trying fallback approach")
+                random_docs = list(self.collection.aggregate(self._fallback_pipeline()))
+                context_items = self._fallback_items(random_docs)
+
+            logger.debug("Returning %s context items", len(context_items))
             return context_items
-            
+
         except Exception as e:
-            import traceback
-            print(f"Error in retrieve_context: {str(e)}")
-            traceback.print_exc()
-            return []  # Return empty list on error
\ No newline at end of file
+            logger.exception("Error in retrieve_context: %s", e)
+            return []  # Return empty list on error
+
+    async def aretrieve_context(self, query: str, top_k: int = 5, query_embedding: np.ndarray = None,
+                                filters: Dict[str, Any] = None, executor=None) -> List[Dict[str, Any]]:
+        """Async variant of retrieve_context: CPU work runs on the retrieval executor, MongoDB I/O on the async driver.
+
+        Background work passes its own `executor` so it never queues ahead of live requests.
+        """
+        executor = executor or self.executor
+        try:
+            if query_embedding is None:
+                query_embedding = await self.aencode_query(query)
+            candidates = await run_in_executor(executor, self._search_candidates, query_embedding, top_k, query, filters)
+
+            if self.adaptive_depth:
+                context_items = await self._ahydrate_in_rank_order(query, candidates, executor)
+                context_items = await run_in_executor(executor, self._rerank, query, context_items, top_k)
+            else:
+                with timed("mongo_hydration"):
+                    docs_by_id = await self.document_cache.aget_many(
+                        self._unhydrated_ids(candidates),
+                        self.async_collection
+                    )
+                context_items = await run_in_executor(
+                    executor, self._context_items, query, candidates, docs_by_id, top_k
+                )
+
+            if not context_items and not filters:
+                logger.info("No matching documents found, trying fallback approach")
+                cursor = await self.async_collection.aggregate(self._fallback_pipeline())
+                context_items = self._fallback_items(await cursor.to_list(length=None))
+
+            return context_items
+
+        except Exception as e:
+            logger.exception("Error in aretrieve_context: %s", e)
+            return []
+
+    async def aretrieve_context_batch(self, queries: List[str], top_k: int = 5, query_embeddings: np.ndarray = None,
+                                      filters: Dict[str, Any] = None) -> List[List[Dict[str, Any]]]:
+        """Retrieve context for many queries with one encode call, one multi-row FAISS search and one MongoDB query.
+
+        With adaptive depth each query is hydrated in rank order as aretrieve_context does, so a query
+        gets the same context in a batch as on its own.
+        """
+        if query_embeddings is None:
+            query_embeddings = await self.aencode_queries(queries)
+        candidate_lists = await run_in_executor(
+            self.executor, self._search_candidates_batch, query_embeddings, top_k, queries, filters
+        )
+
+        if self.adaptive_depth:
+            async def hydrate(query, candidates):
+                context_items = await self._ahydrate_in_rank_order(query, candidates, self.executor)
+                return await run_in_executor(self.executor, self._rerank, query, context_items, top_k)
+            context_lists = list(await asyncio.gather(*(
+                hydrate(query, candidates) for query, candidates in zip(queries, candidate_lists)
+            )))
+        else:
+            # Hydrate the union of every query's candidates at once
+            with timed("mongo_hydration"):
+                docs_by_id = await self.document_cache.aget_many(
+                    list(dict.fromkeys(
+                        doc_id for candidates in candidate_lists for doc_id in self._unhydrated_ids(candidates)
+                    )),
+                    self.async_collection
+                )
+
+            def build_all():
+                return [
+                    self._context_items(query, candidates, docs_by_id, top_k)
+                    for query, candidates in zip(queries, candidate_lists)
+                ]
+            context_lists = await run_in_executor(self.executor, build_all)
+
+        for i, context_items in enumerate(context_lists):
+            if not context_items and not filters:
+                logger.info("No matching documents found for batch query %s, trying fallback approach", i)
+                cursor = await self.async_collection.aggregate(self._fallback_pipeline())
+                context_lists[i] = self._fallback_items(await cursor.to_list(length=None))
+        return context_lists
+
+    async def aencode_queries(self, queries: List[str], priority: int = BatchingEncoder.BATCH_PRIORITY) -> np.ndarray:
+        """Encode many queries as an (n, dim) array through the batching encoder.
+
+        Cache misses queue at BATCH_PRIORITY by default, so a large batch is encoded in the gaps
+        between live requests instead of holding the model ahead of them.
+        """
+        with timed("encode"):
+            embeddings = [self.embedding_cache.get(query) for query in queries]
+            misses = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+            if misses:
+                vectors = await asyncio.gather(*(
+                    asyncio.wrap_future(self.encoder.submit(query, priority)) for query in misses
+                ))
+                encoded = dict(zip(misses, vectors))
+                for query, embedding in encoded.items():
+                    self.embedding_cache.put(query, embedding)
+                embeddings = [encoded[q] if e is None else e for q, e in zip(queries, embeddings)]
+        return np.stack(embeddings).astype(np.float32)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Return the L2-normalized query embedding as a (1, dim) float32 array, using the cache when possible"""
+        with timed("encode"):
+            query_embedding = self.embedding_cache.get(query)
+            if query_embedding is None:
+                query_embedding = self.encoder.encode(query)
+                self.embedding_cache.put(query, query_embedding)
+        return query_embedding.reshape(1, -1)
+
+    async def aencode_query(self, query: str) -> np.ndarray:
+        """Async variant of encode_query that awaits the batching encoder instead of blocking.
+
+        Speculative callers queue behind live requests rather than running the model alongside them.
+        """
+        priority = BatchingEncoder.SPECULATIVE_PRIORITY if is_speculative() else BatchingEncoder.LIVE_PRIORITY
+        with timed("encode"):
+            query_embedding = self.embedding_cache.get(query)
+            if query_embedding is None:
+                query_embedding = await asyncio.wrap_future(self.encoder.submit(query, priority))
+                self.embedding_cache.put(query, query_embedding)
+        return query_embedding.reshape(1, -1)
+
+    def _search_candidates(self, query_embedding: np.ndarray, top_k: int, query: str = None,
+                           filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Search FAISS and return ranked candidates (document ID, score and passage span if any)"""
+        return self._search_candidates_batch(query_embedding, top_k, [query], filters)[0]
+
+    def _search_candidates_batch(self, query_embeddings: np.ndarray, top_k: int, queries: List[str],
+                                 filters: Dict[str, Any] = None) -> List[List[Dict[str, Any]]]:
+        """Search FAISS for every query row at once and return each query's ranked candidates"""
+        # Hold one store for the whole lookup in case a new index version is swapped in meanwhile
+        vector_store = self.vector_store
+        if self.reranker is not None:
+            # Search deeper and let the reranker pick the final top_k
+            top_k = max(top_k, self.rerank_candidates)
+        passage_level = vector_store.passage_index is not None
+        row_filter = vector_store.row_filter(filters, passages=passage_level) if filters else None
+        with timed("faiss_search"):
+            if passage_level:
+                distances, indices = vector_store.search_passages(query_embeddings, top_k*2, row_filter)
+                build, max_depth = self._passage_candidates, top_k
+            else:
+                distances, indices = vector_store.search(query_embeddings, top_k*2, row_filter)
+                build, max_depth = self._document_candidates, top_k*DOCUMENT_DEPTH_FACTOR
+            candidate_lists = [
+                build(vector_store, indices[i], distances[i], max_depth, query, row_filter, query_embeddings[i:i+1])
+                for i, query in enumerate(queries)
+            ]
+
+        if vector_store.passage_store is not None:
+            with timed("passage_store"):
+                for candidates in candidate_lists:
+                    self._read_passage_store(vector_store.passage_store, candidates)
+        return candidate_lists
+
+    @staticmethod
+    def _read_passage_store(passage_store, candidates: List[Dict[str, Any]]):
+        """Fill in the filename and text of candidates from the on-disk passage store.
+
+        Rows added by index deltas since the store was built are left to MongoDB hydration.
+        """
+        for candidate in candidates:
+            row = candidate.get("passage_id", candidate["doc_idx"])
+            if row < len(passage_store) and candidate["doc_idx"] < passage_store.n_documents:
+                candidate["filename"] = passage_store.filename(candidate["doc_idx"])
+                candidate["content"] = passage_store.text(row)
+
+    @staticmethod
+    def _unhydrated_ids(candidates: List[Dict[str, Any]]) -> List[Any]:
+        """Document IDs of candidates that still need their content from MongoDB"""
+        return [c["document_id"] for c in candidates if "content" not in c]
+
+    def _fuse_lexical(self, vector_store, query: str, indices: np.ndarray, distances: np.ndarray, n: int, removed: set,
+                      row_filter=None, query_vector: np.ndarray = None):
+        """Merge the dense ranking with BM25 hits by reciprocal rank fusion; returns (rows, dense scores).
+
+        Rows are ordered by their fused score, but each keeps its dense similarity as its score (lexical-only
+        hits are scored against `query_vector`), so clients see a cosine rather than an RRF value. Rows
+        deleted by index deltas are dropped. Without a lexical index (or query text) the dense ranking
+        passes through unchanged.
+        """
+        dense = [(int(row), float(score)) for row, score in zip(indices, distances) if row >= 0 and int(row) not in removed]
+        if vector_store.lexical_index is None or not query:
+            return [row for row, _ in dense], [score for _, score in dense]
+
+        with timed("lexical_search"):
+            lexical_hits = vector_store.lexical_index.search(
+                query, n, allowed=row_filter.mask if row_filter is not None else None
+            )
+        lexical_rows = [int(row) for row, _ in lexical_hits if int(row) not in removed]
+
+        fused, scores = {}, dict(dense)
+        for rank, (row, _) in enumerate(dense):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        for rank, row in enumerate(lexical_rows):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        lexical_only = [row for row in lexical_rows if row not in scores]
+        if lexical_only and query_vector is not None:
+            passages = vector_store.passage_index is not None
+            scores.update(zip(lexical_only, vector_store.score_rows(query_vector, lexical_only, passages).tolist()))
+
+        ranked = sorted(fused, key=fused.get, reverse=True)
+        return ranked, [scores.get(row, 0.0) for row in ranked]
+
+    def _passage_candidates(self, vector_store, indices: np.ndarray, distances: np.ndarray, max_depth: int, query: str = None,
+                            row_filter=None, query_vector: np.ndarray = None) -> List[Dict[str, Any]]:
+        """Return up to max_depth ranked passages from one row of passage-index results"""
+        cutoff = self._adaptive_cutoff(indices, distances, max_depth) if self.adaptive_depth else None
+        indices, distances = self._fuse_lexical(
+            vector_store, query, indices, distances, len(indices), vector_store.removed_passages, row_filter, query_vector
+        )
+
+        # Keep passages in rank order, capping the number taken from any one paper
+        candidates = []
+        per_doc = {}
+        for passage_idx, score in zip(indices, distances):
+            if passage_idx >= len(vector_store.passages) or (cutoff is not None and score < cutoff):
+                continue
+
+            doc_idx, start, end = (int(v) for v in vector_store.passages[passage_idx])
+            if per_doc.get(doc_idx, 0) >= self.max_passages_per_doc:
+                continue
+            per_doc[doc_idx] = per_doc.get(doc_idx, 0) + 1
+
+            candidates.append({
+                "document_id": vector_store.doc_ids[doc_idx],
+                "doc_idx": doc_idx,
+                "passage_id": int(passage_idx),
+                "start": start,
+                "end": end,
+                "score": float(score)
+            })
+            if len(candidates) >= max_depth:
+                break
+
+        return candidates
+
+    def _document_candidates(self, vector_store, indices: np.ndarray, distances: np.ndarray, max_depth: int, query: str = None,
+                             row_filter=None, query_vector: np.ndarray = None) -> List[Dict[str, Any]]:
+        """Return up to max_depth ranked documents from one row of document-index results"""
+        cutoff = self._adaptive_cutoff(indices, distances, max_depth) if self.adaptive_depth else None
+        indices, distances = self._fuse_lexical(
+            vector_store, query, indices, distances, len(indices), vector_store.removed_docs, row_filter, query_vector
+        )
+
+        candidates = []
+        for i in range(min(len(indices), max_depth)):
+            idx = indices[i]
+
+            # FAISS pads short result lists with -1, which _fuse_lexical already dropped
+            if idx >= len(vector_store.doc_ids):
+                logger.warning("Index %s out of bounds for doc_ids array of length %s", idx, len(vector_store.doc_ids))
+                continue
+
+            if cutoff is not None and distances[i] < cutoff:
+                continue
+
+            candidates.append({
+                "document_id": vector_store.doc_ids[idx],
+                "doc_idx": int(idx),
+                "score": float(distances[i])
+            })
+
+        return candidates
+
+    def _adaptive_cutoff(self, indices: np.ndarray, distances: np.ndarray, max_depth: int) -> float:
+        """Lowest dense score worth hydrating, judged from the dense ranking (best first).
+
+        The dense ranking is cut before the first score below ADAPTIVE_RELATIVE_THRESHOLD times the best
+        one, or after a drop of more than ADAPTIVE_SCORE_GAP from the previous score, keeping at least
+        ADAPTIVE_MIN_DEPTH candidates; the cutoff is the last kept score. It is applied as a score bar
+        rather than a position because the fused ranking orders rows differently: every row the dense
+        test kept passes, and so does a lexical hit whose dense score is as high.
+        """
+        scores = [float(score) for idx, score in zip(indices, distances) if idx >= 0][:max_depth]
+        if not scores:
+            return -np.inf
+        depth = len(scores)
+        for rank in range(1, len(scores)):
+            if scores[0] > 0 and scores[rank] < scores[0] * self.adaptive_relative_threshold:
+                depth = rank
+                break
+            if scores[rank - 1] - scores[rank] > self.adaptive_score_gap:
+                depth = rank
+                break
+        return scores[min(len(scores), max(depth, self.adaptive_min_depth)) - 1]
+
+    def _context_items(self, query: str, candidates: List[Dict[str, Any]], docs_by_id: Dict[Any, Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """Build the context items and, with a reranker configured, reorder them and keep the best"""
+        return self._rerank(query, self._build_context_items(query, candidates, docs_by_id), top_k)
+
+    def _rerank(self, query: str, context_items: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        if self.reranker is not None and context_items:
+            context_items = self.reranker.rerank(query, context_items, min(top_k, self.rerank_top_k))
+        return context_items
+
+    def _build_batch(self, query: str, batch: List[Dict[str, Any]], docs_by_id: Dict[Any, Dict[str, Any]]):
+        """Context items of one hydration batch and their size in tokens"""
+        items = self._build_context_items(query, batch, docs_by_id)
+        return items, sum(self.token_counter.count(item["content"]) for item in items)
+
+    def _record_depth(self, candidates: List[Dict[str, Any]], hydrated: int):
+        """Report how deep adaptive retrieval went, per request and in the metrics"""
+        record_detail("retrieval_depth", hydrated)
+        record_detail("retrieval_candidates", len(candidates))
+        if is_speculative():
+            return
+        REGISTRY.increment("rag_retrieval_depth_total", f'depth="{hydrated}"')
+        REGISTRY.increment("rag_retrieval_candidates_skipped_total", amount=len(candidates) - hydrated)
+
+    def _hydrate_in_rank_order(self, query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Hydrate and build candidates a batch at a time, best first, until the context target is met"""
+        context_items, tokens, hydrated, hydration_seconds = [], 0, 0, 0.0
+        for offset in range(0, len(candidates), self.adaptive_hydration_batch):
+            batch = candidates[offset:offset + self.adaptive_hydration_batch]
+            start = time.perf_counter()
+            docs_by_id = self._fetch_documents(self._unhydrated_ids(batch))
+            hydration_seconds += time.perf_counter() - start
+            items, batch_tokens = self._build_batch(query, batch, docs_by_id)
+            context_items += items
+            tokens += batch_tokens
+            hydrated += len(batch)
+            if tokens >= self.adaptive_context_tokens:
+                break
+        record_timing("mongo_hydration", hydration_seconds)
+        self._record_depth(candidates, hydrated)
+        return context_items
+
+    async def _ahydrate_in_rank_order(self, query: str, candidates: List[Dict[str, Any]], executor) -> List[Dict[str, Any]]:
+        """Async variant of _hydrate_in_rank_order"""
+        context_items, tokens, hydrated, hydration_seconds = [], 0, 0, 0.0
+        for offset in range(0, len(candidates), self.adaptive_hydration_batch):
+            batch = candidates[offset:offset + self.adaptive_hydration_batch]
+            start = time.perf_counter()
+            docs_by_id = await self.document_cache.aget_many(self._unhydrated_ids(batch), self.async_collection)
+            hydration_seconds += time.perf_counter() - start
+            items, batch_tokens = await run_in_executor(executor, self._build_batch, query, batch, docs_by_id)
+            context_items += items
+            tokens += batch_tokens
+            hydrated += len(batch)
+            if tokens >= self.adaptive_context_tokens:
+                break
+        record_timing("mongo_hydration", hydration_seconds)
+        self._record_depth(candidates, hydrated)
+        return context_items
+
+    @timed("snippet_extraction")
+    def _build_context_items(self, query: str, candidates: List[Dict[str, Any]], docs_by_id: Dict[Any, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Turn ranked candidates and their hydrated documents into context items"""
+        context_items = []
+        for candidate in candidates:
+            doc_id = candidate["document_id"]
+            # Candidates read from the passage store carry their own filename and text
+            doc = candidate if "content" in candidate else docs_by_id.get(doc_id)
+            if not doc or not doc.get("content"):
+                logger.warning("Document with ID %s not found in MongoDB or has no content", doc_id)
+                continue
+
+            content = doc["content"]
+            item = {
+                "document_id": doc_id,
+                "filename": doc.get("filename", "Unknown document"),
+                "score": candidate["score"]
+            }
+            if "passage_id" in candidate:
+                item["passage_id"] = candidate["passage_id"]
+                item["start"] = candidate["start"]
+                item["end"] = candidate["end"]
+                # Passage store text is already the passage span
+                item["content"] = content if doc is candidate else content[candidate["start"]:candidate["end"]]
+            else:
+                item["content"] = self._select_snippet(query, content, doc_id)
+            context_items.append(item)
+
+        return context_items
+
+    def _select_snippet(self, query: str, content: str, doc_id: Any = None) -> str:
+        """Join the document's best-scoring windows, in document order"""
+        windows = self.snippet_scorer.top_windows(doc_id, content, query, n=self.snippets_per_doc)
+        return "\n...\n".join(content[start:end] for start, end, _ in sorted(windows))
+
+    def _fallback_pipeline(self) -> List[Dict[str, Any]]:
+        return [{"$sample": {"size": 3}}, {"$project": DOCUMENT_PROJECTION}]
+
+    def _fallback_items(self, random_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        context_items = []
+        for doc in random_docs:
+            if doc and "content" in doc:
+                context_items.append({
+                    "document_id": doc["_id"],
+                    "filename": doc.get("filename", "Unknown document"),
+                    "content": doc["content"][:2000],
+                    "score": 0.5  # Arbitrary score
+                })
+                logger.debug("Added random document '%s' to context items", doc.get('filename', 'Unknown'))
+        return context_items
+
+    def _fetch_documents(self, doc_ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """Fetch filename and content for doc_ids through the document cache, keyed by `_id`"""
+        if not doc_ids:
+            return {}
+
+        return self.document_cache.get_many(doc_ids)
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def new_session() -> Dict[str, Any]:
+    return {"history": [], "query_embedding": None}
+
+def record_turn(state: Dict[str, Any], query: str, answer: str,
+                query_embedding: Optional[np.ndarray] = None, max_messages: int = 20) -> Dict[str, Any]:
+    """Append a question/answer turn and keep its query embedding, which the next turn blends into its own"""
+    history = state.get("history", []) + [
+        {"role": "user", "content": query},
+        {"role": "assistant", "content": answer},
+    ]
+    state["history"] = history[-max_messages:]
+    if query_embedding is not None:
+        state["query_embedding"] = np.asarray(query_embedding, dtype=np.float32).reshape(-1).tolist()
+    return state
+
+class InMemorySessionStore:
+    """Per-process session store with TTL expiry and LRU eviction"""
+
+    def __init__(self, ttl_seconds: float = 3600, max_sessions: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (state, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            state, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return state
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        with self._lock:
+            self._sessions[session_id] = (state, time.monotonic() + self.ttl_seconds)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def update(self, session_id: str, update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]) -> Dict[str, Any]:
+        """Atomically replace the state with update(current state or None) and return it"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            current = entry[0] if entry is not None and entry[1] > time.monotonic() else None
+            state = update(dict(current) if current is not None else None)
+            self._sessions[session_id] = (state, time.monotonic() + self.ttl_seconds)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return state
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions)}
+
+class RedisSessionStore:
+    """Session store shared by all API workers, on any Redis-protocol server (Redis, Valkey, KeyDB)"""
+
+    def __init__(self, url: str, ttl_seconds: float = 3600, prefix: str = "rag:session:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        key = self.prefix + session_id
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        # Sliding expiry, like the in-memory store
+        self.client.expire(key, self.ttl_seconds)
+        return json.loads(raw)
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        self.client.set(self.prefix + session_id, json.dumps(state), ex=self.ttl_seconds)
+
+    def update(self, session_id: str, update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]) -> Dict[str, Any]:
+        """Atomically replace the state with update(current state or None) and return it.
+
+        Optimistic: the key is WATCHed, and if another worker writes it before the transaction runs,
+        the update is retried on the new state.
+        """
+        key = self.prefix + session_id
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    state = update(json.loads(raw) if raw is not None else None)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(state), ex=self.ttl_seconds)
+                    pipe.execute()
+                    return state
+                except self._watch_error:
+                    continue
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+def create_session_store():
+    """Redis-backed store when SESSION_STORE_URL is set, otherwise in-process"""
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    url = os.getenv("SESSION_STORE_URL")
+    if url:
+        logger.info("Using Redis session store")
+        return RedisSessionStore(url, ttl_seconds=ttl_seconds)
+    return InMemorySessionStore(ttl_seconds=ttl_seconds, max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "10000")))
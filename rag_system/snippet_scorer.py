@@ -0,0 +1,112 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Tuple, Any
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+class _DocumentTerms:
+    """Positional postings for one document: character offsets of every token, grouped by term"""
+
+    def __init__(self, content: str):
+        self.term_index = {}
+        term_ids, offsets = [], []
+        for match in TOKEN_PATTERN.finditer(content.lower()):
+            term_ids.append(self.term_index.setdefault(match.group(), len(self.term_index)))
+            offsets.append(match.start())
+
+        self.length = len(content)
+        self.token_offsets = np.asarray(offsets, dtype=np.int64)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+
+        # CSR layout: offsets of term i are postings[bounds[i]:bounds[i + 1]], in document order
+        order = np.argsort(term_ids, kind="stable")
+        self.postings = self.token_offsets[order]
+        self.bounds = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(self.term_index)))])
+
+    def positions(self, term: str) -> np.ndarray:
+        i = self.term_index.get(term)
+        if i is None:
+            return self.postings[:0]
+        return self.postings[self.bounds[i]:self.bounds[i + 1]]
+
+class SnippetScorer:
+    """BM25 scoring of sliding character windows over a document, tokenized once and cached.
+
+    Every window is scored in one vectorized pass (term counts come from binary searches over each
+    query term's positions), and the best non-overlapping windows are returned.
+    """
+
+    def __init__(self, window_chars: int = 1000, stride_chars: int = 200, max_cached_docs: int = 256,
+                 k1: float = 1.2):
+        self.window_chars = window_chars
+        self.stride_chars = stride_chars
+        self.max_cached_docs = max_cached_docs
+        self.k1 = k1
+        self._documents = OrderedDict()  # (doc_id, content hash) -> _DocumentTerms
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def query_terms(query: str) -> List[str]:
+        """Distinct query words longer than three characters"""
+        return list(dict.fromkeys(t for t in TOKEN_PATTERN.findall(query.lower()) if len(t) > 3))
+
+    def _terms(self, doc_id: Any, content: str) -> _DocumentTerms:
+        # str caches its hash, so repeated lookups for the same cached document are O(1)
+        key = (str(doc_id), hash(content))
+        with self._lock:
+            terms = self._documents.get(key)
+            if terms is not None:
+                self._documents.move_to_end(key)
+                return terms
+
+        terms = _DocumentTerms(content)
+        with self._lock:
+            self._documents[key] = terms
+            while len(self._documents) > self.max_cached_docs:
+                self._documents.popitem(last=False)
+        return terms
+
+    def top_windows(self, doc_id: Any, content: str, query: str, n: int = 2) -> List[Tuple[int, int, float]]:
+        """Return up to n non-overlapping (start, end, score) windows, best first.
+
+        Falls back to the opening window when no query term occurs in the document.
+        """
+        opening = [(0, min(len(content), self.window_chars), 0.0)]
+        terms = self.query_terms(query)
+        if not terms or not content:
+            return opening
+
+        doc = self._terms(doc_id, content)
+        if not len(doc.token_offsets):
+            return opening
+
+        # Candidate windows start on a token, roughly every stride_chars characters
+        grid = np.arange(0, max(1, doc.length - self.window_chars + self.stride_chars), self.stride_chars)
+        starts = np.unique(doc.token_offsets[np.minimum(np.searchsorted(doc.token_offsets, grid), len(doc.token_offsets) - 1)])
+        ends = starts + self.window_chars
+
+        # tf[t, w] = occurrences of term t inside window w
+        tf = np.zeros((len(terms), len(starts)), dtype=np.float32)
+        for row, term in enumerate(terms):
+            positions = doc.positions(term)
+            if len(positions):
+                tf[row] = np.searchsorted(positions, ends) - np.searchsorted(positions, starts)
+        if not tf.any():
+            return opening
+
+        # Windows have the same length, so BM25's length normalization is constant and drops out
+        df = (tf > 0).sum(axis=1, keepdims=True)
+        idf = np.log1p((len(starts) - df + 0.5) / (df + 0.5))
+        scores = (idf * tf * (self.k1 + 1) / (tf + self.k1)).sum(axis=0)
+
+        windows = []
+        for _ in range(n):
+            best = int(np.argmax(scores))
+            if scores[best] <= 0:
+                break
+            start = int(starts[best])
+            windows.append((start, min(doc.length, start + self.window_chars), float(scores[best])))
+            scores[np.abs(starts - start) < self.window_chars] = -np.inf
+        return windows or opening
@@ -1,18 +1,203 @@
 import os
+import json
 import faiss
+import logging
 import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 import numpy as np
+from bson import ObjectId
 from dotenv import load_dotenv
+from .lexical_index import LexicalIndex
+from .passage_store import PassageStore
+from .doc_metadata import DocumentAttributes, METADATA_FIELDS
+from .atomic_io import write_atomic
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def normalize_doc_id(doc_id):
+    """Normalize a document ID to the type used for MongoDB `_id` lookups"""
+    if isinstance(doc_id, str) and ObjectId.is_valid(doc_id):
+        return ObjectId(doc_id)
+    return doc_id
+
+# Passage-level artifacts written next to doc_ids.pkl by rag_system.ingest
+PASSAGE_INDEX_FILENAME = "passages.index"
+PASSAGES_FILENAME = "passages.npy"
+
+# Zero-copy document ID file (raw 12-byte ObjectIds) preferred over doc_ids.pkl
+DOC_IDS_NPY_FILENAME = "doc_ids.npy"
+
+# Incremental updates written by `python -m rag_system.index_updater`
+MANIFEST_FILENAME = "index_manifest.json"
+DELTA_DIRNAME = "deltas"
+
+def read_faiss_index(path: str, mmap: bool = True):
+    """Read a FAISS index, memory-mapping it when FAISS_MMAP is enabled and the index type supports it"""
+    if mmap and os.getenv("FAISS_MMAP", "true").lower() == "true":
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+        except RuntimeError as e:
+            logger.warning("Memory-mapped load of %s failed, reading it into memory: %s", path, e)
+    return faiss.read_index(path)
+
+# ANN and compressed (sq8: 1 byte per dimension, pq: pq_m bytes per vector) index variants built by
+# `python -m rag_system.index_builder`, selected with INDEX_TYPE
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq8", "ivf_sq8", "pq")
+
+def index_variant_path(index_path: str, index_type: str) -> str:
+    """Path of the `index_type` variant of a flat index file (flat is the file itself)"""
+    if index_type == "flat":
+        return index_path
+    base, ext = os.path.splitext(index_path)
+    return f"{base}.{index_type}{ext}"
+
+def tuning_path(index_path: str) -> str:
+    """Path of the search-parameter tuning saved next to an index file"""
+    return os.path.splitext(index_path)[0] + ".tuning.json"
+
+def apply_search_params(index, params: dict):
+    """Set search-time parameters such as nprobe or efSearch on an index"""
+    if not params:
+        return
+    parameter_space = faiss.ParameterSpace()
+    for name, value in params.items():
+        parameter_space.set_index_parameter(index, name, value)
+
+def load_tuned_index(index_path: str, index_type: str = None, mmap: bool = True, rows: int = None):
+    """Load the configured variant of an index and apply its saved (or env-overridden) search parameters.
+
+    `rows` is the number of base rows the index must hold; a variant built before the flat index was
+    rewritten (e.g. by compaction) holds a different number, and the flat index is used instead.
+    """
+    index_type = index_type or os.getenv("INDEX_TYPE", "flat").lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE {index_type!r}, expected one of {INDEX_TYPES}")
+
+    path = index_variant_path(index_path, index_type)
+    if not os.path.exists(path):
+        logger.warning("%s index not found at %s, falling back to the flat index", index_type, path)
+        path = index_path
+    index = read_faiss_index(path, mmap=mmap)
+    if path != index_path and rows is not None and index.ntotal != rows:
+        logger.warning("%s holds %s vectors but the index has %s rows, falling back to the flat index; "
+                       "rebuild it with rag_system.index_builder", path, index.ntotal, rows)
+        path = index_path
+        index = read_faiss_index(path, mmap=mmap)
+
+    params = {}
+    if os.path.exists(tuning_path(path)):
+        with open(tuning_path(path)) as f:
+            params = json.load(f).get("search_params", {})
+    for name, env_var in (("nprobe", "FAISS_NPROBE"), ("efSearch", "FAISS_EF_SEARCH")):
+        if os.getenv(env_var):
+            params[name] = int(os.getenv(env_var))
+    if path != index_path:
+        apply_search_params(index, params)
+        logger.info("Loaded %s with search parameters %s", path, params)
+    return index
+
+def read_manifest(data_dir: str) -> dict:
+    """Index version, base directory and applied delta files, or version 0 with no deltas for a freshly built index"""
+    path = os.path.join(data_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {"version": 0, "deltas": []}
+    with open(path) as f:
+        return json.load(f)
+
+def manifest_base_dir(data_dir: str, manifest: dict) -> str:
+    """Directory holding the base index files of a manifest: data_dir itself until a compaction has
+    written a new base under it (the manifest's "base" subdirectory)"""
+    return os.path.join(data_dir, manifest["base"]) if manifest.get("base") else data_dir
+
+def write_manifest(data_dir: str, manifest: dict):
+    """Atomically replace the manifest, which is what makes a new index version visible"""
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+    write_atomic(os.path.join(data_dir, MANIFEST_FILENAME), write)
+
+def add_vectors(index, vectors: np.ndarray, start_id: int):
+    """Append vectors under the sequential IDs start_id, start_id + 1, ..."""
+    ids = np.arange(start_id, start_id + len(vectors), dtype=np.int64)
+    if faiss.try_extract_index_ivf(index) is not None:
+        index.add_with_ids(vectors, ids)
+    else:
+        # Flat and HNSW indexes only assign sequential IDs, which is what we ask for
+        if index.ntotal != start_id:
+            raise ValueError(f"Index has {index.ntotal} vectors, cannot append at ID {start_id}")
+        index.add(vectors)
+
+def remove_vectors(index, ids) -> bool:
+    """Remove IDs from indexes that keep the remaining IDs stable (IVF); returns False otherwise.
+
+    Removed rows must still be tracked by the caller: the lexical index and passage store keep them.
+    """
+    if faiss.try_extract_index_ivf(index) is None or not len(ids):
+        return False
+    index.remove_ids(np.asarray(sorted(ids), dtype=np.int64))
+    return True
+
+class RowFilter:
+    """Index rows allowed by a metadata filter, as a mask, a row list and a FAISS bitmap selector"""
+
+    def __init__(self, mask: np.ndarray):
+        self.mask = mask
+        self.rows = np.flatnonzero(mask)
+        # The selector reads this buffer, so it must live as long as the selector does
+        self._bitmap = np.packbits(mask, bitorder="little")
+        self.selector = faiss.IDSelectorBitmap(len(self._bitmap), faiss.swig_ptr(self._bitmap))
+
+    def __len__(self):
+        return len(self.rows)
+
+def selector_search_params(index, selector, selectivity: float = 1.0):
+    """SearchParameters restricting `index` to `selector`.
+
+    The tuned nprobe/efSearch are widened by 1/selectivity, so roughly as many allowed candidates
+    are examined as an unfiltered search would examine in total, and recall holds up.
+    """
+    widen = 1.0 / max(selectivity, 1e-6)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, int(np.ceil(ivf.nprobe * widen))))
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=min(index.ntotal, int(np.ceil(index.hnsw.efSearch * widen))))
+    return faiss.SearchParameters(sel=selector)
+
+class DocIdArray:
+    """Read-only sequence of ObjectIds backed by a memory-mapped (n, 12) uint8 array"""
+    def __init__(self, raw: np.ndarray):
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return ObjectId(self.raw[idx].tobytes())
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def save_doc_ids_npy(doc_ids, path: str):
+    """Write ObjectId document IDs as a (n, 12) uint8 array that DocIdArray can memory-map"""
+    raw = np.frombuffer(b"".join(ObjectId(str(doc_id)).binary for doc_id in doc_ids), dtype=np.uint8).reshape(-1, 12)
+    with open(path, "wb") as f:
+        np.save(f, raw)
+
 class FAISSVectorStore:
-    def __init__(self):
+    def __init__(self, index_type: str = None):
         # Get path from environment variable or use default
         vector_db_path = os.getenv("VECTOR_DB_PATH", "./data/vector_store.index")
-        print(f"VECTOR_DB_PATH from env: {vector_db_path}")
-        print(f"Current working directory: {os.getcwd()}")
+        logger.debug("VECTOR_DB_PATH from env: %s", vector_db_path)
+        logger.debug("Current working directory: %s", os.getcwd())
         
         # Try different paths to find the index file
         possible_paths = [
@@ -31,15 +216,17 @@ class FAISSVectorStore:
         # Try each path to find the files
         for path in possible_paths:
             if os.path.exists(path):
-                print(f"Found vector store index at: {path}")
+                logger.debug("Found vector store index at: %s", path)
                 self.index_path = path
-                self.doc_ids_path = os.path.join(os.path.dirname(path), "doc_ids.pkl")
+                self.doc_ids_path = os.path.join(os.path.dirname(path), DOC_IDS_NPY_FILENAME)
+                if not os.path.exists(self.doc_ids_path):
+                    self.doc_ids_path = os.path.join(os.path.dirname(path), "doc_ids.pkl")
                 
                 if os.path.exists(self.doc_ids_path):
-                    print(f"Found doc_ids at: {self.doc_ids_path}")
+                    logger.debug("Found doc_ids at: %s", self.doc_ids_path)
                     break
                 else:
-                    print(f"doc_ids.pkl not found at expected location: {self.doc_ids_path}")
+                    logger.debug("doc_ids not found at expected location: %s", self.doc_ids_path)
                     self.index_path = None  # Reset if doc_ids not found
         
         if not self.index_path or not os.path.exists(self.index_path):
@@ -48,47 +235,265 @@ class FAISSVectorStore:
         if not self.doc_ids_path or not os.path.exists(self.doc_ids_path):
             raise FileNotFoundError(f"Document IDs not found at {self.doc_ids_path}")
         
+        # Deltas are applied in memory on top of the base files the manifest points to; VECTOR_DB_PATH
+        # only locates the data directory once a compaction has published a new base
+        data_dir = os.path.dirname(self.index_path)
+        manifest = read_manifest(data_dir)
+        self.version = manifest["version"]
+        self.data_dir = data_dir
+        self.base_dir = manifest_base_dir(data_dir, manifest)
+        if self.base_dir != data_dir:
+            self.index_path = os.path.join(self.base_dir, os.path.basename(self.index_path))
+            self.doc_ids_path = os.path.join(self.base_dir, DOC_IDS_NPY_FILENAME)
+        mmap = not manifest["deltas"]
+        
         # Load the index and document IDs
         try:
-            print(f"Loading FAISS index from {self.index_path}")
-            self.index = faiss.read_index(self.index_path)
-            print(f"Index loaded with {self.index.ntotal} vectors")
+            logger.debug("Loading doc_ids from %s", self.doc_ids_path)
+            if self.doc_ids_path.endswith(".npy"):
+                self.doc_ids = DocIdArray(np.load(self.doc_ids_path, mmap_mode="r"))
+            else:
+                with open(self.doc_ids_path, "rb") as f:
+                    self.doc_ids = [normalize_doc_id(doc_id) for doc_id in pickle.load(f)]
+            logger.info("Loaded %s document IDs", len(self.doc_ids))
+            
+            logger.debug("Loading FAISS index from %s", self.index_path)
+            self.index = load_tuned_index(self.index_path, index_type, mmap=mmap, rows=len(self.doc_ids))
+            logger.info("Index loaded with %s vectors", self.index.ntotal)
+            
+            # doc_info is only needed by offline tooling, so it is loaded on first access
+            self._doc_info = None
+            self._doc_info_loaded = False
+            self._delta_doc_info = []
             
-            print(f"Loading doc_ids from {self.doc_ids_path}")
-            with open(self.doc_ids_path, "rb") as f:
-                self.doc_ids = pickle.load(f)
-            print(f"Loaded {len(self.doc_ids)} document IDs")
+            # Load the passage-level index written by `python -m rag_system.ingest` if available
+            self.passage_index = None
+            self.passages = None
+            passage_index_path = os.path.join(self.base_dir, PASSAGE_INDEX_FILENAME)
+            passages_path = os.path.join(self.base_dir, PASSAGES_FILENAME)
+            if os.getenv("RETRIEVAL_UNIT", "passage") == "passage" and os.path.exists(passage_index_path) and os.path.exists(passages_path):
+                logger.debug("Loading passage index from %s", passage_index_path)
+                self.passages = np.load(passages_path, mmap_mode="r")
+                self.passage_index = load_tuned_index(passage_index_path, index_type, mmap=mmap, rows=len(self.passages))
+                logger.info("Loaded %s passages", len(self.passages))
+            
+            # Unit text for hydration without MongoDB, built by `python -m rag_system.passage_store`;
+            # it covers the base rows only, so it is checked against them before any delta is applied
+            self.passage_store = None
+            if os.getenv("PASSAGE_STORE", "true").lower() == "true":
+                level = "passages" if self.passage_index is not None else "documents"
+                self.passage_store = PassageStore.load(self.base_dir, level)
+                base_rows = len(self.passages) if self.passage_index is not None else len(self.doc_ids)
+                if self.passage_store is not None and (len(self.passage_store) != base_rows
+                                                       or self.passage_store.n_documents != len(self.doc_ids)):
+                    logger.warning("Passage store has %s %s but the index has %s; rebuild it with "
+                                   "rag_system.passage_store", len(self.passage_store), level, base_rows)
+                    self.passage_store = None
+                elif self.passage_store is not None:
+                    logger.info("Loaded passage store of %s %s (%.1f MB, %s)", len(self.passage_store), level,
+                                self.passage_store.nbytes() / 2**20, self.passage_store.compression)
+            
+            # Rows deleted by deltas, whatever the index type; filtered out of dense and lexical results
+            self.removed_docs = set()
+            self.removed_passages = set()
+            
+            # Metadata filters: columnar attributes are built from doc_info on the first filtered search,
+            # and the row filters of recent filter values are kept so repeated filters cost nothing
+            self._attributes = None
+            self._row_filters = OrderedDict()
+            self._filter_lock = threading.Lock()
+            self.filter_exact_max_rows = int(os.getenv("FILTER_EXACT_MAX_ROWS", "4096"))
+            for delta_file in manifest["deltas"]:
+                self.apply_delta(os.path.join(data_dir, delta_file))
+            if manifest["deltas"]:
+                logger.info("Applied %s index deltas (version %s)", len(manifest["deltas"]), self.version)
+            
+            # BM25 index over the same retrieval unit, built by `python -m rag_system.lexical_index`
+            self.lexical_index = None
+            if os.getenv("HYBRID_SEARCH", "true").lower() == "true":
+                self.lexical_index = LexicalIndex.load(self.base_dir, "passages" if self.passage_index is not None else "documents")
+                if self.lexical_index is not None:
+                    logger.info("Loaded lexical index over %s %s", len(self.lexical_index), self.lexical_index.unit)
+                
+        except Exception as e:
+            logger.exception("Error loading FAISS index or document IDs: %s", e)
+            raise
             
-            # Try to load doc_info if available
+    @property
+    def doc_info(self):
+        """Document info from doc_info.pkl, loaded lazily (None if unavailable)"""
+        if not self._doc_info_loaded:
+            self._doc_info_loaded = True
             try:
-                doc_info_path = os.path.join(os.path.dirname(self.index_path), "doc_info.pkl")
+                doc_info_path = os.path.join(self.base_dir, "doc_info.pkl")
                 if os.path.exists(doc_info_path):
-                    print(f"Loading doc_info from {doc_info_path}")
+                    logger.debug("Loading doc_info from %s", doc_info_path)
                     with open(doc_info_path, "rb") as f:
-                        self.doc_info = pickle.load(f)
-                    print(f"Loaded document info for {len(self.doc_info)} documents")
+                        self._doc_info = pickle.load(f)
+                    logger.info("Loaded document info for %s documents", len(self._doc_info))
                 else:
-                    print("No doc_info.pkl found")
-                    self.doc_info = None
+                    logger.info("No doc_info.pkl found")
             except Exception as e:
-                print(f"Error loading doc_info: {str(e)}")
-                self.doc_info = None
-                
-        except Exception as e:
-            import traceback
-            print(f"Error loading FAISS index or document IDs: {str(e)}")
-            traceback.print_exc()
-            raise
+                logger.warning("Error loading doc_info: %s", e)
+            if self._delta_doc_info:
+                self._doc_info = (self._doc_info or []) + self._delta_doc_info
+        return self._doc_info
+    
+    def apply_delta(self, path: str):
+        """Apply one delta written by rag_system.index_updater: append new documents, drop removed ones"""
+        with np.load(path, allow_pickle=False) as delta:
+            added_ids = [ObjectId(raw.tobytes()) for raw in delta["doc_ids"]]
+            removed_ids = {ObjectId(raw.tobytes()) for raw in delta["removed_doc_ids"]}
+            filenames = [str(name) for name in delta["filenames"]]
+            doc_vectors = delta["doc_vectors"]
+            passages = delta["passages"]
+            passage_vectors = delta["passage_vectors"]
+            # Deltas written before metadata filtering carry no metadata columns
+            metadata = {field: delta[field].tolist() for field in METADATA_FIELDS if field in delta.files}
+        
+        if added_ids:
+            add_vectors(self.index, doc_vectors, len(self.doc_ids))
+            self.doc_ids = list(self.doc_ids) + added_ids
+            for i, (doc_id, name) in enumerate(zip(added_ids, filenames)):
+                info = {"id": doc_id, "filename": name}
+                info.update({field: values[i] or None for field, values in metadata.items()})
+                self._delta_doc_info.append(info)
+            if self.passage_index is not None and len(passages):
+                add_vectors(self.passage_index, passage_vectors, len(self.passages))
+                self.passages = np.concatenate([self.passages, passages])
+        
+        if removed_ids:
+            removed_docs = {idx for idx, doc_id in enumerate(self.doc_ids) if doc_id in removed_ids}
+            # IVF indexes drop the vectors in place; the rows are recorded either way
+            remove_vectors(self.index, removed_docs)
+            self.removed_docs |= removed_docs
+            if self.passage_index is not None:
+                rows = np.flatnonzero(np.isin(self.passages[:, 0], list(removed_docs)))
+                remove_vectors(self.passage_index, rows)
+                self.removed_passages.update(int(row) for row in rows)
+    
+    @property
+    def attributes(self) -> DocumentAttributes:
+        """Columnar document metadata aligned with doc_ids"""
+        if self._attributes is None:
+            self._attributes = DocumentAttributes.from_doc_info(self.doc_ids, self.doc_info)
+        return self._attributes
+    
+    def row_filter(self, filters: Dict[str, Any], passages: bool = False) -> Optional[RowFilter]:
+        """Rows of the document (or passage) index matching `filters`; None when no filter is set"""
+        key = (passages, tuple(sorted((k, str(v)) for k, v in filters.items())))
+        with self._filter_lock:
+            row_filter = self._row_filters.get(key)
+            if row_filter is not None:
+                self._row_filters.move_to_end(key)
+                return row_filter
+        
+        doc_mask = self.attributes.mask(filters)
+        if doc_mask is None:
+            return None
+        doc_mask[list(self.removed_docs)] = False
+        if passages:
+            mask = doc_mask[np.asarray(self.passages)[:, 0]]
+            mask[list(self.removed_passages)] = False
+        else:
+            mask = doc_mask
+        row_filter = RowFilter(mask)
+        
+        with self._filter_lock:
+            self._row_filters[key] = row_filter
+            while len(self._row_filters) > 64:
+                self._row_filters.popitem(last=False)
+        return row_filter
+    
+    def _reconstruct_rows(self, index, rows: np.ndarray) -> np.ndarray:
+        try:
+            return index.reconstruct_batch(rows)
+        except RuntimeError:
+            # IVF indexes can only reconstruct by ID once they keep a direct map; a hashtable one,
+            # since rows removed by deltas leave the IDs non-sequential
+            ivf = faiss.try_extract_index_ivf(index)
+            if ivf is None:
+                raise
+            with self._filter_lock:
+                if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            return index.reconstruct_batch(rows)
+    
+    def score_rows(self, query_vector: np.ndarray, rows, passages: bool = False) -> np.ndarray:
+        """Dense similarity of one (1, dim) query to the given rows of the document (or passage) index"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return np.zeros(0, dtype=np.float32)
+        index = self.passage_index if passages else self.index
+        return (query_vector @ self._reconstruct_rows(index, rows).T).reshape(-1)
+    
+    def _search_rows(self, index, query_vector: np.ndarray, top_k: int, rows: np.ndarray):
+        """Exact inner-product search over a small set of rows, reconstructing their vectors"""
+        vectors = self._reconstruct_rows(index, rows)
+        scores = query_vector @ vectors.T
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+        out_distances = np.full((len(query_vector), top_k), -np.inf, dtype=np.float32)
+        out_indices = np.full((len(query_vector), top_k), -1, dtype=np.int64)
+        out_distances[:, :k] = np.take_along_axis(scores, top, axis=1)
+        out_indices[:, :k] = rows[top]
+        return out_distances, out_indices
+    
+    def _search_filtered(self, index, query_vector: np.ndarray, top_k: int, row_filter: RowFilter):
+        """Search only the rows allowed by a filter.
+
+        Selective filters are scored exactly over the allowed rows, which is cheaper than the full
+        search and, unlike graph or inverted-list search, never runs out of matches; broader ones
+        go through FAISS with a bitmap IDSelector so excluded rows are skipped inside the scan.
+        Removed rows are already excluded from the filter.
+        """
+        if not len(row_filter):
+            return (np.full((len(query_vector), top_k), -np.inf, dtype=np.float32),
+                    np.full((len(query_vector), top_k), -1, dtype=np.int64))
+        if len(row_filter) <= self.filter_exact_max_rows:
+            return self._search_rows(index, query_vector, top_k, row_filter.rows)
+        params = selector_search_params(index, row_filter.selector, len(row_filter) / max(1, index.ntotal))
+        return index.search(query_vector, top_k, params=params)
+    
+    @staticmethod
+    def _search_excluding(index, query_vector: np.ndarray, top_k: int, removed: set):
+        """Search, over-fetching by the number of removed rows and dropping them from the results"""
+        if not removed:
+            return index.search(query_vector, top_k)
+        distances, indices = index.search(query_vector, top_k + len(removed))
+        keep = ~np.isin(indices, list(removed))
+        out_distances = np.full((len(indices), top_k), -np.inf, dtype=np.float32)
+        out_indices = np.full((len(indices), top_k), -1, dtype=np.int64)
+        for row in range(len(indices)):
+            kept = np.flatnonzero(keep[row])[:top_k]
+            out_distances[row, :len(kept)] = distances[row, kept]
+            out_indices[row, :len(kept)] = indices[row, kept]
+        return out_distances, out_indices
             
-    def search(self, query_vector: np.ndarray, top_k: int = 5):
-        """Search the FAISS index for similar vectors"""
-        print(f"Searching FAISS index with vector of shape {query_vector.shape}")
+    def search_passages(self, query_vector: np.ndarray, top_k: int = 5, row_filter: RowFilter = None):
+        """Search the passage-level FAISS index; indices refer to rows of `self.passages`"""
+        if row_filter is not None:
+            return self._search_filtered(self.passage_index, query_vector, top_k, row_filter)
+        return self._search_excluding(self.passage_index, query_vector, top_k, self.removed_passages)
+            
+    def search(self, query_vector: np.ndarray, top_k: int = 5, row_filter: RowFilter = None):
+        """Search the FAISS index for similar vectors, restricted to `row_filter` rows if given"""
+        logger.debug("Searching FAISS index with vector of shape %s", query_vector.shape)
         try:
-            distances, indices = self.index.search(query_vector, top_k)
-            print(f"Search returned {len(indices[0])} results")
+            if row_filter is not None:
+                return self._search_filtered(self.index, query_vector, top_k, row_filter)
+            distances, indices = self._search_excluding(self.index, query_vector, top_k, self.removed_docs)
+            logger.debug("Search returned %s results", len(indices[0]))
             return distances, indices
         except Exception as e:
-            print(f"Error during FAISS search: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
\ No newline at end of file
+            logger.exception("Error during FAISS search: %s", e)
+            raise
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Convert doc_ids.pkl to the memory-mappable doc_ids.npy next to the FAISS index
+    store = FAISSVectorStore()
+    npy_path = os.path.join(store.base_dir, DOC_IDS_NPY_FILENAME)
+    save_doc_ids_npy(store.doc_ids, npy_path)
+    logger.info("Wrote %s document IDs to %s", len(store.doc_ids), npy_path)
@@ -0,0 +1,80 @@
+"""Shared fixtures: a small synthetic index on disk, built with the benchmark fakes"""
+import os
+import sys
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import (
+    build_synthetic_corpus, HashingEncoder, InMemoryCollection, AsyncInMemoryCollection, StubOpenAIClient
+)
+from rag_system.index_updater import _raw_ids, write_delta
+
+DIM = 32
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """An empty data directory that FAISSVectorStore reads from, with only the flat dense index enabled"""
+    monkeypatch.setenv("VECTOR_DB_PATH", str(tmp_path / "vector_store.index"))
+    monkeypatch.setenv("INDEX_TYPE", "flat")
+    monkeypatch.setenv("RETRIEVAL_UNIT", "passage")
+    monkeypatch.setenv("HYBRID_SEARCH", "false")
+    monkeypatch.setenv("PASSAGE_STORE", "false")
+    monkeypatch.setenv("DOC_CACHE_REVALIDATE_SECONDS", "0")
+    return str(tmp_path)
+
+@pytest.fixture
+def corpus(data_dir):
+    """50 documents of 4 passages each, with random unit vectors"""
+    return build_synthetic_corpus(data_dir, 200, passages_per_doc=4, dim=DIM)
+
+@pytest.fixture
+def publish_removal(data_dir):
+    """Publish an index delta that only removes the given document IDs"""
+    def publish(doc_ids):
+        return write_delta(data_dir, {
+            "doc_ids": _raw_ids([]),
+            "filenames": np.array([], dtype=str),
+            "doc_vectors": np.zeros((0, DIM), dtype=np.float32),
+            "passages": np.zeros((0, 3), dtype=np.int64),
+            "passage_vectors": np.zeros((0, DIM), dtype=np.float32),
+            "removed_doc_ids": _raw_ids(doc_ids),
+            "year": np.zeros(0, dtype=np.int16),
+            "study_type": np.array([], dtype=str),
+            "jurisdiction": np.array([], dtype=str),
+        })
+    return publish
+
+@pytest.fixture
+def api(data_dir, corpus, monkeypatch):
+    """The FastAPI app over the synthetic corpus, with a stub OpenAI client and a fresh session store"""
+    monkeypatch.setenv("STARTUP_MODE", "lazy")
+    monkeypatch.setenv("INDEX_RELOAD_SECONDS", "0")
+    monkeypatch.setenv("PREFETCH_ENABLED", "false")
+    monkeypatch.syspath_prepend(os.path.join(ROOT, "api"))
+    from fastapi.testclient import TestClient
+    import main
+    from rag_system.vector_store import FAISSVectorStore
+    from rag_system.retriever import Retriever
+    from rag_system.response_generator import ResponseGenerator
+    from rag_system.session_store import InMemorySessionStore
+
+    collection = InMemoryCollection(corpus)
+    retriever = Retriever(
+        FAISSVectorStore(), embedding_model=HashingEncoder(DIM), collection=collection,
+        async_collection=AsyncInMemoryCollection(collection)
+    )
+    openai_client = StubOpenAIClient(latency_ms=0, answer_tokens=3, first_token_ms=0)
+    monkeypatch.setattr(main, "rag_components", {
+        "vector_store": retriever.vector_store,
+        "openai_client": openai_client,
+        "retriever": retriever,
+        "response_generator": ResponseGenerator(openai_client),
+        "prefetcher": None,
+    })
+    monkeypatch.setattr(main, "session_store", InMemorySessionStore())
+    with TestClient(main.app) as client:
+        yield SimpleNamespace(client=client, main=main, retriever=retriever)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+import numpy as np
+from rag_system.embedding_cache import BatchingEncoder
+from rag_system.session_store import record_turn
+
+def spy_retrieval_vectors(api, monkeypatch):
+    """Record the query_embedding every live retrieval is searched with"""
+    vectors = []
+    retrieve = api.retriever.aretrieve_context
+
+    async def spy(query, **kwargs):
+        vectors.append(np.asarray(kwargs["query_embedding"]).reshape(-1))
+        return await retrieve(query, **kwargs)
+    monkeypatch.setattr(api.retriever, "aretrieve_context", spy)
+    return vectors
+
+def test_retrieval_embedding_blends_only_when_enabled(api, monkeypatch):
+    query, previous = np.array([[1.0, 0.0]], dtype=np.float32), np.array([0.0, 1.0], dtype=np.float32)
+    state = {"query_embedding": previous.tolist()}
+    assert api.main.SESSION_QUERY_CARRYOVER == 0
+    assert api.main.retrieval_embedding(query, state) is query
+
+    monkeypatch.setattr(api.main, "SESSION_QUERY_CARRYOVER", 0.5)
+    np.testing.assert_allclose(api.main.retrieval_embedding(query, state), [[2 ** -0.5, 2 ** -0.5]], rtol=1e-6)
+    assert api.main.retrieval_embedding(query, None) is query
+
+def test_session_turns_carry_over_the_previous_query(api, monkeypatch):
+    monkeypatch.setattr(api.main, "SESSION_QUERY_CARRYOVER", 0.5)
+    vectors = spy_retrieval_vectors(api, monkeypatch)
+    for query in ("employment programs", "what about juveniles?"):
+        assert api.client.post("/chat", json={"query": query, "session_id": "s"}).status_code == 200
+
+    first = api.retriever.encode_query("employment programs").reshape(-1)
+    second = api.retriever.encode_query("what about juveniles?").reshape(-1)
+    np.testing.assert_allclose(vectors[0], first, rtol=1e-5)
+    blended = second + first
+    np.testing.assert_allclose(vectors[1], blended / np.linalg.norm(blended), rtol=1e-5)
+    assert len(api.main.session_store.get("s")["history"]) == 4
+
+def test_requests_without_a_session_keep_no_state(api, monkeypatch):
+    monkeypatch.setattr(api.main, "SESSION_QUERY_CARRYOVER", 0.5)
+    vectors = spy_retrieval_vectors(api, monkeypatch)
+    for query in ("employment programs", "what about juveniles?"):
+        assert api.client.post("/chat", json={"query": query}).status_code == 200
+
+    np.testing.assert_allclose(vectors[1], api.retriever.encode_query("what about juveniles?").reshape(-1), rtol=1e-5)
+    assert api.main.session_store.stats()["sessions"] == 0
+
+def test_concurrent_turns_on_one_session_are_both_kept(api):
+    api.main.session_store.save("s", record_turn({"history": []}, "first", "answer"))
+
+    class Turn:
+        session_id = "s"
+        def __init__(self, query):
+            self.query = query
+
+    async def both():
+        # Both turns loaded the session before either saved it
+        await asyncio.gather(api.main.save_session(Turn("a"), "answer a", None),
+                             api.main.save_session(Turn("b"), "answer b", None))
+    asyncio.run(both())
+    questions = [m["content"] for m in api.main.session_store.get("s")["history"] if m["role"] == "user"]
+    assert questions[0] == "first" and sorted(questions[1:]) == ["a", "b"]
+
+def test_batch_answers_stream_as_ndjson_lines(api):
+    queries = ["employment programs", "juvenile diversion", "employment programs"]
+    response = api.client.post("/chat/batch", json={"queries": queries, "top_k": 3})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+    assert [r["query"] for r in results] == queries
+    assert all(r["answer"] and r["sources"] and "error" not in r for r in results)
+    np.testing.assert_allclose(
+        api.retriever.embedding_cache.get("juvenile diversion"),
+        api.retriever.encode_query("juvenile diversion").reshape(-1), rtol=1e-6
+    )
+
+    assert api.client.post("/chat/batch", json={"queries": []}).status_code == 400
+
+def test_batch_encodes_queue_behind_live_requests():
+    started, release, order = threading.Event(), threading.Event(), []
+
+    class BlockingModel:
+        def encode(self, texts, **kwargs):
+            order.extend(texts)
+            started.set()
+            release.wait()
+            return np.ones((len(texts), 2), dtype=np.float32)
+
+    encoder = BatchingEncoder(BlockingModel(), max_batch_size=2, max_wait_ms=0)
+    first = encoder.submit("first")
+    started.wait()
+    # Queued while the model is busy: the live request goes ahead of the earlier batch queries
+    futures = [encoder.submit(f"batch {i}", BatchingEncoder.BATCH_PRIORITY) for i in range(3)]
+    futures.append(encoder.submit("prefetch", BatchingEncoder.SPECULATIVE_PRIORITY))
+    futures.append(encoder.submit("live"))
+    release.set()
+    for future in [first] + futures:
+        future.result(timeout=5)
+    assert order == ["first", "live", "batch 0", "batch 1", "batch 2", "prefetch"]
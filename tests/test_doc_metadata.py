@@ -0,0 +1,77 @@
+import os
+import pickle
+import numpy as np
+import pytest
+from rag_system.doc_metadata import DocumentAttributes
+from rag_system.vector_store import FAISSVectorStore
+
+def annotated_doc_info(docs):
+    return [
+        {
+            "id": doc["_id"],
+            "filename": doc["filename"],
+            "year": 0 if i % 10 == 0 else 2000 + i % 20,
+            "study_type": ("rct", "observational", "unknown")[i % 3],
+            "jurisdiction": "united_states" if i % 2 == 0 else "Canada",
+        }
+        for i, doc in enumerate(docs)
+    ]
+
+FILTERS = {"year_min": 2005, "study_types": ["RCT", "meta_analysis"], "jurisdictions": ["United States"]}
+
+def expected_mask(doc_info):
+    return np.array([
+        info["year"] >= 2005 and info["study_type"] == "rct" and info["jurisdiction"] == "united_states"
+        for info in doc_info
+    ])
+
+def test_mask_combines_filters(corpus):
+    doc_info = annotated_doc_info(corpus)
+    attributes = DocumentAttributes.from_doc_info([doc["_id"] for doc in corpus], doc_info)
+    np.testing.assert_array_equal(attributes.mask(FILTERS), expected_mask(doc_info))
+    assert attributes.mask({}) is None
+
+    # Documents of unknown year never satisfy a year bound
+    assert not attributes.mask({"year_max": 2100})[0]
+
+def test_missing_fields_reports_metadata_no_document_has(corpus):
+    doc_ids = [doc["_id"] for doc in corpus]
+    bare = [{"id": doc["_id"], "filename": doc["filename"]} for doc in corpus]
+    assert DocumentAttributes.from_doc_info(doc_ids, bare).missing_fields(FILTERS) == ["year", "study_type", "jurisdiction"]
+    assert DocumentAttributes.from_doc_info(doc_ids, bare).missing_fields({"year_min": None, "study_types": []}) == []
+    assert DocumentAttributes.from_doc_info(doc_ids, annotated_doc_info(corpus)).missing_fields(FILTERS) == []
+
+@pytest.mark.parametrize("exact_max_rows", [0, 4096], ids=["bitmap_selector", "exact"])
+def test_filtered_search_returns_only_matching_rows(data_dir, corpus, publish_removal, exact_max_rows):
+    doc_info = annotated_doc_info(corpus)
+    with open(os.path.join(data_dir, "doc_info.pkl"), "wb") as f:
+        pickle.dump(doc_info, f)
+    allowed_docs = set(np.flatnonzero(expected_mask(doc_info)))
+    removed = min(allowed_docs)
+    publish_removal([corpus[removed]["_id"]])
+    allowed_docs.discard(removed)
+
+    store = FAISSVectorStore()
+    store.filter_exact_max_rows = exact_max_rows
+    row_filter = store.row_filter(FILTERS, passages=True)
+    passages = np.asarray(store.passages)
+    allowed_rows = np.flatnonzero(np.isin(passages[:, 0], list(allowed_docs)))
+    np.testing.assert_array_equal(row_filter.rows, allowed_rows)
+
+    query = np.random.default_rng(1).standard_normal((1, store.passage_index.d)).astype(np.float32)
+    top_k = min(10, len(allowed_rows))
+    _, indices = store.search_passages(query, top_k=top_k, row_filter=row_filter)
+
+    vectors = store.passage_index.reconstruct_n(0, store.passage_index.ntotal)
+    scores = (query @ vectors[allowed_rows].T).reshape(-1)
+    np.testing.assert_array_equal(indices[0], allowed_rows[np.argsort(-scores)[:top_k]])
+
+def test_more_categories_than_fit_in_a_byte_keep_distinct_codes():
+    doc_ids = [f"{i:024x}" for i in range(300)]
+    doc_info = [{"id": doc_id, "jurisdiction": f"court_{i}"} for i, doc_id in enumerate(doc_ids)]
+    attributes = DocumentAttributes.from_doc_info(doc_ids, doc_info)
+
+    assert attributes.categories["jurisdiction"].dtype == np.uint16
+    assert attributes.categories["study_type"].dtype == np.uint8
+    mask = attributes.mask({"jurisdictions": ["court_299"]})
+    assert mask.sum() == 1 and mask[299]
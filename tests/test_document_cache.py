@@ -0,0 +1,56 @@
+from benchmarks.fakes import InMemoryCollection
+from rag_system.document_cache import DocumentCache
+
+def make_docs(n, size=100):
+    return [{"_id": i, "filename": "", "content": "x" * size, "updated_at": 1} for i in range(n)]
+
+def test_cache_stays_within_its_byte_bound_evicting_least_recently_used():
+    collection = InMemoryCollection(make_docs(5))
+    cache = DocumentCache(collection, max_bytes=300)
+
+    cache.get_many([0, 1, 2])
+    cache.get_many([0])          # 1 is now the least recently used
+    cache.get_many([3])
+    assert cache.stats()["bytes"] == 300
+    assert list(cache._entries) == [2, 0, 3]
+
+    # A document larger than the whole cache is returned but never cached
+    collection.docs[4]["content"] = "x" * 1000
+    assert cache.get_many([4])[4]["content"] == "x" * 1000
+    assert 4 not in cache._entries and cache.stats()["bytes"] == 300
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 5)
+
+def test_documents_without_content_or_filename_are_cached():
+    cache = DocumentCache(InMemoryCollection([{"_id": 1, "filename": None, "content": None}]))
+    assert cache.get_many([1]) == {1: {"_id": 1, "filename": None, "content": None}}
+    assert cache.stats()["bytes"] == 0
+
+def test_revalidation_drops_deleted_documents_and_refreshes_edited_ones():
+    collection = InMemoryCollection(make_docs(3))
+    cache = DocumentCache(collection, version_field="updated_at")
+    cache.get_many([0, 1, 2])
+
+    del collection.docs[0]
+    collection.docs[1] = {**collection.docs[1], "content": "edited", "updated_at": 2}
+    collection.docs[2] = {**collection.docs[2], "content": "edited quietly"}
+    cache.revalidate()
+
+    assert 0 not in cache._entries
+    assert cache._entries[1][0]["content"] == "edited"
+    # Edits that leave the version field alone go unnoticed
+    assert cache._entries[2][0]["content"] == "x" * 100
+    assert cache.stats()["bytes"] == len("edited") + 100
+
+def test_without_a_version_field_revalidation_only_detects_deletions():
+    collection = InMemoryCollection(make_docs(2))
+    cache = DocumentCache(collection)
+    cache.get_many([0, 1])
+
+    del collection.docs[0]
+    collection.docs[1] = {**collection.docs[1], "content": "edited", "updated_at": 2}
+    cache.revalidate()
+
+    assert list(cache._entries) == [1]
+    assert cache._entries[1][0]["content"] == "x" * 100
@@ -0,0 +1,83 @@
+import os
+import faiss
+import numpy as np
+import pytest
+from benchmarks.fakes import InMemoryCollection
+from rag_system.index_builder import build_variant
+from rag_system import index_updater
+from rag_system.index_updater import compact
+from rag_system.vector_store import (
+    FAISSVectorStore, PASSAGE_INDEX_FILENAME, index_variant_path, load_tuned_index, read_manifest
+)
+
+def test_compaction_rebuilds_variants_to_the_new_rows(data_dir, corpus, publish_removal):
+    passage_path = os.path.join(data_dir, PASSAGE_INDEX_FILENAME)
+    build_variant(passage_path, "hnsw")
+    build_variant(os.environ["VECTOR_DB_PATH"], "ivf_flat", nlist=4)
+    publish_removal([corpus[3]["_id"]])
+
+    compact(data_dir, InMemoryCollection(corpus))
+
+    for index_type, variant in (("hnsw", faiss.IndexHNSWFlat), ("ivf_flat", faiss.IndexIVFFlat)):
+        store = FAISSVectorStore(index_type=index_type)
+        assert len(store.doc_ids) == len(corpus) - 1
+        assert corpus[3]["_id"] not in list(store.doc_ids)
+        assert store.index.ntotal == len(store.doc_ids)
+        assert store.passage_index.ntotal == len(store.passages)
+        assert isinstance(store.passage_index if index_type == "hnsw" else store.index, variant)
+
+    # A variant row must be the flat row it replaced, not the one compaction shifted into its place
+    store = FAISSVectorStore(index_type="hnsw")
+    flat = faiss.read_index(os.path.join(store.base_dir, PASSAGE_INDEX_FILENAME))
+    row = len(store.passages) - 1
+    np.testing.assert_allclose(store.passage_index.reconstruct(row), flat.reconstruct(row), rtol=1e-5)
+
+def test_compaction_switches_over_through_the_manifest(data_dir, corpus, publish_removal):
+    def snapshot():
+        return {name: os.path.getmtime(os.path.join(data_dir, name))
+                for name in os.listdir(data_dir) if os.path.isfile(os.path.join(data_dir, name))}
+    publish_removal([corpus[3]["_id"]])
+    before = snapshot()
+
+    compact(data_dir, InMemoryCollection(corpus))
+    first = read_manifest(data_dir)
+    assert first["deltas"] == []
+    # Only the manifest changed in place; a store loading the old manifest still finds its base and deltas
+    assert {name: mtime for name, mtime in snapshot().items() if before.get(name) != mtime}.keys() == {"index_manifest.json"}
+    store = FAISSVectorStore(index_type="flat")
+    assert store.base_dir == os.path.join(data_dir, first["base"])
+    assert len(store.doc_ids) == len(corpus) - 1 and corpus[3]["_id"] not in list(store.doc_ids)
+
+    # Deltas written on top of a compacted base apply to it, and the next compaction drops the base before last
+    publish_removal([corpus[5]["_id"]])
+    compact(data_dir, InMemoryCollection(corpus))
+    publish_removal([corpus[7]["_id"]])
+    compact(data_dir, InMemoryCollection(corpus))
+    store = FAISSVectorStore(index_type="flat")
+    assert len(store.doc_ids) == len(corpus) - 3
+    assert not os.path.exists(os.path.join(data_dir, first["base"]))
+
+def test_compaction_gives_way_to_a_delta_published_meanwhile(data_dir, corpus, publish_removal, monkeypatch):
+    rebuild_variants = index_updater.rebuild_variants
+    def publish_during_rebuild(*args):
+        monkeypatch.setattr(index_updater, "rebuild_variants", rebuild_variants)
+        publish_removal([corpus[5]["_id"]])
+        return rebuild_variants(*args)
+    monkeypatch.setattr(index_updater, "rebuild_variants", publish_during_rebuild)
+    publish_removal([corpus[3]["_id"]])
+
+    with pytest.raises(RuntimeError, match="run the compaction again"):
+        compact(data_dir, InMemoryCollection(corpus))
+    manifest = read_manifest(data_dir)
+    assert len(manifest["deltas"]) == 2 and "base" not in manifest
+    assert not any(name.startswith(index_updater.BASE_DIRNAME_PREFIX) for name in os.listdir(data_dir))
+    assert len(FAISSVectorStore(index_type="flat").removed_docs) == 2
+
+def test_variant_with_a_different_row_count_falls_back_to_flat(data_dir, corpus):
+    passage_path = os.path.join(data_dir, PASSAGE_INDEX_FILENAME)
+    build_variant(passage_path, "hnsw")
+    assert os.path.exists(index_variant_path(passage_path, "hnsw"))
+
+    rows = faiss.read_index(passage_path).ntotal
+    assert isinstance(load_tuned_index(passage_path, "hnsw", rows=rows), faiss.IndexHNSWFlat)
+    assert isinstance(load_tuned_index(passage_path, "hnsw", rows=rows - 1), faiss.IndexFlatIP)
@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import openai
+from rag_system import openai_client
+from rag_system.openai_client import AsyncOpenAIClient, TokenBucket, retry_delay
+
+def rate_limit_error(headers=None):
+    response = httpx.Response(429, headers=headers or {}, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+def test_retry_delay_follows_retry_after_and_falls_back_to_capped_jitter():
+    assert retry_delay(rate_limit_error({"retry-after": "3"}), attempt=0) == 3.0
+    assert retry_delay(rate_limit_error({"retry-after": "120"}), attempt=0, max_seconds=30.0) == 30.0
+    for attempt in range(6):
+        assert 0 <= retry_delay(rate_limit_error(), attempt, base_seconds=0.5, max_seconds=4.0) <= min(4.0, 0.5 * 2 ** attempt)
+    assert 0 <= retry_delay(rate_limit_error({"retry-after": "soon"}), attempt=1, base_seconds=0.5) <= 1.0
+    assert 0 <= retry_delay(openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com")), attempt=0) <= 0.5
+
+def test_token_bucket_bursts_a_minute_then_queues_reservations_in_order(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(openai_client.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(per_minute=60)
+
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(30) == 30.0
+    assert bucket.reserve(30) == 60.0
+    now[0] += 30.0
+    assert bucket.reserve(1) == 31.0
+    # More than a minute's budget is charged as one full minute
+    assert TokenBucket(per_minute=60).reserve(1000) == 0.0
+    assert TokenBucket(per_minute=0).reserve(1000) == 0.0
+
+class FakeStream:
+    def __init__(self, chunks, release):
+        self.chunks = chunks
+        self.release = release
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for text in self.chunks:
+            await self.release.wait()
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+    async def close(self):
+        self.closed = True
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.streams = []
+
+    async def create(self, messages, stream=False, **kwargs):
+        self.calls.append(messages[-1]["content"])
+        if stream:
+            self.streams.append(FakeStream(["a", "b"], self.release))
+            return self.streams[-1]
+        await self.release.wait()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"answer to {messages[-1]['content']}"))])
+
+def fake_client(monkeypatch, max_in_flight=16):
+    monkeypatch.setenv("OPENAI_MAX_IN_FLIGHT", str(max_in_flight))
+    client = AsyncOpenAIClient(api_key="test")
+    completions = FakeCompletions()
+    client.async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return client, completions
+
+def test_identical_prompts_in_flight_share_one_request(monkeypatch):
+    async def scenario():
+        client, completions = fake_client(monkeypatch)
+        callers = [asyncio.ensure_future(client.agenerate_completion(prompt)) for prompt in ("q1", "q1", "q2", "q1")]
+        await asyncio.sleep(0.01)
+        # A caller that goes away does not cancel the shared request for the others
+        callers[0].cancel()
+        completions.release.set()
+        answers = await asyncio.gather(*callers[1:])
+        assert answers == ["answer to q1", "answer to q2", "answer to q1"]
+        assert sorted(completions.calls) == ["q1", "q2"]
+        assert client._in_flight == {}
+
+        # Once finished, the same prompt is requested again
+        await client.agenerate_completion("q1")
+        assert sorted(completions.calls) == ["q1", "q1", "q2"]
+    asyncio.run(scenario())
+
+def test_a_stream_holds_its_slot_until_it_is_read(monkeypatch):
+    async def scenario():
+        client, completions = fake_client(monkeypatch, max_in_flight=1)
+        stream = client.astream_completion("streamed")
+        completions.release.set()
+        assert await stream.__anext__() == "a"
+
+        completions.release.clear()
+        other = asyncio.ensure_future(client.agenerate_completion("other"))
+        await asyncio.sleep(0.01)
+        assert completions.calls == ["streamed"]
+
+        completions.release.set()
+        assert [text async for text in stream] == ["b"]
+        assert await other == "answer to other"
+        assert completions.streams[0].closed
+
+        # An abandoned stream gives its slot back too
+        stream = client.astream_completion("abandoned")
+        await stream.__anext__()
+        await stream.aclose()
+        assert not client.async_slots.locked()
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import asyncio
+from rag_system.prefetch import PrefetchScheduler
+
+def test_jobs_wait_until_no_live_request_has_been_in_flight_for_idle_ms():
+    async def scenario():
+        scheduler = PrefetchScheduler(idle_ms=30)
+        ran = []
+
+        async def job():
+            ran.append(asyncio.get_running_loop().time())
+
+        with scheduler.live():
+            scheduler.submit("a", 0, job)
+            await asyncio.sleep(0.1)
+            assert ran == []
+            released = asyncio.get_running_loop().time()
+        await asyncio.sleep(0.1)
+        assert len(ran) == 1
+        assert ran[0] - released >= 0.03
+
+    asyncio.run(scenario())
+
+def test_jobs_run_one_at_a_time_in_priority_order():
+    async def scenario():
+        scheduler = PrefetchScheduler(idle_ms=1)
+        ran = []
+
+        def job(name):
+            async def run():
+                ran.append(name)
+            return run
+
+        with scheduler.live():
+            scheduler.submit("low", 2, job("low"))
+            scheduler.submit("high", 0, job("high"))
+            scheduler.submit("mid", 1, job("mid"))
+        await asyncio.sleep(0.1)
+        assert ran == ["high", "mid", "low"]
+
+    asyncio.run(scenario())
+
+def test_full_queue_drops_the_lowest_priority_newest_job():
+    async def scenario():
+        scheduler = PrefetchScheduler(max_pending=2, idle_ms=1)
+        ran = []
+
+        def job(name):
+            async def run():
+                ran.append(name)
+            return run
+
+        with scheduler.live():
+            assert scheduler.submit("a", 1, job("a"))
+            assert not scheduler.submit("a", 0, job("a again"))  # same key already pending
+            assert scheduler.submit("b", 1, job("b"))
+            assert not scheduler.submit("c", 1, job("c"))  # full, and no pending job ranks lower
+            assert scheduler.submit("d", 0, job("d"))  # evicts "b", the newest of the lowest priority
+            assert scheduler.stats()["pending"] == 2
+        await asyncio.sleep(0.1)
+        assert ran == ["d", "a"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,26 @@
+from rag_system.prompt_budget import dedupe_context
+
+TEXT = "".join(f"{i:04d} " for i in range(1000))  # 5000 characters, every position distinct
+
+def span(document_id, start, end):
+    return {"document_id": document_id, "start": start, "end": end, "content": TEXT[start:end]}
+
+def test_containing_span_keeps_only_its_uncovered_parts():
+    kept = dedupe_context([span("a", 1000, 1500), span("a", 500, 2500)])
+    assert [text for _, _, text in kept] == [TEXT[1000:1500], TEXT[500:1000] + " [...] " + TEXT[1500:2500]]
+
+def test_overlaps_are_trimmed_on_either_side_and_covered_spans_dropped():
+    items = [span("a", 1000, 2000), span("a", 1500, 2500), span("a", 500, 1200), span("a", 600, 2400)]
+    kept = dedupe_context(items)
+    assert [(idx, text) for idx, _, text in kept] == [
+        (0, TEXT[1000:2000]), (1, TEXT[2000:2500]), (2, TEXT[500:1000])
+    ]
+
+def test_spans_of_different_documents_are_independent():
+    kept = dedupe_context([span("a", 0, 500), span("b", 0, 500)])
+    assert [idx for idx, _, _ in kept] == [0, 1]
+
+def test_items_without_spans_drop_repeated_text():
+    items = [{"document_id": "a", "content": "the whole abstract"}, {"document_id": "b", "content": "whole abstract"},
+             {"document_id": "c", "content": "something else"}]
+    assert [idx for idx, _, _ in dedupe_context(items)] == [0, 2]
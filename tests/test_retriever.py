@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from benchmarks.fakes import HashingEncoder, InMemoryCollection, AsyncInMemoryCollection
+from rag_system.lexical_index import build_lexical_index, lexical_index_dir
+from rag_system.retriever import Retriever, DOCUMENT_DEPTH_FACTOR
+from rag_system.vector_store import FAISSVectorStore
+from conftest import DIM
+
+ADAPTIVE = SimpleNamespace(adaptive_relative_threshold=0.85, adaptive_score_gap=0.08, adaptive_min_depth=2)
+
+@pytest.mark.parametrize("scores, cutoff", [
+    ([0.9, 0.85, 0.8, 0.7, 0.5], 0.8),   # 0.7 is below 0.85 * 0.9
+    ([0.9, 0.88, 0.78, 0.77], 0.88),     # 0.88 -> 0.78 is a gap of more than 0.08
+    ([0.9, 0.3, 0.2], 0.3),              # ADAPTIVE_MIN_DEPTH keeps two
+    ([0.5, 0.49, 0.48], 0.48),           # nothing to cut
+], ids=["relative", "gap", "min_depth", "flat"])
+def test_adaptive_cutoff(scores, cutoff):
+    indices = np.arange(len(scores))
+    assert Retriever._adaptive_cutoff(ADAPTIVE, indices, np.array(scores), 10) == pytest.approx(cutoff)
+
+def test_adaptive_cutoff_ignores_padding():
+    indices, distances = np.array([3, -1, -1]), np.array([0.5, -np.inf, -np.inf])
+    assert Retriever._adaptive_cutoff(ADAPTIVE, indices, distances, 10) == 0.5
+    assert Retriever._adaptive_cutoff(ADAPTIVE, np.array([-1, -1]), distances[1:], 10) == -np.inf
+
+def test_adaptive_depth_applies_the_dense_cut_to_fused_rows(data_dir, corpus, monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_UNIT", "document")
+    monkeypatch.setenv("HYBRID_SEARCH", "true")
+    encoder = HashingEncoder(DIM)
+    query_vector = encoder.encode(["zanzibar"], normalize_embeddings=True)
+
+    # The only lexical hit is the document least similar to the query, so RRF ranks it near the top
+    # although the dense ranking would never reach it
+    store = FAISSVectorStore()
+    worst = int(np.argmin(store.index.reconstruct_n(0, store.index.ntotal) @ query_vector[0]))
+    corpus[worst]["content"] += " zanzibar"
+    build_lexical_index([doc["content"] for doc in corpus], lexical_index_dir(data_dir, "documents"), "documents")
+    store = FAISSVectorStore()
+
+    fixed = Retriever(store, embedding_model=encoder, collection=InMemoryCollection(corpus))
+    assert worst in [c["doc_idx"] for c in fixed._search_candidates(query_vector, 5, "zanzibar")]
+
+    monkeypatch.setenv("RETRIEVAL_DEPTH", "adaptive")
+    adaptive = Retriever(store, embedding_model=encoder, collection=InMemoryCollection(corpus))
+    candidates = adaptive._search_candidates(query_vector, 5, "zanzibar")
+    distances, indices = store.search(query_vector, 10)
+    cutoff = adaptive._adaptive_cutoff(indices[0], distances[0], 10)
+    assert candidates
+    assert worst not in [c["doc_idx"] for c in candidates]
+    assert all(c["score"] >= cutoff for c in candidates)
+    # Every row the dense cut kept is still a candidate
+    assert {int(i) for i, d in zip(indices[0], distances[0]) if d >= cutoff} <= {c["doc_idx"] for c in candidates}
+
+@pytest.mark.parametrize("unit, max_depth", [("passage", 5), ("document", 5 * DOCUMENT_DEPTH_FACTOR)])
+def test_adaptive_depth_without_a_cut_goes_as_deep_as_fixed_depth(data_dir, corpus, monkeypatch, unit, max_depth):
+    monkeypatch.setenv("RETRIEVAL_UNIT", unit)
+    monkeypatch.setenv("MAX_PASSAGES_PER_DOC", "10")
+    encoder = HashingEncoder(DIM)
+    query_vector = encoder.encode(["recidivism"], normalize_embeddings=True)
+    store = FAISSVectorStore()
+    fixed = Retriever(store, embedding_model=encoder, collection=InMemoryCollection(corpus))
+
+    monkeypatch.setenv("RETRIEVAL_DEPTH", "adaptive")
+    monkeypatch.setenv("ADAPTIVE_RELATIVE_THRESHOLD", "0")
+    monkeypatch.setenv("ADAPTIVE_SCORE_GAP", "10")
+    adaptive = Retriever(store, embedding_model=encoder, collection=InMemoryCollection(corpus))
+
+    assert len(fixed._search_candidates(query_vector, 5, "recidivism")) == max_depth
+    assert len(adaptive._search_candidates(query_vector, 5, "recidivism")) == max_depth
+
+def test_batch_retrieval_matches_single_queries_with_adaptive_depth(data_dir, corpus, monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_DEPTH", "adaptive")
+    monkeypatch.setenv("ADAPTIVE_CONTEXT_TOKENS", "200")
+    encoder = HashingEncoder(DIM)
+    collection = InMemoryCollection(corpus)
+    retriever = Retriever(
+        FAISSVectorStore(), embedding_model=encoder,
+        collection=collection, async_collection=AsyncInMemoryCollection(collection)
+    )
+    queries = ["recidivism parole", "juvenile cognitive rehabilitation", "substance services"]
+    embeddings = encoder.encode(queries, normalize_embeddings=True)
+
+    async def scenario():
+        single = [await retriever.aretrieve_context(q, 5, query_embedding=embeddings[i:i+1]) for i, q in enumerate(queries)]
+        batch = await retriever.aretrieve_context_batch(queries, 5, query_embeddings=embeddings)
+        return single, batch
+    single, batch = asyncio.run(scenario())
+    assert all(single)
+    assert batch == single
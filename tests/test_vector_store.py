@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from benchmarks.fakes import HashingEncoder, InMemoryCollection
+from rag_system.index_builder import build_variant
+from rag_system.lexical_index import build_lexical_index, lexical_index_dir
+from rag_system.retriever import Retriever
+from rag_system.vector_store import FAISSVectorStore
+from conftest import DIM
+
+def test_removed_passages_are_excluded_from_search(data_dir, corpus, publish_removal):
+    publish_removal([corpus[5]["_id"]])
+    store = FAISSVectorStore()
+    removed_rows = set(np.flatnonzero(np.asarray(store.passages)[:, 0] == 5))
+    assert store.removed_docs == {5}
+    assert store.removed_passages == removed_rows
+
+    query = store.passage_index.reconstruct(int(min(removed_rows))).reshape(1, -1)
+    _, indices = store.search_passages(query, top_k=10)
+    assert not set(indices[0]) & removed_rows
+    assert (indices[0] >= 0).all()
+
+def test_ivf_deletions_are_recorded_as_removed(data_dir, corpus, publish_removal, monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_UNIT", "document")
+    build_variant(os.environ["VECTOR_DB_PATH"], "ivf_flat", nlist=4)
+    query = FAISSVectorStore().index.reconstruct(7).reshape(1, -1)
+    publish_removal([corpus[7]["_id"]])
+
+    store = FAISSVectorStore(index_type="ivf_flat")
+    assert store.removed_docs == {7}
+    _, indices = store.search(query, top_k=5)
+    assert 7 not in indices[0]
+
+def test_fusion_drops_removed_lexical_hits_and_keeps_dense_scores(data_dir, corpus, publish_removal, monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_UNIT", "document")
+    monkeypatch.setenv("HYBRID_SEARCH", "true")
+    corpus[7]["content"] += " zanzibar zanzibar zanzibar"
+    corpus[8]["content"] += " zanzibar"
+    build_variant(os.environ["VECTOR_DB_PATH"], "ivf_flat", nlist=4)
+    build_lexical_index([doc["content"] for doc in corpus], lexical_index_dir(data_dir, "documents"), "documents")
+    publish_removal([corpus[7]["_id"]])
+
+    store = FAISSVectorStore(index_type="ivf_flat")
+    assert 7 in [row for row, _ in store.lexical_index.search("zanzibar", 3)]
+    retriever = Retriever(store, embedding_model=HashingEncoder(DIM), collection=InMemoryCollection(corpus))
+    query_vector = retriever.encode_query("zanzibar")
+    candidates = retriever._search_candidates(query_vector, 5, "zanzibar")
+
+    rows = [candidate["doc_idx"] for candidate in candidates]
+    assert 7 not in rows
+    assert 8 in rows
+    # Scores are dense similarities, including for rows only the lexical index found
+    np.testing.assert_allclose([candidate["score"] for candidate in candidates],
+                               store.score_rows(query_vector, rows), rtol=1e-5)